@@ -1,21 +1,162 @@
-from .lexer import lex
-from .parser import Parser
-from .runtime import run
+import os
+import sys
 
-def run_file(filename):
+from . import cache, modules, optimizer, output, tiering
+from .program import ENGINES, Program, parse_file
+
+# Characters read at a time from a file in streaming mode.
+STREAM_CHUNK_SIZE = 1 << 16
+
+def run_file(filename, engine='tree'):
+    Program.from_file(filename, engine).run()
+
+def read_chunks(filename):
+    if filename == '-':
+        # line by line, so each statement can run as soon as it is typed
+        yield from iter(sys.stdin.readline, '')
+        return
     with open(filename, 'r', encoding='utf-8') as f:
-        code = f.read()
-    tokens = lex(code)
-    parser = Parser(tokens)
-    stmts = parser.parse()
-    run(stmts)
+        yield from iter(lambda: f.read(STREAM_CHUNK_SIZE), '')
+
+def stream_file(filename, engine='tree'):
+    """Run ``filename`` ('-' for stdin) while it is being read and parsed."""
+    from .parser import parse_stream
+    stmts = parse_stream(read_chunks(filename))
+    if optimizer.enabled:
+        stmts = optimizer.optimize_stream(stmts)
+    if engine == 'closure':
+        from .compiler import run_stream
+    elif engine == 'vm':
+        from .vm import run_stream
+    elif engine == 'tree':
+        from .runtime import run_stream
+    else:
+        raise ValueError(f"Unknown engine '{engine}'")
+    run_stream(stmts)
+
+def profile_file(filename, stream=False, stacks_path=None):
+    from .profiler import Profiler
+    profiler = Profiler('<stdin>' if filename == '-' else filename)
+    try:
+        with profiler:
+            if stream:
+                stream_file(filename)
+            else:
+                run_file(filename)
+    finally:
+        if stacks_path is None:
+            name = 'velion' if filename == '-' else os.path.splitext(os.path.basename(filename))[0]
+            stacks_path = f'{name}.folded'
+        profiler.write_stacks(stacks_path)
+        print(profiler.report(), file=sys.stderr)
+        print(f'collapsed stacks written to {stacks_path}', file=sys.stderr)
+
+def disassemble_file(filename):
+    from .bytecode import compile_program, disassemble
+    print(disassemble(compile_program(parse_file(filename))))
 
 def main():
-    import sys
-    if len(sys.argv) < 2:
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog='velion', usage='velion [options] <file.vl>')
+    arg_parser.add_argument('file', nargs='?')
+    arg_parser.add_argument('--engine', choices=ENGINES, default='tree',
+                            help='execution engine (default: tree)')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help='always re-parse instead of using __vlcache__/*.vlc files')
+    arg_parser.add_argument('--reload-modules', action='store_true',
+                            help="re-parse files loaded with 'get' when they change on disk")
+    arg_parser.add_argument('--no-optimize', action='store_true',
+                            help='run the program as parsed, without constant folding '
+                                 'and loop-invariant hoisting')
+    arg_parser.add_argument('--tier-threshold', type=int, metavar='N',
+                            help='tree engine: compile a function to Python code once it '
+                                 'has been called N times')
+    arg_parser.add_argument('--tier-report', action='store_true',
+                            help='print which functions were compiled by --tier-threshold')
+    arg_parser.add_argument('--profile', action='store_true',
+                            help='tree engine: print time per function and the statements '
+                                 'run most often to stderr, and write collapsed stacks')
+    arg_parser.add_argument('--profile-stacks', metavar='PATH',
+                            help='where --profile writes collapsed stacks for flame graph '
+                                 'tools (default: <file>.folded)')
+    arg_parser.add_argument('--output-buffering', choices=tuple(output.POLICIES),
+                            help="when 'say' output is written: every line, in 64 KiB "
+                                 "blocks, or only when needed (default: line on a "
+                                 "terminal, block otherwise)")
+    arg_parser.add_argument('--disassemble', action='store_true',
+                            help='print the bytecode for the program instead of running it')
+    arg_parser.add_argument('--async', dest='use_async', action='store_true',
+                            help="tree engine: run on asyncio, where 'spawn' starts tasks "
+                                 "and 'wait' and 'input' only suspend the running one")
+    arg_parser.add_argument('--batch', metavar='DIR',
+                            help='run every .vl file under DIR on a pool of worker processes')
+    arg_parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help='worker processes for --batch (default: one per CPU)')
+    arg_parser.add_argument('--serve', action='store_true',
+                            help='keep running and run the scripts sent with '
+                                 'python -m velion.client, without starting up for each')
+    arg_parser.add_argument('--socket', metavar='PATH',
+                            help='Unix socket for --serve (default: $VELION_SOCKET or '
+                                 '$XDG_RUNTIME_DIR/velion-<uid>.sock)')
+    arg_parser.add_argument('--latency', action='store_true',
+                            help='--serve: print the time taken by each request to stderr')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="run each top-level statement as soon as it is parsed "
+                                 "(always on when the file is '-', for stdin)")
+    args = arg_parser.parse_args()
+    if args.file is None and args.batch is None and not args.serve:
         print("Usage: velion <file.vl>")
         return
-    run_file(sys.argv[1])
+    if args.no_cache:
+        cache.enabled = False
+    if args.no_optimize:
+        optimizer.enabled = False
+    if args.reload_modules:
+        modules.registry.check_mtime = True
+    if args.tier_threshold is not None:
+        tiering.threshold = args.tier_threshold
+    if args.output_buffering is not None:
+        output.set_policy(args.output_buffering)
+    if args.serve:
+        if args.file is not None or args.batch is not None:
+            arg_parser.error('--serve runs the scripts clients send, not a file or --batch')
+        if args.output_buffering is None and 'VELION_OUTPUT_BUFFERING' not in os.environ:
+            # output goes to a socket, not a terminal
+            output.set_policy('block')
+        from . import server
+        server.serve(args.socket, args.engine, args.latency)
+        return
+    if args.batch is not None:
+        if args.file is not None:
+            arg_parser.error('--batch takes a directory instead of a file')
+        if args.jobs is not None and args.jobs < 1:
+            arg_parser.error('-j needs at least one worker')
+        from . import batch
+        sys.exit(batch.main(args.batch, args.jobs, args.engine))
+    if args.disassemble:
+        disassemble_file(args.file)
+        return
+    if args.use_async:
+        if args.engine != 'tree':
+            arg_parser.error('--async needs the tree engine')
+        if args.profile or args.stream or args.file == '-':
+            arg_parser.error('--async runs a whole file, without --profile or --stream')
+        from . import tasks
+        tasks.run(parse_file(args.file))
+        return
+    if args.profile:
+        if args.engine != 'tree':
+            arg_parser.error('--profile needs the tree engine')
+        profile_file(args.file, args.stream or args.file == '-', args.profile_stacks)
+        return
+    try:
+        if args.stream or args.file == '-':
+            stream_file(args.file, engine=args.engine)
+        else:
+            run_file(args.file, engine=args.engine)
+    finally:
+        if args.tier_report:
+            print(tiering.format_report(), file=sys.stderr)
 
 if __name__ == "__main__":
     main()
@@ -1,82 +1,148 @@
-class ForEachDict:
+import re
+
+PLACEHOLDER_RE = re.compile(r'\{([a-zA-Z_][a-zA-Z0-9_]*)\}')
+
+class Node:
+    """Base of the AST classes, which keep their fields in slots.
+
+    Any node can also hold ``line``, the line a parsed statement starts on,
+    and ``_calls``, cached by ``runtime.makes_calls``. Slots whose names
+    start with '_' hold what the runtime caches on nodes.
+    """
+    __slots__ = ('line', '_calls')
+
+class ForEachDict(Node):
+    __slots__ = ('key', 'value', 'iterable', 'body')
+
     def __init__(self, key, value, iterable, body):
         self.key = key
         self.value = value
         self.iterable = iterable
         self.body = body
-class AssignOp:
+class AssignOp(Node):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
-class StringInterpolation:
-    def __init__(self, template):
+class StringInterpolation(Node):
+    __slots__ = ('template', 'parts')
+
+    def __init__(self, template, parts=None):
         self.template = template
-class Lambda:
+        # Split once, when the node is built: literal text and variable
+        # names alternate, starting and ending with text.
+        self.parts = parts if parts is not None else tuple(PLACEHOLDER_RE.split(template))
+class Lambda(Node):
+    __slots__ = ('params', 'body')
+
     def __init__(self, params, body):
         self.params = params
         self.body = body
 
-class Doc:
+class Doc(Node):
+    __slots__ = ('text', 'stmt')
+
     def __init__(self, text, stmt):
         self.text = text
         self.stmt = stmt
-class TryCatch:
+class TryCatch(Node):
+    __slots__ = ('try_body', 'catch_body')
+
     def __init__(self, try_body, catch_body):
         self.try_body = try_body
         self.catch_body = catch_body
-class Import:
+class Import(Node):
+    __slots__ = ('filename',)
+
     def __init__(self, filename):
         self.filename = filename
-class DictLiteral:
+class DictLiteral(Node):
+    __slots__ = ('pairs',)
+
     def __init__(self, pairs):
         self.pairs = pairs
 
-class Input:
+class Input(Node):
+    __slots__ = ('prompt',)
+
     def __init__(self, prompt):
         self.prompt = prompt
 
-class Literal:
+class Literal(Node):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
-class ListLiteral:
+class ListLiteral(Node):
+    __slots__ = ('elements',)
+
     def __init__(self, elements):
         self.elements = elements
 
-class Var:
+class Var(Node):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
-class BinOp:
+class BinOp(Node):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
 
-class Print:
+class Print(Node):
+    __slots__ = ('exprs', 'sep')
+
     def __init__(self, exprs, sep=None):
         self.exprs = exprs
         self.sep = sep
 
-class Assign:
+class Assign(Node):
+    __slots__ = ('name', 'expr')
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
 
-class If:
+class If(Node):
+    __slots__ = ('cond', 'body', 'else_body')
+
     def __init__(self, cond, body, else_body=None):
         self.cond = cond
         self.body = body
         self.else_body = else_body
 
-class ForEach:
-    def __init__(self, var, iterable, body):
+class ForEach(Node):
+    __slots__ = ('var', 'iterable', 'body', 'hoisted')
+
+    def __init__(self, var, iterable, body, hoisted=()):
         self.var = var
         self.iterable = iterable
         self.body = body
+        # names of the Hoisted expressions in body, cleared when the loop starts
+        self.hoisted = hoisted
+
+class Hoisted(Node):
+    """Loop-invariant expression, evaluated once per run of its loop.
+
+    The value is kept in the enclosing scope under ``name``, which cannot
+    clash with Velion identifiers.
+    """
+    __slots__ = ('name', 'expr')
+
+    def __init__(self, name, expr):
+        self.name = name
+        self.expr = expr
+
+class FuncDef(Node):
+    __slots__ = ('name', 'params', 'body', 'defaults', 'variadic', '_plan')
 
-class FuncDef:
     def __init__(self, name, params, body, defaults=None, variadic=None):
         self.name = name
         self.params = params
@@ -84,7 +150,32 @@ class FuncDef:
         self.defaults = defaults or {}
         self.variadic = variadic
 
-class Call:
+class Call(Node):
+    __slots__ = ('callee', 'args', '_site')
+
     def __init__(self, callee, args):
         self.callee = callee
         self.args = args
+
+class Spawn(Node):
+    __slots__ = ('call',)
+
+    def __init__(self, call):
+        self.call = call
+
+class Return(Node):
+    __slots__ = ('expr',)
+
+    def __init__(self, expr):
+        self.expr = expr
+
+def line_of(stmt):
+    """Line ``stmt`` starts on in its source, or None if it was not parsed."""
+    return getattr(stmt, 'line', None)
+
+def copy_line(new, old):
+    """``new``, given the line of the statement it replaces."""
+    line = line_of(old)
+    if line is not None:
+        new.line = line
+    return new
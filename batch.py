@@ -0,0 +1,109 @@
+"""Batch mode (``--batch DIR -j N``): run many independent scripts on a process pool.
+
+Every ``.vl`` file under the directory is one job. Worker processes stay up
+for the whole batch, so each job costs a parse (usually a ``.vlc`` cache
+hit) and a run, without starting Python and importing Velion again. The
+files a job loads with ``get`` stay parsed in its worker for later jobs.
+Jobs run with fresh globals and their output captured; the results come
+back in file order.
+"""
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from . import cache, modules, optimizer, output, tiering
+from .program import Program, capture
+
+class JobResult:
+    __slots__ = ('path', 'status', 'output', 'error', 'seconds')
+
+    def __init__(self, path, status, output, error, seconds):
+        self.path = path
+        self.status = status
+        self.output = output
+        self.error = error
+        self.seconds = seconds
+
+def find_scripts(directory):
+    """Paths of the ``.vl`` files under ``directory``, sorted."""
+    scripts = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d != cache.CACHE_DIRNAME)
+        scripts.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.vl'))
+    return scripts
+
+def settings():
+    """Command-line settings workers need, for processes that do not fork."""
+    return (cache.enabled, optimizer.enabled, modules.registry.check_mtime, tiering.threshold)
+
+def _init_worker(state):
+    cache.enabled, optimizer.enabled, modules.registry.check_mtime, tiering.threshold = state
+    # jobs run with their output captured, which is written out in one piece
+    output.set_policy('full')
+    # a job that reads input gets end of file instead of waiting
+    sys.stdin = open(os.devnull, 'r')
+
+def run_job(path, engine='tree'):
+    start = time.perf_counter()
+    status, error = 0, None
+    buffer = io.StringIO()
+    try:
+        with capture(buffer):
+            Program.from_file(path, engine).run()
+    except SystemExit as exc:
+        if exc.code is not None and not isinstance(exc.code, int):
+            status, error = 1, str(exc.code)
+        else:
+            status = exc.code or 0
+    except Exception as exc:
+        status, error = 1, ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+    return JobResult(path, status, buffer.getvalue(), error, time.perf_counter() - start)
+
+def _run_job(job):
+    return run_job(*job)
+
+def _run_here(work):
+    # jobs see what they would in a worker: 'full' policy, no input
+    previous = output.policy, sys.stdin
+    output.set_policy('full')
+    sys.stdin = open(os.devnull, 'r')
+    try:
+        return [_run_job(job) for job in work]
+    finally:
+        sys.stdin.close()
+        sys.stdin = previous[1]
+        output.set_policy(previous[0])
+
+def run_batch(scripts, jobs=None, engine='tree'):
+    """Results of running ``scripts``, in order, on ``jobs`` worker processes."""
+    jobs = jobs or os.cpu_count() or 1
+    work = [(path, engine) for path in scripts]
+    if jobs == 1:
+        return _run_here(work)
+    # a few chunks per worker: fewer round trips, still balanced at the end
+    chunksize = max(1, len(work) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(settings(),)) as executor:
+        return list(executor.map(_run_job, work, chunksize=chunksize))
+
+def main(directory, jobs=None, engine='tree'):
+    """Run the batch, print each script's output and a summary; the exit status."""
+    scripts = find_scripts(directory)
+    start = time.perf_counter()
+    results = run_batch(scripts, jobs, engine)
+    elapsed = time.perf_counter() - start
+    failed = 0
+    for result in results:
+        print(f'==> {result.path} (exit {result.status}, {result.seconds * 1000:.1f} ms) <==')
+        sys.stdout.write(result.output)
+        if result.error is not None:
+            print(f'{result.path}: {result.error}', file=sys.stderr)
+        if result.status:
+            failed += 1
+    rate = len(results) / elapsed if elapsed else 0.0
+    print(f'{len(results)} scripts, {failed} failed, in {elapsed:.2f} s '
+          f'({rate:.1f} scripts/s)', file=sys.stderr)
+    return 1 if failed else 0
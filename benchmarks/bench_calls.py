@@ -0,0 +1,87 @@
+"""Programs made of many calls to small Velion functions, on every engine.
+
+In the tree runtime a call binds its arguments from the callee's binding
+plan and finds the function through the cache at its call site, and a
+function whose body calls nothing runs without going through the call
+stack. These workloads are mostly that per-call work.
+
+    python -m velion.benchmarks.bench_calls [--calls N] [--repeat N]
+"""
+import argparse
+
+from .bench_engines import ENGINE_RUNNERS, best_of, function_calls, parse
+
+def leaf_calls(n):
+    items = ', '.join(str(i) for i in range(n // 2))
+    return f"""
+when inc(x)
+    return x + 1
+end
+remember 0 as total
+for each i in [{items}] do
+    remember inc(total) as total
+    remember inc(total) as total
+end
+say total
+"""
+
+def nested_calls(n):
+    # each iteration is three calls, two of them from inside a function
+    items = ', '.join(str(i) for i in range(n // 3))
+    return f"""
+when inc(x)
+    return x + 1
+end
+when twice(x)
+    return inc(inc(x))
+end
+remember 0 as total
+for each i in [{items}] do
+    remember twice(total) as total
+end
+say total
+"""
+
+def helper_calls(n):
+    # calls from a loop inside a function to functions defined outside it
+    items = ', '.join(str(i) for i in range(n // 2))
+    return f"""
+when square(x)
+    return x * x
+end
+when clamp(x, top)
+    if x is greater than top then
+        return top
+    end
+    return x
+end
+when total_of(values)
+    remember 0 as acc
+    for each v in values do
+        remember acc + clamp(square(v), 1000) as acc
+    end
+    return acc
+end
+say total_of([{items}])
+"""
+
+WORKLOADS = {
+    'leaf_calls': leaf_calls,
+    'nested_calls': nested_calls,
+    'helper_calls': helper_calls,
+    'function_calls': function_calls,
+}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--calls', type=int, default=20000)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    print(f"{'workload':<16}" + ''.join(f'{engine + " (ms)":>16}' for engine in ENGINE_RUNNERS))
+    for name, make_source in WORKLOADS.items():
+        stmts = parse(make_source(args.calls))
+        times = [best_of(make_runner(stmts), args.repeat) for make_runner in ENGINE_RUNNERS.values()]
+        print(f'{name:<16}' + ''.join(f'{t * 1000:>16.2f}' for t in times))
+
+if __name__ == '__main__':
+    main()
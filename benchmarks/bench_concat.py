@@ -0,0 +1,80 @@
+"""Building long text with ``..`` and with ``join``, with and without ropes.
+
+Each program grows a string one line at a time, to sizes that go up by ten,
+and prints its length; in "join" each line is a row of fields joined with
+the ``join`` built-in. With ropes the time per megabyte stays about the
+same at every size; copying the text at every ``..`` ("copying", ropes
+turned off) makes it grow with the size, so it is only run up to
+``--copy-limit``.
+
+    python -m velion.benchmarks.bench_concat [--engine E] [--max-mb N] [--copy-limit MB] [--repeat N]
+"""
+import argparse
+import contextlib
+
+from .. import rope
+from .bench_engines import ENGINE_RUNNERS, best_of, parse
+
+LINE = 'entry {i}-{j}: ' + '.' * 80 + ';'
+
+def concatenation(lines):
+    return _loop(lines, f'remember text .. "{LINE}" as text')
+
+def joined(lines):
+    # each line is a row of fields put together by join
+    return _loop(lines, f'remember text .. join([i, j, i * j, "{LINE}"], ",") as text')
+
+def _loop(lines, body):
+    outer = ', '.join(str(i) for i in range(max(1, lines // 100)))
+    hundred = ', '.join(str(i) for i in range(100))
+    return f"""
+remember "" as text
+for each i in [{outer}] do
+    for each j in [{hundred}] do
+        {body}
+    end
+end
+say length(text)
+"""
+
+WORKLOADS = {
+    'concatenation': concatenation,
+    'join': joined,
+}
+
+@contextlib.contextmanager
+def without_ropes():
+    previous, rope.MIN_LENGTH = rope.MIN_LENGTH, float('inf')
+    try:
+        yield
+    finally:
+        rope.MIN_LENGTH = previous
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--engine', choices=tuple(ENGINE_RUNNERS), default='tree')
+    arg_parser.add_argument('--max-mb', type=float, default=10)
+    arg_parser.add_argument('--copy-limit', type=float, default=1, metavar='MB')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+    line_size = len(LINE)
+    sizes, mb = [], 0.01
+    while mb <= args.max_mb * 1.0001:
+        sizes.append(mb)
+        mb *= 10
+    print(f"{'workload':<15}{'size (MB)':>10}{'ropes (ms)':>12}{'ms/MB':>8}"
+          f"{'copying (ms)':>14}{'ms/MB':>8}")
+    make_runner = ENGINE_RUNNERS[args.engine]
+    for name, make_source in WORKLOADS.items():
+        for mb in sizes:
+            runner = make_runner(parse(make_source(int(mb * 1e6 / line_size))))
+            fast = best_of(runner, args.repeat)
+            row = f'{name:<15}{mb:>10g}{fast * 1000:>12.2f}{fast * 1000 / mb:>8.1f}'
+            if mb <= args.copy_limit:
+                with without_ropes():
+                    slow = best_of(runner, args.repeat)
+                row += f'{slow * 1000:>14.2f}{slow * 1000 / mb:>8.1f}'
+            print(row)
+
+if __name__ == '__main__':
+    main()
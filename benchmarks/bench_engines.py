@@ -0,0 +1,132 @@
+"""Compare the tree-walking runtime with the closure and bytecode engines.
+
+Run from the directory that contains the ``velion`` package:
+
+    python -m velion.benchmarks.bench_engines [--repeat N]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from ..compiler import compile_program
+from ..lexer import lex_stream
+from ..parser import Parser
+from ..runtime import run
+from ..vm import VM
+from ..bytecode import compile_program as compile_bytecode
+
+def numeric_loops(n=300):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+remember [{items}] as items
+remember 0 as total
+for each i in items do
+    for each j in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+        remember total + i * j - 1 as total
+        if j is greater than 5 then
+            remember total / 2 as total
+        end
+    end
+end
+say total
+"""
+
+def function_calls(n=2000):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+when score(a, b)
+    remember a * 3 + b as s
+    if s is greater than 100 then
+        remember s - 100 as s
+    end
+    return s
+end
+remember 0 as total
+for each i in [{items}] do
+    remember total + score(i, 7) as total
+end
+say total
+"""
+
+def local_loops(n=300):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+when accumulate(values, scale)
+    remember 0 as acc
+    for each v in values do
+        remember acc + v * scale as acc
+        remember acc - v as acc
+    end
+    return acc
+end
+remember [{items}] as values
+remember 0 as total
+for each k in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+    remember total + accumulate(values, k) as total
+end
+say total
+"""
+
+def string_building(n=2000):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+remember "" as line
+for each i in [{items}] do
+    remember "row " .. i .. ": " .. i * 2 as line
+    say "{{line}} done"
+end
+"""
+
+WORKLOADS = {
+    'numeric_loops': numeric_loops,
+    'function_calls': function_calls,
+    'local_loops': local_loops,
+    'string_building': string_building,
+}
+
+def parse(source):
+    return Parser(lex_stream(source)).parse()
+
+def run_tree(stmts):
+    return lambda: run(stmts)
+
+def run_closure(stmts):
+    return compile_program(stmts)
+
+def run_vm(stmts):
+    code = compile_bytecode(stmts)
+    return lambda: VM().run(code)
+
+# engine -> function taking parsed statements and returning a runner;
+# compilation happens outside the timed runner.
+ENGINE_RUNNERS = {
+    'tree': run_tree,
+    'closure': run_closure,
+    'vm': run_vm,
+}
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    print(f"{'workload':<18}{'tree (ms)':>12}{'closure (ms)':>14}{'vm (ms)':>10}"
+          f"{'closure x':>11}{'vm x':>7}")
+    for name, make_source in WORKLOADS.items():
+        stmts = parse(make_source())
+        tree, closure, vm = (best_of(make_runner(stmts), args.repeat)
+                             for make_runner in ENGINE_RUNNERS.values())
+        print(f"{name:<18}{tree * 1000:>12.2f}{closure * 1000:>14.2f}{vm * 1000:>10.2f}"
+              f"{tree / closure:>10.2f}x{tree / vm:>6.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Line-oriented file processing with ``lines_of`` and ``write_lines``.
+
+For log files of growing size, times a ``for each`` over ``lines_of`` that
+counts the lines matching a value, and a copy of the file with
+``write_lines(copy, lines_of(file))``. The peak memory the program allocates
+while it runs (measured in a separate, untimed run) stays the same whatever
+the size of the file.
+
+    python -m velion.benchmarks.bench_files [--sizes MB,MB,...] [--engine E] [--repeat N]
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+from .bench_engines import ENGINE_RUNNERS, best_of, parse
+
+def write_log(path, mb):
+    with open(path, 'w', encoding='utf-8') as f:
+        size, i = 0, 0
+        while size < mb * 1e6:
+            line = f'2026-10-18 12:00:{i % 60:02d} INFO request {i} served in {i % 97} ms\n'
+            f.write(line)
+            size += len(line)
+            i += 1
+
+def scan(path, copy_path):
+    return f"""
+remember 0 as matches
+for each line in lines_of("{path}") do
+    if length(line) == 50 then
+        remember matches + 1 as matches
+    end
+end
+say matches
+"""
+
+def copy(path, copy_path):
+    return f"""
+say write_lines("{copy_path}", lines_of("{path}"))
+"""
+
+WORKLOADS = {
+    'scan': scan,
+    'copy': copy,
+}
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        best_of(fn, 1)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--sizes', default='10,100',
+                            help='file sizes in MB, separated by commas')
+    arg_parser.add_argument('--engine', choices=tuple(ENGINE_RUNNERS), default='tree')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+    make_runner = ENGINE_RUNNERS[args.engine]
+    print(f"{'workload':<10}{'size (MB)':>10}{'time (ms)':>12}{'MB/s':>8}{'peak memory (MB)':>18}")
+    with tempfile.TemporaryDirectory() as directory:
+        path, copy_path = (os.path.join(directory, name) for name in ('log.txt', 'copy.txt'))
+        for mb in (float(size) for size in args.sizes.split(',')):
+            write_log(path, mb)
+            for name, make_source in WORKLOADS.items():
+                runner = make_runner(parse(make_source(path, copy_path)))
+                seconds = best_of(runner, args.repeat)
+                peak = peak_memory(runner)
+                print(f'{name:<10}{mb:>10g}{seconds * 1000:>12.1f}{mb / seconds:>8.1f}'
+                      f'{peak / 1e6:>18.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Cost of the runtime's event hooks, when nothing listens and when something does.
+
+Each program runs on the tree runtime before any listener has been added,
+after listeners for every event have been added and removed again
+("disabled", which must cost next to nothing), and with a listener for
+every event that does nothing ("enabled"). The first two are timed
+alternately, in turns, so drift in the machine's speed affects both alike.
+
+    python -m velion.benchmarks.bench_hooks [--repeat N]
+"""
+import argparse
+import time
+
+from .. import hooks
+from ..runtime import run
+from .bench_engines import function_calls, local_loops, numeric_loops, parse
+from .bench_optimizer import output_of
+
+def try_loops(n=3000):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+remember 0 as failures
+for each i in [{items}] do
+    try
+        remember 10 / (i - i) as x
+    if_it_fails
+        remember failures + 1 as failures
+    end
+end
+say failures
+"""
+
+WORKLOADS = {
+    'numeric_loops': numeric_loops,
+    'function_calls': function_calls,
+    'local_loops': local_loops,
+    'try_loops': try_loops,
+}
+
+def _nothing(*args):
+    pass
+
+def timed(stmts):
+    start = time.perf_counter()
+    output_of(lambda: run(stmts))
+    return time.perf_counter() - start
+
+def set_listeners(present):
+    for event in hooks.EVENTS:
+        if present:
+            hooks.add(event, _nothing)
+        else:
+            hooks.remove(event, _nothing)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--repeat', type=int, default=10)
+    args = arg_parser.parse_args()
+    programs = {name: parse(make_source()) for name, make_source in WORKLOADS.items()}
+    never = {}
+    for name, stmts in programs.items():
+        timed(stmts)
+        never[name] = [timed(stmts)]
+    set_listeners(True)
+    set_listeners(False)
+    print(f"{'workload':<16}{'no hooks (ms)':>15}{'disabled (ms)':>15}{'overhead':>10}"
+          f"{'enabled (ms)':>15}{'overhead':>10}")
+    for name, stmts in programs.items():
+        disabled = []
+        for i in range(args.repeat):
+            # The runtime's functions are the originals again, so "no hooks"
+            # runs measure the same code; alternate which goes first.
+            if i % 2:
+                never[name].append(timed(stmts))
+                disabled.append(timed(stmts))
+            else:
+                disabled.append(timed(stmts))
+                never[name].append(timed(stmts))
+        set_listeners(True)
+        enabled = min(timed(stmts) for _ in range(args.repeat))
+        set_listeners(False)
+        base, off = min(never[name]), min(disabled)
+        print(f'{name:<16}{base * 1000:>15.2f}{off * 1000:>15.2f}{(off / base - 1) * 100:>9.1f}%'
+              f'{enabled * 1000:>15.2f}{(enabled / base - 1) * 100:>9.1f}%')
+
+if __name__ == '__main__':
+    main()
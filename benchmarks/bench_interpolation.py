@@ -0,0 +1,58 @@
+"""Micro-benchmark for string interpolation in `say` loops.
+
+Times an interpolation-heavy program on every engine, and the template
+evaluation itself: the regex substitution interpolation used to run on every
+evaluation against the pre-split template parts it uses now.
+
+    python -m velion.benchmarks.bench_interpolation [--repeat N]
+"""
+import argparse
+import re
+import timeit
+
+from ..ast_nodes import StringInterpolation
+from ..runtime import Environment, interpolate
+from .bench_engines import ENGINE_RUNNERS, best_of, parse
+
+def say_loop(n=3000):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+remember "report" as title
+remember "ok" as status
+for each i in [{items}] do
+    say "{{title}} row {{i}}: status={{status}} value={{i}} missing={{nothing}}"
+    say "{{i}}"
+end
+"""
+
+_REGEX = re.compile(r'\{([a-zA-Z_][a-zA-Z0-9_]*)\}')
+
+def regex_interpolate(template, env):
+    def replacer(match):
+        var = match.group(1)
+        return str(env[var]) if var in env else '{' + var + '}'
+    return _REGEX.sub(replacer, template)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    stmts = parse(say_loop())
+    print(f"{'engine':<10}{'say loop (ms)':>15}")
+    for engine, make_runner in ENGINE_RUNNERS.items():
+        print(f"{engine:<10}{best_of(make_runner(stmts), args.repeat) * 1000:>15.2f}")
+
+    env = Environment()
+    env.update(title='report', status='ok', i=42)
+    node = StringInterpolation('{title} row {i}: status={status} value={i} missing={nothing}')
+    number = 100000
+    regex = min(timeit.repeat(lambda: regex_interpolate(node.template, env), number=number, repeat=args.repeat))
+    parts = min(timeit.repeat(lambda: interpolate(node.parts, env), number=number, repeat=args.repeat))
+    print()
+    print(f"{'template evaluation':<22}{'ns/op':>8}")
+    print(f"{'regex substitution':<22}{regex / number * 1e9:>8.0f}")
+    print(f"{'pre-split parts':<22}{parts / number * 1e9:>8.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Memory held by the syntax tree of a large program, and the time to parse it.
+
+Parses a generated program (``bench_parser.generate``, 100k lines by
+default) twice, each time in a fresh process so that nothing else is in
+memory: once with the node classes of ``ast_nodes``, which keep their
+fields in ``__slots__``, and once with copies of them that keep their
+fields in a ``__dict__``, as every node did before. Reports, side by side,
+the best parse time, the memory the tree keeps allocated (measured with
+``tracemalloc`` in a separate, untimed parse) and the peak resident size
+of the process.
+
+    python -m velion.benchmarks.bench_memory [--lines N] [--repeat N]
+"""
+import argparse
+import gc
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from .. import ast_nodes, parser
+from ..ast_nodes import Node
+from ..lexer import lex_stream
+from ..parser import Parser
+from .bench_parser import generate
+
+NODES = ('dict', 'slots')
+
+class DictNode:
+    """Base of the copies made by ``use_dict_nodes``."""
+
+def use_dict_nodes():
+    """Make the parser build nodes that keep their fields in a ``__dict__``."""
+    for name, klass in list(vars(ast_nodes).items()):
+        if isinstance(klass, type) and issubclass(klass, Node) and klass is not Node:
+            namespace = {key: value for key, value in vars(klass).items()
+                         if key != '__slots__' and key not in klass.__slots__}
+            copy = type(name, (DictNode,), namespace)
+            setattr(ast_nodes, name, copy)
+            setattr(parser, name, copy)
+
+def parse(source):
+    return Parser(lex_stream(source)).parse()
+
+def fields(node):
+    if isinstance(node, DictNode):
+        return vars(node).values()
+    return [getattr(node, name) for klass in type(node).__mro__
+            for name in getattr(klass, '__slots__', ())
+            if not name.startswith('_') and hasattr(node, name)]
+
+def count_nodes(stmts):
+    count, pending = 0, list(stmts)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (Node, DictNode)):
+            count += 1
+            pending.extend(fields(node))
+        elif isinstance(node, (list, tuple)):
+            pending.extend(node)
+        elif isinstance(node, dict):
+            pending.extend(node.values())
+    return count
+
+def measure(lines, repeat, nodes):
+    if nodes == 'dict':
+        use_dict_nodes()
+    source = generate(lines)
+    gc.collect()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stmts = parse(source)
+        best = min(best, time.perf_counter() - start)
+        del stmts
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    stmts = parse(source)
+    gc.collect()
+    tree = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return {'lines': source.count('\n'), 'nodes': count_nodes(stmts),
+            'seconds': best, 'tree': tree, 'peak': peak}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--lines', type=int, default=100_000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--in-process', choices=NODES, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.in_process:
+        print(json.dumps(measure(args.lines, args.repeat, args.in_process)))
+        return
+    results = {}
+    for nodes in NODES:
+        child = subprocess.run([sys.executable, '-m', __spec__.name, '--in-process', nodes,
+                                '--lines', str(args.lines), '--repeat', str(args.repeat)],
+                               check=True, capture_output=True, text=True)
+        results[nodes] = json.loads(child.stdout)
+    before, after = results['dict'], results['slots']
+    if before['nodes'] != after['nodes']:
+        sys.exit(f"the trees differ: {before['nodes']} and {after['nodes']} nodes")
+    print(f"{after['lines']} lines, {after['nodes']} nodes")
+    print(f"{'':<16}{'__dict__':>12}{'__slots__':>12}{'change':>9}")
+    rows = [('parse (ms)', 'seconds', 1000), ('tree (MB)', 'tree', 1e-6),
+            ('bytes per node', 'tree', 1 / after['nodes']), ('peak RSS (MB)', 'peak', 1e-6)]
+    for label, key, scale in rows:
+        print(f"{label:<16}{before[key] * scale:>12.1f}{after[key] * scale:>12.1f}"
+              f"{(after[key] / before[key] - 1) * 100:>8.1f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Run programs with and without the AST optimizer on every engine.
+
+That the optimizer does not change what a program does is checked by
+``tests/test_optimizer.py``.
+
+    python -m velion.benchmarks.bench_optimizer [--repeat N]
+"""
+import argparse
+import contextlib
+import io
+
+from ..optimizer import optimize
+from .bench_engines import ENGINE_RUNNERS, best_of, parse
+
+def templated(n=2000):
+    # what generated code looks like: constant arithmetic and constant ifs
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+remember 0 as total
+for each i in [{items}] do
+    remember total + i * (60 * 60 * 24) + 7 * 3 - 1 as total
+    if 1 == 1 then
+        remember total - 100 / 4 as total
+    else
+        say "disabled branch"
+    end
+    if 2 < 1 then
+        say "debug", i
+    end
+end
+say total, "a" .. "b" .. 1 + 2
+"""
+
+def invariant_loops(n=300):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+remember 12 as width
+remember 3 as depth
+remember "cell" as label
+remember 0 as total
+for each i in [{items}] do
+    for each j in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+        remember total + i * width * depth + width * width - j as total
+        remember "{{label}}-{{width}}" as name
+    end
+end
+say total, name
+"""
+
+def function_loops(n=300):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+when scaled(values, scale, offset)
+    remember 0 as acc
+    for each v in values do
+        remember acc + v * (scale * scale + offset * 2) as acc
+    end
+    return acc
+end
+remember [{items}] as values
+remember 0 as total
+for each k in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+    remember total + scaled(values, k, 3) as total
+end
+say total
+"""
+
+def edge_cases():
+    return """
+remember 2 as k
+for each i in [1, 2, 3] do
+    remember k * 2 as k
+    say k * 2, i * k
+    for each j in [1, 2] do
+        say k + 1, "{k}-{j}"
+    end
+end
+when early(n)
+    if 1 == 1 then
+        return n
+    end
+    return 0
+end
+say early(4)
+for each i in [1, 2] do
+    try
+        say 1 / 0 + i
+    if_it_fails
+        say "caught", k / 4
+    end
+end
+say "x" .. 10 / 4
+"""
+
+WORKLOADS = {
+    'templated': templated,
+    'invariant_loops': invariant_loops,
+    'function_loops': function_loops,
+    'edge_cases': edge_cases,
+}
+
+def output_of(fn):
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        fn()
+    return buffer.getvalue()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    print(f"{'workload':<18}{'engine':<10}{'plain (ms)':>12}{'optimized (ms)':>16}{'speedup':>9}")
+    for name, make_source in WORKLOADS.items():
+        stmts = parse(make_source())
+        optimized = optimize(stmts)
+        for engine, make_runner in ENGINE_RUNNERS.items():
+            plain_run, optimized_run = make_runner(stmts), make_runner(optimized)
+            plain = best_of(plain_run, args.repeat)
+            fast = best_of(optimized_run, args.repeat)
+            print(f"{name:<18}{engine:<10}{plain * 1000:>12.2f}{fast * 1000:>16.2f}{plain / fast:>8.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Throughput of ``say`` with each output buffering policy, against ``print``.
+
+Programs that print many lines run with stdout sent to a file (the null
+device by default), as when a script feeds a log pipeline. "print" is how
+``say`` wrote before output was buffered: one ``print`` call per line.
+``--line-buffered`` makes the file flush at every newline, as a terminal
+does, so that each line written separately costs a system call.
+
+    python -m velion.benchmarks.bench_output [--lines N] [--to FILE] [--line-buffered] [--repeat N]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+from .. import compiler, output, runtime, vm
+from .bench_engines import ENGINE_RUNNERS, parse
+
+def _loop(n, body):
+    # n lines from two nested loops, so the program stays short
+    outer = ', '.join(str(i) for i in range(max(1, n // 100)))
+    hundred = ', '.join(str(i) for i in range(100))
+    return f"""
+for each i in [{outer}] do
+    for each j in [{hundred}] do
+        {body}
+    end
+end
+"""
+
+def log_lines(n):
+    return _loop(n, 'say "request {i}-{j} served in 12 ms"')
+
+def columns(n):
+    return _loop(n, 'say i, j * 2, "ok"')
+
+WORKLOADS = {
+    'log_lines': log_lines,
+    'columns': columns,
+}
+
+MODES = ('print', *output.POLICIES)
+
+@contextlib.contextmanager
+def saying_with(mode):
+    """Engines write ``say`` output with ``print``, or with the policy ``mode``."""
+    engines = (runtime, compiler, vm)
+    previous = output.policy
+    if mode == 'print':
+        for module in engines:
+            module.say = print
+    else:
+        output.set_policy(mode)
+    try:
+        yield
+    finally:
+        for module in engines:
+            module.say = output.say
+        output.set_policy(previous)
+
+def time_modes(fn, repeat, path, line_buffered):
+    """Best time of ``fn`` in every mode; the modes take turns, so drift in
+    the machine's speed affects them alike."""
+    best = dict.fromkeys(MODES, float('inf'))
+    for _ in range(repeat):
+        for mode in MODES:
+            with saying_with(mode), open(path, 'w', buffering=1 if line_buffered else -1) as stream, \
+                    contextlib.redirect_stdout(stream):
+                start = time.perf_counter()
+                fn()
+                sys.stdout.flush()
+                best[mode] = min(best[mode], time.perf_counter() - start)
+    return best
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--lines', type=int, default=100000)
+    arg_parser.add_argument('--to', default=os.devnull, metavar='FILE')
+    arg_parser.add_argument('--line-buffered', action='store_true')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    print(f"{'workload':<12}{'engine':<9}" + ''.join(f'{mode + " (ms)":>13}' for mode in MODES)
+          + f"{'block x':>9}")
+    for name, make_source in WORKLOADS.items():
+        stmts = parse(make_source(args.lines))
+        for engine, make_runner in ENGINE_RUNNERS.items():
+            times = time_modes(make_runner(stmts), args.repeat, args.to, args.line_buffered)
+            print(f'{name:<12}{engine:<9}'
+                  + ''.join(f'{times[mode] * 1000:>13.2f}' for mode in MODES)
+                  + f"{times['print'] / times['block']:>8.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""CPU-heavy ``parallel_map`` calls, sequential and on worker processes.
+
+The same program runs with ``parallel.workers`` at 1, which runs every
+call in the calling process, and at the requested number of workers, and
+must print the same output both ways before it is timed. The pool is
+started before timing, as it would be after the first call in a long
+program.
+
+    python -m velion.benchmarks.bench_parallel [--workers N] [--items N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+
+from .. import parallel
+from ..runtime import run
+from .bench_engines import best_of, parse
+from .bench_optimizer import output_of
+
+def scoring(n):
+    # every item is a few thousand interpreted operations
+    items = ', '.join(str(i) for i in range(n))
+    weights = ', '.join(str(i % 7 + 1) for i in range(200))
+    return f"""
+remember [{weights}] as weights
+when weigh(w, x)
+    return w * x - w
+end
+when score(x)
+    remember 0 as acc
+    for each w in weights do
+        remember acc + weigh(w, x) as acc
+        if acc is greater than 100000 then
+            remember acc - 100000 as acc
+        end
+    end
+    return acc
+end
+say parallel_map(score, [{items}])
+"""
+
+def each_line(n):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+when report(x)
+    remember 0 as acc
+    for each k in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20] do
+        remember acc + x * k as acc
+    end
+    say "item {{x}}: {{acc}}"
+end
+parallel_each(report, [{items}])
+"""
+
+WORKLOADS = {
+    'scoring': scoring,
+    'each_line': each_line,
+}
+
+def runner(source, workers):
+    stmts = parse(source)
+    def run_program():
+        parallel.workers = workers
+        run(stmts)
+    return run_program
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument('--items', type=int, default=2000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+    print(f'{args.workers} workers')
+    print(f"{'workload':<12}{'sequential (ms)':>17}{'parallel (ms)':>15}{'speedup':>9}")
+    failed = 0
+    for name, make_source in WORKLOADS.items():
+        source = make_source(args.items)
+        sequential = runner(source, 1)
+        fanned_out = runner(source, args.workers)
+        if output_of(sequential) != output_of(fanned_out):
+            print(f'{name:<12}output differs on workers')
+            failed += 1
+            continue
+        slow = best_of(sequential, args.repeat)
+        fast = best_of(fanned_out, args.repeat)
+        print(f'{name:<12}{slow * 1000:>17.2f}{fast * 1000:>15.2f}{slow / fast:>8.2f}x')
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
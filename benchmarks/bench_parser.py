@@ -0,0 +1,75 @@
+"""Parser throughput on large generated programs.
+
+Generates a Velion program of the requested size (100k lines by default)
+and reports tokens per second for the tuple lexer (``lex``), the token
+stream lexer (``lex_stream``) and the parser over the stream, best of N
+runs each.
+
+    python -m velion.benchmarks.bench_parser [--lines N] [--repeat N]
+"""
+import argparse
+import time
+
+from ..lexer import lex, lex_stream
+from ..parser import Parser
+
+# Each chunk is a self-contained block of statements; `{n}` keeps names unique.
+CHUNKS = [
+    """remember {n} * 2 + (3 - 1) / 4 as value_{n}
+remember "item " .. value_{n} .. " of {n}" as label_{n}
+say "{{label_{n}}}: {{value_{n}}}", value_{n}""",
+    """when step_{n}(a, b, c)
+    remember a + b * c as total
+    if total is greater than {n} then
+        say "big", total
+    else
+        say "small", total
+    end
+end""",
+    """for each i in [1, 2, 3, {n}, {n} + 1] do
+    remember i * i - 1 as square
+    say square
+end""",
+    """remember {{"name": "row{n}", "size": {n}, "tags": ["a", "b"]}} as row_{n}
+try
+    step_{n}(1, 2.5, row_{n})
+if_it_fails
+    say "failed at {n}"
+end""",
+]
+
+def generate(lines):
+    chunks = []
+    count = n = 0
+    while count < lines:
+        chunk = CHUNKS[n % len(CHUNKS)].format(n=n)
+        chunks.append(chunk)
+        count += chunk.count('\n') + 1
+        n += 1
+    return '\n'.join(chunks) + '\n'
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--lines', type=int, default=100_000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    source = generate(args.lines)
+    tokens = lex_stream(source)
+    print(f"{source.count(chr(10))} lines, {len(source)} bytes, {len(tokens)} tokens")
+    for name, fn in (('lex', lambda: lex(source)),
+                     ('lex_stream', lambda: lex_stream(source)),
+                     ('parse', lambda: Parser(tokens).parse())):
+        best = best_of(fn, args.repeat)
+        print(f"{name:<12}{best * 1000:>10.1f} ms{len(tokens) / best:>14,.0f} tokens/s")
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    main()
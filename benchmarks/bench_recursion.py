@@ -0,0 +1,90 @@
+"""Deep Velion recursion on every engine.
+
+Every engine keeps suspended Velion calls on a stack of its own and turns
+``return f(...)`` into a jump, so these programs run under a small Python
+recursion limit.
+
+    python -m velion.benchmarks.bench_recursion [--depth N] [--repeat N]
+"""
+import argparse
+import sys
+
+from .bench_engines import ENGINE_RUNNERS, best_of, parse
+
+# Python frames allowed while the programs run
+RECURSION_LIMIT = 400
+
+def accumulate(depth):
+    # tail calls only
+    return f"""
+when count(n, acc)
+    if n == 0 then
+        return acc
+    end
+    return count(n - 1, acc + n)
+end
+say count({depth}, 0)
+"""
+
+def sum_to(depth):
+    return f"""
+when sum_to(n)
+    if n == 0 then
+        return 0
+    end
+    return n + sum_to(n - 1)
+end
+say sum_to({depth})
+"""
+
+def tree_walk(depth):
+    # a list nested `depth` levels deep, with a leaf beside every level
+    return f"""
+when size(node)
+    remember 1 as total
+    for each child in node do
+        remember total + size(child) as total
+    end
+    return total
+end
+remember [] as tree
+for each i in [{', '.join(['0'] * depth)}] do
+    remember [tree, []] as tree
+end
+say size(tree)
+"""
+
+WORKLOADS = {
+    'accumulate': accumulate,
+    'sum_to': sum_to,
+    'tree_walk': tree_walk,
+}
+
+def timed(runner, repeat):
+    try:
+        return f'{best_of(runner, repeat) * 1000:.2f}'
+    except RecursionError:
+        return 'RecursionError'
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--depth', type=int, default=5000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+    depths = sorted({100, args.depth // 10, args.depth})
+    print(f'Python recursion limit: {RECURSION_LIMIT}')
+    print(f"{'workload':<12}{'depth':>8}{'tree (ms)':>16}{'closure (ms)':>16}{'vm (ms)':>16}")
+    limit = sys.getrecursionlimit()
+    for name, make_source in WORKLOADS.items():
+        for depth in depths:
+            runners = [make_runner(parse(make_source(depth)))
+                       for make_runner in ENGINE_RUNNERS.values()]
+            sys.setrecursionlimit(RECURSION_LIMIT)
+            try:
+                times = [timed(runner, args.repeat) for runner in runners]
+            finally:
+                sys.setrecursionlimit(limit)
+            print(f"{name:<12}{depth:>8}" + ''.join(f'{t:>16}' for t in times))
+
+if __name__ == '__main__':
+    main()
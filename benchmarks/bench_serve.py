@@ -0,0 +1,96 @@
+"""Latency of short scripts: started cold, and sent to the daemon (``--serve``).
+
+For each script, times a fresh ``python -m velion`` process, a fresh
+``python -m velion.client`` process (what a shell runs) and a request made
+with ``client.run`` from a process that is already running (what an editor
+or a test runner that keeps its process sees). All three must print the
+same output before they are timed; the median of the runs is reported.
+
+    python -m velion.benchmarks.bench_serve [--runs N]
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .. import client
+
+SCRIPTS = {
+    'hello': 'say "hello"\n',
+    'loop': """
+remember 0 as total
+for each i in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+    remember total + i * i as total
+end
+say total
+""",
+    'functions': """
+when fib(n)
+    if n is less than 2 then
+        return n
+    end
+    return fib(n - 1) + fib(n - 2)
+end
+say fib(15)
+""",
+}
+
+def median_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def start_daemon(address):
+    daemon = subprocess.Popen([sys.executable, '-m', 'velion', '--serve', '--socket', address],
+                              stderr=subprocess.DEVNULL)
+    while not os.path.exists(address):
+        if daemon.poll() is not None:
+            raise RuntimeError('the daemon did not start')
+        time.sleep(0.01)
+    return daemon
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--runs', type=int, default=20)
+    args = arg_parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        address = os.path.join(directory, 'velion.sock')
+        daemon = start_daemon(address)
+        try:
+            env = dict(os.environ, VELION_SOCKET=address)
+            print(f"{'script':<12}{'cold (ms)':>11}{'client (ms)':>13}{'in process (ms)':>17}")
+            for name, source in SCRIPTS.items():
+                path = os.path.join(directory, f'{name}.vl')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(source)
+                commands = {
+                    'cold': [sys.executable, '-m', 'velion', path],
+                    'client': [sys.executable, '-m', 'velion.client', path],
+                }
+                outputs = {mode: subprocess.run(command, env=env, check=True, capture_output=True,
+                                                text=True).stdout
+                           for mode, command in commands.items()}
+                captured = io.StringIO()
+                client.run(path, stdout=captured, address=address)
+                outputs['in process'] = captured.getvalue()
+                if len(set(outputs.values())) != 1:
+                    sys.exit(f'{name}: outputs differ: {outputs}')
+                times = [median_ms(lambda: subprocess.run(command, env=env, check=True,
+                                                          stdout=subprocess.DEVNULL), args.runs)
+                         for command in commands.values()]
+                times.append(median_ms(lambda: client.run(path, stdout=io.StringIO(),
+                                                          address=address), args.runs))
+                print(f'{name:<12}{times[0]:>11.2f}{times[1]:>13.2f}{times[2]:>17.2f}')
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Tasks that mostly wait, run one after another and with ``--async``.
+
+Each task waits the given time, as if for a reply over the network, and
+then does a little work. Without the async mode every ``spawn`` runs its
+call to the end, so the waits add up; with it they overlap, and what is
+left is the cost of the tasks themselves. Both ways must print the same
+output before they are timed.
+
+    python -m velion.benchmarks.bench_tasks [--tasks N] [--wait SECONDS] [--repeat N]
+"""
+import argparse
+import sys
+
+from .. import tasks
+from ..runtime import run
+from .bench_engines import best_of, parse
+from .bench_optimizer import output_of
+
+def fetches(n, seconds):
+    items = ', '.join(str(i) for i in range(n))
+    return f"""
+remember 0 as total
+when fetch(i)
+    wait({seconds})
+    remember 0 as acc
+    for each k in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+        remember acc + i * k as acc
+    end
+    remember total + acc as total
+end
+for each i in [{items}] do
+    spawn fetch(i)
+end
+wait_all()
+say total
+"""
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--tasks', type=int, default=1000)
+    arg_parser.add_argument('--wait', type=float, default=0.002)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+    stmts = parse(fetches(args.tasks, args.wait))
+    sequential = lambda: run(stmts)
+    concurrent = lambda: tasks.run(stmts)
+    if output_of(sequential) != output_of(concurrent):
+        print('output differs in the async mode')
+        sys.exit(1)
+    slow = best_of(sequential, args.repeat)
+    fast = best_of(concurrent, args.repeat)
+    print(f'{args.tasks} tasks waiting {args.wait * 1000:g} ms each')
+    print(f"{'sequential (ms)':>17}{'async (ms)':>12}{'speedup':>9}")
+    print(f'{slow * 1000:>17.2f}{fast * 1000:>12.2f}{slow / fast:>8.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Run hot-function programs on the tree runtime with and without tiering.
+
+Each program runs interpreted and with ``tiering.threshold`` set, and must
+print the same output both ways before it is timed. The programs are
+parsed again for each mode because a function's call count lives with its
+parsed definition.
+
+    python -m velion.benchmarks.bench_tiering [--threshold N] [--repeat N]
+"""
+import argparse
+import sys
+
+from .. import tiering
+from ..runtime import run
+from .bench_calls import helper_calls, leaf_calls
+from .bench_engines import best_of, function_calls, parse
+from .bench_optimizer import output_of
+
+def numeric_kernel(n):
+    items = ', '.join(str(i) for i in range(n // 50))
+    return f"""
+when kernel(values, scale)
+    remember 0 as acc
+    for each v in values do
+        if v is greater than 10 then
+            remember acc + v * scale - 3 as acc
+        else
+            remember acc - v as acc
+        end
+    end
+    return acc
+end
+remember [{items}] as values
+remember 0 as total
+for each k in [{', '.join(['1'] * 50)}] do
+    remember total + kernel(values, k) as total
+end
+say total
+"""
+
+WORKLOADS = {
+    'leaf_calls': leaf_calls,
+    'helper_calls': helper_calls,
+    'function_calls': function_calls,
+    'numeric_kernel': numeric_kernel,
+}
+
+def runner(source, threshold):
+    stmts = parse(source)
+    def run_program():
+        # read when each function is defined, on the first run
+        tiering.threshold = threshold
+        run(stmts)
+    return run_program
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--threshold', type=int, default=50)
+    arg_parser.add_argument('--calls', type=int, default=20000)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    print(f"{'workload':<16}{'interpreted (ms)':>18}{'tiered (ms)':>14}{'speedup':>9}")
+    failed = 0
+    for name, make_source in WORKLOADS.items():
+        source = make_source(args.calls)
+        interpreted = runner(source, None)
+        tiered = runner(source, args.threshold)
+        if output_of(interpreted) != output_of(tiered):
+            print(f'{name:<16}output differs when tiered')
+            failed += 1
+            continue
+        slow = best_of(interpreted, args.repeat)
+        fast = best_of(tiered, args.repeat)
+        print(f'{name:<16}{slow * 1000:>18.2f}{fast * 1000:>14.2f}{slow / fast:>8.2f}x')
+    print()
+    print(tiering.format_report())
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
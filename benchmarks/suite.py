@@ -0,0 +1,159 @@
+"""Benchmark suite with a stored baseline, to catch performance regressions.
+
+Times lexing (``lex_stream``), parsing (``Parser.parse``) and running
+every program in ``benchmarks/programs/`` plus a large generated source,
+best of N runs each. Programs go through the optimizer between parsing
+and running, untimed, as they do in ``python -m velion``.
+
+    python -m velion.benchmarks.suite [--engine E] [--repeat N] [--json PATH]
+                                      [--baseline PATH] [--threshold PCT]
+                                      [--save-baseline]
+
+``--json`` writes the timings. With ``--baseline``, each timing is compared
+with the one stored in that file (written earlier with ``--json``, or with
+``--save-baseline`` to the baseline path itself), and the suite exits with
+status 1 if any phase got more than ``--threshold`` percent slower. Phases
+that took less than ``--min-time`` ms in the baseline are reported but not
+checked: at that size the noise is larger than any threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+from .. import optimizer
+from ..lexer import lex_stream
+from ..parser import Parser
+from .bench_engines import ENGINE_RUNNERS
+from .bench_parser import generate
+
+PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'programs')
+
+# Lines of the generated program
+GENERATED_LINES = 20_000
+
+FORMAT_VERSION = 1
+
+PHASES = ('lex', 'parse', 'run')
+
+def programs():
+    """(name, source) of every program in the suite."""
+    for filename in sorted(os.listdir(PROGRAMS_DIR)):
+        if filename.endswith('.vl'):
+            with open(os.path.join(PROGRAMS_DIR, filename), 'r', encoding='utf-8') as f:
+                yield filename[:-3], f.read()
+    yield 'generated', generate(GENERATED_LINES)
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def measure(source, engine, repeat):
+    """Best time in seconds of each phase for ``source``."""
+    tokens = lex_stream(source)
+    stmts = Parser(tokens).parse()
+    timings = {
+        'lex': best_of(lambda: lex_stream(source), repeat),
+        'parse': best_of(lambda: Parser(tokens).parse(), repeat),
+    }
+    if optimizer.enabled:
+        stmts = optimizer.optimize(stmts)
+    runner = ENGINE_RUNNERS[engine](stmts)
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings['run'] = best_of(runner, repeat)
+    return timings
+
+def run_suite(engine='tree', repeat=5):
+    return {
+        'version': FORMAT_VERSION,
+        'engine': engine,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'results': {name: measure(source, engine, repeat) for name, source in programs()},
+    }
+
+def compare(results, baseline, threshold, min_time):
+    """Report lines and the list of ``program.phase`` that regressed."""
+    lines = [f"{'program':<18}{'phase':<7}{'ms':>10}{'baseline':>10}{'change':>9}"]
+    regressions = []
+    for name, timings in results['results'].items():
+        old = baseline['results'].get(name, {})
+        for phase in PHASES:
+            ms = timings[phase] * 1000
+            if phase not in old:
+                lines.append(f'{name:<18}{phase:<7}{ms:>10.2f}{"-":>10}{"new":>9}')
+                continue
+            old_ms = old[phase] * 1000
+            change = (ms / old_ms - 1) * 100 if old_ms else 0.0
+            mark = ''
+            if old_ms < min_time:
+                mark = '  (too short to check)'
+            elif change > threshold:
+                mark = '  REGRESSION'
+                regressions.append(f'{name}.{phase}')
+            lines.append(f'{name:<18}{phase:<7}{ms:>10.2f}{old_ms:>10.2f}{change:>+8.1f}%{mark}')
+    return lines, regressions
+
+def print_results(results):
+    print(f"{'program':<18}" + ''.join(f'{phase + " (ms)":>12}' for phase in PHASES))
+    for name, timings in results['results'].items():
+        print(f'{name:<18}' + ''.join(f'{timings[phase] * 1000:>12.2f}' for phase in PHASES))
+
+def write_json(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--engine', choices=tuple(ENGINE_RUNNERS), default='tree')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--json', metavar='PATH', help='write the timings to PATH')
+    arg_parser.add_argument('--baseline', metavar='PATH', help='compare with the timings in PATH')
+    arg_parser.add_argument('--save-baseline', action='store_true',
+                            help='write the timings to the --baseline path instead of comparing')
+    arg_parser.add_argument('--threshold', type=float, default=10.0, metavar='PCT',
+                            help='slowdown in percent that counts as a regression (default 10)')
+    arg_parser.add_argument('--min-time', type=float, default=1.0, metavar='MS',
+                            help='do not check phases faster than this in the baseline (default 1)')
+    args = arg_parser.parse_args()
+    if args.save_baseline and not args.baseline:
+        arg_parser.error('--save-baseline needs --baseline')
+
+    results = run_suite(args.engine, args.repeat)
+    if args.json:
+        write_json(results, args.json)
+    if args.save_baseline:
+        write_json(results, args.baseline)
+        print_results(results)
+        print(f'baseline saved to {args.baseline}')
+        return
+    if not args.baseline:
+        print_results(results)
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('version') != FORMAT_VERSION:
+        sys.exit(f'{args.baseline}: unsupported baseline format')
+    if baseline.get('engine') != args.engine:
+        print(f"warning: baseline was measured with --engine {baseline.get('engine')}",
+              file=sys.stderr)
+    lines, regressions = compare(results, baseline, args.threshold, args.min_time)
+    print('\n'.join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:g}%: "
+              + ', '.join(regressions))
+        sys.exit(1)
+    print(f'\nno regression over {args.threshold:g}%')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+"""Bytecode compiler: lowers the parsed AST into a flat instruction stream.
+
+Each ``Code`` object holds a list of ``(opcode, arg)`` pairs that ``vm.VM``
+runs on a value stack. Blocks (``if``/``for each``/``try``) become jumps
+instead of nested ``run()`` calls. ``return f(...)`` outside a ``try`` block
+compiles to ``TAIL_CALL_FUNCTION``, which replaces the running frame instead
+of returning to it. Function and lambda bodies use
+``resolver.Scope`` slots (``LOAD_FAST``/``STORE_FAST``/``LOAD_DEREF``) for the
+variables they bind.
+"""
+from .ast_nodes import *
+from .resolver import Scope
+from .runtime import ASSIGN_OPS, BINARY_OPS, BUILTINS, CALLING_BUILTINS, UNSET
+
+OPNAMES = [
+    'LOAD_CONST',         # arg: value
+    'LOAD_NAME',          # arg: name
+    'STORE_NAME',         # arg: name
+    'ASSIGN_NAME',        # arg: name; like STORE_NAME, renames callables
+    'LOAD_FAST',          # arg: (slot, name)
+    'STORE_FAST',         # arg: slot
+    'ASSIGN_FAST',        # arg: (slot, name); like STORE_FAST, renames callables
+    'LOAD_DEREF',         # arg: (depth, slot, name)
+    'LOAD_HOISTED',       # arg: (name, target); pushes the cached value and jumps if set
+    'LOAD_HOISTED_FAST',  # arg: (slot, target); same, for a slot
+    'STORE_HOISTED',      # arg: name; caches the value on top of the stack, leaving it there
+    'STORE_HOISTED_FAST', # arg: slot; same, for a slot
+    'BINARY',             # arg: (function, symbol)
+    'BINARY_CONST',       # arg: (function, symbol, right operand)
+    'POP_JUMP_IF_FALSE',  # arg: target
+    'JUMP',               # arg: target
+    'GET_ITER',           # arg: None
+    'GET_ITEMS',          # arg: None; dictionary items, for ForEachDict
+    'FOR_ITER',           # arg: target when exhausted
+    'FOR_ITER_STORE',     # arg: (target when exhausted, name)
+    'FOR_ITER_FAST',      # arg: (target when exhausted, slot)
+    'STORE_PAIR',         # arg: (key name, value name)
+    'LOAD_FUNC',          # arg: (callee, argument count, slow path target)
+    'ARG_GUARD',          # arg: (index, argument count, call target)
+    'CALL_FUNCTION',      # arg: argument count
+    'TAIL_CALL_FUNCTION', # arg: argument count; the callee's result is returned
+    'CALL_BUILTIN',       # arg: (function, argument count)
+    'CALL_BUILTIN_ENV',   # arg: (function, argument count); the function also gets the environment
+    'POP_TOP',            # arg: None
+    'RETURN_VALUE',       # arg: None
+    'PRINT',              # arg: (value count, has separator)
+    'BUILD_LIST',         # arg: element count
+    'BUILD_DICT',         # arg: pair count
+    'INTERPOLATE',        # arg: template parts
+    'MAKE_LAMBDA',        # arg: Code
+    'DEFINE_FUNC',        # arg: FuncDef
+    'INPUT',              # arg: None
+    'IMPORT',             # arg: None
+    'SETUP_TRY',          # arg: handler target
+    'POP_TRY',            # arg: None
+    'RAISE',              # arg: (exception type, message)
+]
+for _opcode, _name in enumerate(OPNAMES):
+    globals()[_name] = _opcode
+
+class Code:
+    def __init__(self, name, instructions, params=(), scope=None):
+        self.name = name
+        self.instructions = instructions
+        self.params = params
+        # Frame layout; code without a scope runs directly in its environment
+        self.scope = scope
+        if scope is not None:
+            self.names = scope.names
+            self.size = scope.size
+            self.param_slots = scope.param_slots
+            self.args_slot = scope.slot('args')
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+class _Label:
+    __slots__ = ('position',)
+
+    def __init__(self):
+        self.position = None
+
+def _resolve(arg):
+    if isinstance(arg, _Label):
+        return arg.position
+    if isinstance(arg, tuple):
+        return tuple(_resolve(a) for a in arg)
+    return arg
+
+class BytecodeCompiler:
+    def __init__(self, name, scope=None):
+        self.name = name
+        self.scope = scope
+        self.instructions = []
+        self.deferred = []
+        # number of enclosing `try` blocks; their handlers need the caller's frame
+        self.trys = 0
+
+    def emit(self, op, arg=None):
+        self.instructions.append((op, arg))
+
+    def mark(self, label):
+        label.position = len(self.instructions)
+
+    def assemble(self, params=(), result=None):
+        self.emit(LOAD_CONST, result)
+        self.emit(RETURN_VALUE)
+        for emit_deferred in self.deferred:
+            emit_deferred()
+        instructions = [(op, _resolve(arg)) for op, arg in self.instructions]
+        return Code(self.name, instructions, tuple(params), self.scope)
+
+    def load(self, name):
+        resolved = self.scope.lookup(name) if self.scope is not None else None
+        if resolved is None:
+            self.emit(LOAD_NAME, name)
+        elif resolved[0] == 0:
+            self.emit(LOAD_FAST, (resolved[1], name))
+        else:
+            self.emit(LOAD_DEREF, (resolved[0], resolved[1], name))
+
+    def store(self, name):
+        slot = self.scope.slot(name) if self.scope is not None else None
+        if slot is None:
+            self.emit(STORE_NAME, name)
+        else:
+            self.emit(STORE_FAST, slot)
+
+    def block(self, stmts):
+        for stmt in stmts:
+            self.stmt(stmt)
+
+    # Statements
+
+    def stmt(self, node):
+        if isinstance(node, Return):
+            expr = node.expr
+            if (isinstance(expr, Call) and expr.callee not in BUILTINS
+                    and expr.callee not in CALLING_BUILTINS and not self.trys):
+                self.call(expr, TAIL_CALL_FUNCTION)
+                return
+            self.expr(expr)
+            self.emit(RETURN_VALUE)
+        elif isinstance(node, Doc):
+            self.emit(LOAD_CONST, node.text)
+            self.store(f'_doc_{getattr(node.stmt, "name", id(node.stmt))}')
+            self.stmt(node.stmt)
+        elif isinstance(node, Print):
+            for e in node.exprs:
+                self.expr(e)
+            if node.sep:
+                self.expr(node.sep)
+            self.emit(PRINT, (len(node.exprs), bool(node.sep)))
+        elif isinstance(node, AssignOp):
+            if not isinstance(node.left, Var):
+                self.emit(RAISE, (SyntaxError, 'Left side of assignment must be a variable'))
+                return
+            name = node.left.name
+            self.load(name)
+            op = ASSIGN_OPS.get(node.op)
+            if op is None:
+                self.emit(RAISE, (SyntaxError, f'Unknown assignment operator {node.op}'))
+                return
+            self.expr(node.right)
+            self.emit(BINARY, (op, node.op))
+            self.store(name)
+        elif isinstance(node, ForEachDict):
+            self.expr(node.iterable)
+            self.emit(GET_ITEMS)
+            self.loop(STORE_PAIR, (node.key, node.value), node.body)
+        elif isinstance(node, Input):
+            self.expr(node.prompt)
+            self.emit(INPUT)
+        elif isinstance(node, Assign):
+            self.expr(node.expr)
+            slot = self.scope.slot(node.name) if self.scope is not None else None
+            if slot is None:
+                self.emit(ASSIGN_NAME, node.name)
+            else:
+                self.emit(ASSIGN_FAST, (slot, node.name))
+        elif isinstance(node, If):
+            end = _Label()
+            self.expr(node.cond)
+            if node.else_body:
+                orelse = _Label()
+                self.emit(POP_JUMP_IF_FALSE, orelse)
+                self.block(node.body)
+                self.emit(JUMP, end)
+                self.mark(orelse)
+                self.block(node.else_body)
+            else:
+                self.emit(POP_JUMP_IF_FALSE, end)
+                self.block(node.body)
+            self.mark(end)
+        elif isinstance(node, ForEach):
+            for name in node.hoisted:
+                self.emit(LOAD_CONST, UNSET)
+                self.store(name)
+            self.expr(node.iterable)
+            self.emit(GET_ITER)
+            slot = self.scope.slot(node.var) if self.scope is not None else None
+            if slot is None:
+                self.loop(STORE_NAME, node.var, node.body)
+            else:
+                self.loop(STORE_FAST, slot, node.body)
+        elif isinstance(node, FuncDef):
+            self.emit(DEFINE_FUNC, node)
+        elif isinstance(node, Call):
+            self.expr(node)
+            self.emit(POP_TOP)
+        elif isinstance(node, Spawn):
+            # spawned calls run to the end before the program goes on
+            self.expr(node.call)
+            self.emit(POP_TOP)
+        elif isinstance(node, Lambda):
+            pass
+        elif isinstance(node, Import):
+            self.expr(node.filename)
+            self.emit(IMPORT)
+        elif isinstance(node, TryCatch):
+            handler, end = _Label(), _Label()
+            self.emit(SETUP_TRY, handler)
+            self.trys += 1
+            self.block(node.try_body)
+            self.trys -= 1
+            self.emit(POP_TRY)
+            self.emit(JUMP, end)
+            self.mark(handler)
+            self.block(node.catch_body)
+            self.mark(end)
+        else:
+            self.expr(node)
+            self.emit(POP_TOP)
+
+    def loop(self, store_op, store_arg, body):
+        top, end = _Label(), _Label()
+        self.mark(top)
+        if store_op == STORE_NAME:
+            self.emit(FOR_ITER_STORE, (end, store_arg))
+        elif store_op == STORE_FAST:
+            self.emit(FOR_ITER_FAST, (end, store_arg))
+        else:
+            self.emit(FOR_ITER, end)
+            self.emit(store_op, store_arg)
+        self.block(body)
+        self.emit(JUMP, top)
+        self.mark(end)
+
+    # Expressions
+
+    def expr(self, node):
+        if isinstance(node, StringInterpolation):
+            self.emit(INTERPOLATE, node.parts)
+        elif isinstance(node, Lambda):
+            scope = Scope(node.params, node.body, parent=self.scope)
+            self.emit(MAKE_LAMBDA, compile_function('<lambda>', node.params, node.body, scope))
+        elif isinstance(node, Literal):
+            self.emit(LOAD_CONST, node.value)
+        elif isinstance(node, ListLiteral):
+            for e in node.elements:
+                self.expr(e)
+            self.emit(BUILD_LIST, len(node.elements))
+        elif isinstance(node, DictLiteral):
+            for k, v in node.pairs:
+                self.expr(k)
+                self.expr(v)
+            self.emit(BUILD_DICT, len(node.pairs))
+        elif isinstance(node, Var):
+            self.load(node.name)
+        elif isinstance(node, BinOp):
+            self.expr(node.left)
+            op = BINARY_OPS.get(node.op)
+            if op is not None and isinstance(node.right, Literal):
+                self.emit(BINARY_CONST, (op, node.op, node.right.value))
+                return
+            self.expr(node.right)
+            if op is None:
+                self.emit(RAISE, (ValueError, f'Unknown operator {node.op}'))
+            else:
+                self.emit(BINARY, (op, node.op))
+        elif isinstance(node, Hoisted):
+            done = _Label()
+            slot = self.scope.slot(node.name) if self.scope is not None else None
+            if slot is None:
+                self.emit(LOAD_HOISTED, (node.name, done))
+                self.expr(node.expr)
+                self.emit(STORE_HOISTED, node.name)
+            else:
+                self.emit(LOAD_HOISTED_FAST, (slot, done))
+                self.expr(node.expr)
+                self.emit(STORE_HOISTED_FAST, slot)
+            self.mark(done)
+        elif isinstance(node, Call):
+            builtin = BUILTINS.get(node.callee)
+            if builtin is None:
+                self.call(node)
+                return
+            arity, func = builtin
+            args = node.args if arity is None else node.args[:arity]
+            if len(args) < (arity or 0):
+                self.emit(RAISE, (IndexError, 'list index out of range'))
+                return
+            for arg in args:
+                self.expr(arg)
+            self.emit(CALL_BUILTIN, (func, len(args)))
+        else:
+            self.emit(RAISE, (TypeError, f'Unknown expression type {node}'))
+
+    def call(self, node, call_op=CALL_FUNCTION):
+        nargs = len(node.args)
+        builtin = CALLING_BUILTINS.get(node.callee)
+        if builtin is not None:
+            for arg in node.args:
+                self.expr(arg)
+            self.emit(CALL_BUILTIN_ENV, (builtin, nargs))
+            return
+        if nargs == 0:
+            self.emit(LOAD_FUNC, (node.callee, 0, None))
+            self.emit(call_op, 0)
+            return
+        # A callee that takes fewer arguments than given never evaluates
+        # the extra ones; LOAD_FUNC sends those calls down a guarded path.
+        slow, call = _Label(), _Label()
+        self.emit(LOAD_FUNC, (node.callee, nargs, slow))
+        for arg in node.args:
+            self.expr(arg)
+        self.mark(call)
+        self.emit(call_op, nargs)
+        def emit_slow_path():
+            self.mark(slow)
+            for i, arg in enumerate(node.args):
+                self.emit(ARG_GUARD, (i, nargs, call))
+                self.expr(arg)
+            self.emit(JUMP, call)
+        self.deferred.append(emit_slow_path)
+
+def compile_function(name, params, body, scope=None):
+    compiler = BytecodeCompiler(name, scope)
+    for stmt in body:
+        compiler.stmt(stmt)
+    return compiler.assemble(params)
+
+def compile_funcdef(node):
+    return compile_function(node.name, node.params, node.body, Scope.for_function(node))
+
+def compile_program(stmts, result=None):
+    """``result`` is what the program returns if it ends without ``return``."""
+    compiler = BytecodeCompiler('<program>')
+    compiler.block(stmts)
+    return compiler.assemble(result=result)
+
+def compile_expression(name, node):
+    compiler = BytecodeCompiler(name)
+    compiler.expr(node)
+    compiler.emit(RETURN_VALUE)
+    return compiler.assemble()
+
+def _format_arg(op, arg):
+    if op == LOAD_CONST:
+        return repr(arg)
+    if op == PRINT:
+        return f'{arg[0]}' + (', with separator' if arg[1] else '')
+    if op == BINARY:
+        return arg[1]
+    if op == BINARY_CONST:
+        return f'{arg[1]} {arg[2]!r}'
+    if op == FOR_ITER_STORE:
+        return f'-> {arg[0]}, {arg[1]!r}'
+    if op == CALL_BUILTIN or op == CALL_BUILTIN_ENV:
+        return f'{arg[0].__name__}, {arg[1]}'
+    if op == DEFINE_FUNC:
+        return f'{arg.name}({", ".join(arg.params)})'
+    if op == RAISE:
+        return f'{arg[0].__name__}: {arg[1]}'
+    if op == LOAD_FUNC:
+        callee, nargs, slow = arg
+        return f'{callee}, {nargs}' + (f' (slow path -> {slow})' if slow is not None else '')
+    if op == LOAD_FAST or op == ASSIGN_FAST:
+        return f'{arg[0]} ({arg[1]})'
+    if op == LOAD_DEREF:
+        return f'{arg[0]}, {arg[1]} ({arg[2]})'
+    if op == FOR_ITER_FAST:
+        return f'-> {arg[0]}, {arg[1]}'
+    if op == LOAD_HOISTED or op == LOAD_HOISTED_FAST:
+        return f'{arg[0]!r} (set -> {arg[1]})'
+    if op in (POP_JUMP_IF_FALSE, JUMP, FOR_ITER, SETUP_TRY):
+        return f'-> {arg}'
+    if op == ARG_GUARD:
+        return f'{arg[0]} of {arg[1]} (-> {arg[2]})'
+    if arg is None:
+        return ''
+    return repr(arg)
+
+def disassemble(code, functions=()):
+    """Return a readable listing of ``code`` and every code object it reaches.
+
+    ``functions`` maps FuncDef nodes to their compiled bodies, so function
+    definitions can be listed along with the program.
+    """
+    lines = []
+    pending = [code]
+    seen = set()
+    function_codes = dict(functions)
+    while pending:
+        current = pending.pop(0)
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        if lines:
+            lines.append('')
+        params = ', '.join(current.params)
+        lines.append(f'Disassembly of {current.name}({params}):')
+        for offset, (op, arg) in enumerate(current.instructions):
+            lines.append(f'{offset:>6}  {OPNAMES[op]:<18}{_format_arg(op, arg)}'.rstrip())
+            if op == MAKE_LAMBDA:
+                pending.append(arg)
+            elif op == DEFINE_FUNC:
+                body = function_codes.get(arg)
+                if body is None:
+                    body = function_codes[arg] = compile_funcdef(arg)
+                pending.append(body)
+    return '\n'.join(lines)
@@ -0,0 +1,88 @@
+"""On-disk cache of parsed programs, in the spirit of ``.pyc`` files.
+
+``load_program(filename)`` returns the parsed statements for a ``.vl`` file.
+The result is pickled to ``__vlcache__/<name>.<tag>.vlc`` next to the source
+(or under ``$VELION_CACHE_DIR``) and reused while the source's SHA-256 digest
+and the interpreter tag in the header still match. Caching never changes
+behaviour: any problem reading or writing the cache falls back to parsing.
+"""
+import hashlib
+import os
+import pickle
+import sys
+
+from .lexer import lex_stream
+from .parser import Parser
+
+MAGIC = b'VLC'
+# Bump whenever the AST classes or the parser output change shape.
+FORMAT_VERSION = 6
+TAG = f'velion{FORMAT_VERSION}-py{sys.version_info[0]}{sys.version_info[1]}'
+CACHE_DIRNAME = '__vlcache__'
+
+# Turned off by `--no-cache` or VELION_NO_CACHE=1, like sys.dont_write_bytecode.
+enabled = not os.environ.get('VELION_NO_CACHE')
+
+def parse_source(code):
+    return Parser(lex_stream(code)).parse()
+
+def decode_source(source):
+    # Same text open(filename, 'r', encoding='utf-8') would give.
+    return source.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+def cache_path(filename):
+    filename = os.path.abspath(filename)
+    directory, base = os.path.split(filename)
+    cache_dir = os.environ.get('VELION_CACHE_DIR')
+    if cache_dir:
+        # Keep files from different directories apart in a shared cache dir.
+        prefix = hashlib.sha256(directory.encode('utf-8')).hexdigest()[:16]
+        base = f'{prefix}-{base}'
+    else:
+        cache_dir = os.path.join(directory, CACHE_DIRNAME)
+    return os.path.join(cache_dir, f'{os.path.splitext(base)[0]}.{TAG}.vlc')
+
+def _header(digest):
+    return MAGIC + f' {TAG} {digest}\n'.encode('ascii')
+
+def read_cache(path, digest):
+    try:
+        with open(path, 'rb') as f:
+            if f.readline() != _header(digest):
+                return None
+            return pickle.load(f)
+    except Exception:
+        return None
+
+def write_cache(path, digest, stmts):
+    try:
+        payload = pickle.dumps(stmts, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, RecursionError):
+        return
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.write(_header(digest))
+            f.write(payload)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def load_program(filename, use_cache=None):
+    with open(filename, 'rb') as f:
+        source = f.read()
+    if use_cache is None:
+        use_cache = enabled
+    if not use_cache:
+        return parse_source(decode_source(source))
+    digest = hashlib.sha256(source).hexdigest()
+    path = cache_path(filename)
+    stmts = read_cache(path, digest)
+    if stmts is None:
+        stmts = parse_source(decode_source(source))
+        write_cache(path, digest, stmts)
+    return stmts
@@ -0,0 +1,103 @@
+"""Thin client for the Velion daemon (``velion --serve``).
+
+    python -m velion.client [--socket PATH] [--engine E] [--latency] <file.vl> [args...]
+
+Sends the script's path, its arguments, the working directory and standard
+input to the daemon and writes what the script prints as it arrives. Exits
+with the script's status. It imports nothing from Velion, so starting it
+costs only the Python interpreter.
+
+The protocol is lines of JSON over the Unix socket. The client sends one
+request, ``{"path", "args", "engine", "cwd"}``, followed by its standard
+input until end of file. The daemon answers with ``{"output": text}`` lines
+while the script runs and a last ``{"status", "error", "ms"}`` line, where
+``ms`` is the time the daemon took to handle the request.
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+def socket_path():
+    """``VELION_SOCKET``, or a socket of the current user's in the runtime directory."""
+    path = os.environ.get('VELION_SOCKET')
+    if path:
+        return path
+    directory = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(directory, f'velion-{os.getuid()}.sock')
+
+def run(path, args=(), engine=None, stdin=None, stdout=None, address=None):
+    """Run the script ``path`` on the daemon: (status, error message or None, daemon ms).
+
+    ``stdin`` is a file descriptor copied to the script's input (None for
+    none); what the script prints is written to ``stdout``.
+    """
+    stdout = sys.stdout if stdout is None else stdout
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        connection.connect(address or socket_path())
+        request = {'path': os.path.abspath(path), 'args': [str(arg) for arg in args],
+                   'engine': engine, 'cwd': os.getcwd()}
+        connection.sendall(json.dumps(request).encode() + b'\n')
+        if stdin is None:
+            connection.shutdown(socket.SHUT_WR)
+        else:
+            # the script may never read it, so this must not hold up the answer
+            threading.Thread(target=_send_input, args=(stdin, connection), daemon=True).start()
+        with connection.makefile('rb') as frames:
+            for line in frames:
+                frame = json.loads(line)
+                if 'output' in frame:
+                    stdout.write(frame['output'])
+                    stdout.flush()
+                else:
+                    return frame['status'], frame['error'], frame['ms']
+    raise ConnectionError('the daemon closed the connection before the script ended')
+
+def _send_input(fd, connection):
+    try:
+        while True:
+            data = os.read(fd, 1 << 16)
+            if not data:
+                break
+            connection.sendall(data)
+        connection.shutdown(socket.SHUT_WR)
+    except OSError:
+        # the script ended first
+        pass
+
+def main():
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog='velion.client',
+                                         usage='python -m velion.client [options] <file.vl> [args...]')
+    arg_parser.add_argument('file')
+    arg_parser.add_argument('args', nargs=argparse.REMAINDER)
+    arg_parser.add_argument('--socket', metavar='PATH',
+                            help='socket of the daemon (default: $VELION_SOCKET or '
+                                 '$XDG_RUNTIME_DIR/velion-<uid>.sock)')
+    arg_parser.add_argument('--engine', choices=('tree', 'closure', 'vm'),
+                            help="execution engine (default: the daemon's)")
+    arg_parser.add_argument('--latency', action='store_true',
+                            help='print the round trip and daemon time of the request to stderr')
+    args = arg_parser.parse_args()
+    address = args.socket or socket_path()
+    start = time.perf_counter()
+    try:
+        status, error, ms = run(args.file, args.args, args.engine,
+                                sys.stdin.fileno() if sys.stdin is not None else None,
+                                address=address)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f'velion: no daemon at {address}; start one with python -m velion --serve',
+              file=sys.stderr)
+        sys.exit(2)
+    if error is not None:
+        print(f'{args.file}: {error}', file=sys.stderr)
+    if args.latency:
+        print(f'latency: {(time.perf_counter() - start) * 1000:.2f} ms '
+              f'(daemon {ms:.2f} ms)', file=sys.stderr)
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1005 @@
+"""Closure compiler: turns the parsed AST into nested Python closures.
+
+Every node is translated once, before execution, into a function of the
+environment, so running a program is a chain of direct calls instead of the
+isinstance dispatch done by ``runtime.exec_stmt``/``runtime.eval_expr``.
+Statement closures return ``None`` or a ``('RETURN', value)`` tuple, exactly
+like ``exec_stmt`` does; behaviour follows the tree-walking runtime.
+
+Code that can call a Velion function (``runtime.makes_calls``) compiles to
+generator functions instead, which ``runtime._drive`` runs like the tree
+runtime's ``_block``: a call yields the body of the callee and is sent back
+its value, so suspended callers wait on the driver's stack, not in Python
+frames, and the depth of Velion recursion does not depend on Python's
+recursion limit. ``return f(...)`` gives a ``_PendingCall``, which replaces
+the activation that returned it. Functions whose bodies call no Velion
+function compile to plain closures and are called directly.
+
+Function and lambda bodies run in ``Frame``s: variables resolved by
+``resolver.Scope`` compile to slot reads and writes, the rest to lookups by
+name.
+"""
+from . import output
+from .ast_nodes import *
+from .modules import import_module
+from .output import say
+from .resolver import Scope
+from .runtime import (ASSIGN_OPS, BINARY_OPS, BUILTINS, CALLING_BUILTINS, UNSET, Environment, Frame,
+                      _drive, _PendingCall, call_skip, find_function, makes_calls)
+
+def _nothing(env):
+    return None
+
+def _calls(stmts):
+    return any(makes_calls(stmt) for stmt in stmts)
+
+def _value(result):
+    return result[1] if result is not None else None
+
+def _run(block, calls, env):
+    """Block result of running the compiled ``block``, driving its calls."""
+    return _drive(block(env)) if calls else block(env)
+
+def _generator(fn):
+    """The plain closure ``fn`` as a generator function."""
+    def plain(env):
+        return fn(env)
+        yield
+    return plain
+
+class _Function:
+    """A compiled FuncDef.
+
+    ``leaf`` is true when the body calls no Velion function, so ``body`` is a
+    plain closure; otherwise it is a generator function for the driver.
+    ``plain`` is true when no default argument makes a call.
+    """
+    __slots__ = ('node', 'body', 'leaf', 'plain', 'defaults', 'scope', 'param_slots',
+                 'args_slot', 'bound')
+
+    def __init__(self, node, scope):
+        self.node = node
+        self.body = None
+        self.leaf = not _calls(node.body)
+        self.plain = not _calls(node.defaults.values())
+        # parameter -> (compiled default, whether it makes calls)
+        self.defaults = {}
+        self.scope = scope
+        self.param_slots = scope.param_slots
+        self.args_slot = scope.slot('args') if node.variadic else None
+        # names its frames can hold, for call_skip()
+        self.bound = None if scope.dynamic else scope.names
+
+class Compiler:
+    def __init__(self):
+        # id(FuncDef) -> _Function, filled as definitions are compiled
+        self.functions = {}
+        # module path -> (statements, compiled block)
+        self.modules = {}
+        # Scope of the function or lambda being compiled; None at top level
+        self.scope = None
+        self.stmt_compilers = {
+            Doc: self.compile_doc,
+            Print: self.compile_print,
+            AssignOp: self.compile_assign_op,
+            ForEachDict: self.compile_foreach_dict,
+            Input: self.compile_input,
+            Assign: self.compile_assign,
+            If: self.compile_if,
+            ForEach: self.compile_foreach,
+            FuncDef: self.compile_funcdef,
+            Call: self.compile_call_stmt,
+            Spawn: lambda node: self.compile_call_stmt(node.call),
+            Lambda: lambda node: _nothing,
+            Import: self.compile_import,
+            TryCatch: self.compile_trycatch,
+            Return: self.compile_return,
+        }
+        # generator versions, for statements and expressions that make calls
+        self.call_stmt_compilers = {
+            Doc: self.compile_doc_calls,
+            Print: self.compile_print_calls,
+            AssignOp: self.compile_assign_op_calls,
+            ForEachDict: self.compile_foreach_dict_calls,
+            Input: self.compile_input_calls,
+            Assign: self.compile_assign_calls,
+            If: self.compile_if_calls,
+            ForEach: self.compile_foreach_calls,
+            Call: self.compile_call_stmt_calls,
+            Spawn: lambda node: self.compile_call_stmt_calls(node.call),
+            TryCatch: self.compile_trycatch_calls,
+            Return: self.compile_return_calls,
+        }
+        self.expr_compilers = {
+            StringInterpolation: self.compile_interpolation,
+            Lambda: self.compile_lambda,
+            Literal: self.compile_literal,
+            ListLiteral: self.compile_list,
+            DictLiteral: self.compile_dict,
+            Var: self.compile_var,
+            BinOp: self.compile_binop,
+            Call: self.compile_call_expr,
+            Hoisted: self.compile_hoisted,
+        }
+        self.call_expr_compilers = {
+            ListLiteral: self.compile_list_calls,
+            DictLiteral: self.compile_dict_calls,
+            BinOp: self.compile_binop_calls,
+            Call: self.compile_call_expr_calls,
+            Hoisted: self.compile_hoisted_calls,
+        }
+
+    def function(self, node):
+        func = self.functions.get(id(node))
+        if func is None or func.node is not node:
+            func = _Function(node, Scope.for_function(node))
+            self.functions[id(node)] = func
+            func.body = self.in_scope(func.scope, self.compile_block, node.body)
+        return func
+
+    def in_scope(self, scope, compile_node, node):
+        outer, self.scope = self.scope, scope
+        try:
+            return compile_node(node)
+        finally:
+            self.scope = outer
+
+    def slot(self, name):
+        return self.scope.slot(name) if self.scope is not None else None
+
+    def compile_store(self, name):
+        slot = self.slot(name)
+        if slot is None:
+            def store_name(env, value):
+                env[name] = value
+            return store_name
+        def store_slot(env, value):
+            env.slots[slot] = value
+        return store_slot
+
+    def compile_program(self, stmts):
+        block = self.compile_block(stmts)
+        calls = _calls(stmts)
+        def program(env=None):
+            if env is None:
+                env = Environment()
+            try:
+                return _value(_run(block, calls, env))
+            finally:
+                output.flush()
+        return program
+
+    def run_stream(self, stmts, env=None):
+        if env is None:
+            env = Environment()
+        try:
+            for stmt in stmts:
+                result = _run(self.compile_stmt(stmt), makes_calls(stmt), env)
+                if result is not None:
+                    return result[1]
+        finally:
+            output.flush()
+
+    def compile_block(self, stmts):
+        """Closure running ``stmts``; a generator function if they make calls."""
+        fns = tuple(self.compile_stmt(s) for s in stmts)
+        if not fns:
+            return _nothing
+        if len(fns) == 1:
+            return fns[0]
+        if not _calls(stmts):
+            def block(env):
+                for fn in fns:
+                    result = fn(env)
+                    if result is not None:
+                        return result
+            return block
+        steps = tuple(zip(fns, map(makes_calls, stmts)))
+        def block_calls(env):
+            for fn, calls in steps:
+                if calls:
+                    result = yield from fn(env)
+                else:
+                    result = fn(env)
+                if result is not None:
+                    return result
+        return block_calls
+
+    def run_block(self, stmts, env):
+        return _value(_run(self.in_scope(None, self.compile_block, stmts), _calls(stmts), env))
+
+    # Statements
+
+    def compile_stmt(self, node):
+        if makes_calls(node):
+            compile_node = self.call_stmt_compilers.get(type(node))
+            if compile_node is not None:
+                return compile_node(node)
+            expr = self.compile_expr(node)
+            def expr_stmt_calls(env):
+                yield from expr(env)
+            return expr_stmt_calls
+        compile_node = self.stmt_compilers.get(type(node))
+        if compile_node is not None:
+            return compile_node(node)
+        expr = self.compile_expr(node)
+        def expr_stmt(env):
+            expr(env)
+        return expr_stmt
+
+    def compile_return(self, node):
+        expr = self.compile_expr(node.expr)
+        def return_(env):
+            return ('RETURN', expr(env))
+        return return_
+
+    def compile_return_calls(self, node):
+        if (isinstance(node.expr, Call) and node.expr.callee not in BUILTINS
+                and node.expr.callee not in CALLING_BUILTINS):
+            callee = node.expr.callee
+            function = self.function
+            bind, bind_calls = self.compile_bind(node.expr)
+            def return_call(env):
+                func = find_function(env, callee)
+                compiled = function(func)
+                if bind is not None and compiled.plain:
+                    frame = bind(env, func, compiled)
+                else:
+                    frame = yield from bind_calls(env, func, compiled)
+                if compiled.leaf:
+                    return ('RETURN', _value(compiled.body(frame)))
+                return _PendingCall(compiled.body(frame), frame)
+            return return_call
+        expr = self.compile_expr(node.expr)
+        def return_calls(env):
+            return ('RETURN', (yield from expr(env)))
+        return return_calls
+
+    def compile_doc(self, node):
+        store = self.compile_store(f'_doc_{getattr(node.stmt, "name", id(node.stmt))}')
+        text = node.text
+        inner = self.compile_stmt(node.stmt)
+        def doc(env):
+            store(env, text)
+            return inner(env)
+        return doc
+
+    def compile_doc_calls(self, node):
+        store = self.compile_store(f'_doc_{getattr(node.stmt, "name", id(node.stmt))}')
+        text = node.text
+        inner = self.compile_stmt(node.stmt)
+        def doc_calls(env):
+            store(env, text)
+            return (yield from inner(env))
+        return doc_calls
+
+    def compile_print(self, node):
+        exprs = tuple(self.compile_expr(e) for e in node.exprs)
+        if node.sep:
+            sep = self.compile_expr(node.sep)
+            def print_sep(env):
+                vals = [e(env) for e in exprs]
+                say(sep(env).join(str(v) for v in vals))
+            return print_sep
+        if len(exprs) == 1:
+            expr = exprs[0]
+            def print_one(env):
+                say(str(expr(env)))
+            return print_one
+        def print_many(env):
+            say(' '.join([str(e(env)) for e in exprs]))
+        return print_many
+
+    def compile_print_calls(self, node):
+        exprs = tuple(self.compile_expr_calls(e) for e in node.exprs)
+        sep = self.compile_expr_calls(node.sep) if node.sep else None
+        def print_calls(env):
+            vals = []
+            for e in exprs:
+                vals.append((yield from e(env)))
+            text = (yield from sep(env)) if sep is not None else ' '
+            say(text.join(str(v) for v in vals))
+        return print_calls
+
+    def compile_assign_op(self, node):
+        if not isinstance(node.left, Var):
+            def bad_target(env):
+                raise SyntaxError('Left side of assignment must be a variable')
+            return bad_target
+        load = self.compile_var(node.left)
+        op = ASSIGN_OPS.get(node.op)
+        if op is None:
+            bad_op = node.op
+            def unknown_op(env):
+                load(env)
+                raise SyntaxError(f'Unknown assignment operator {bad_op}')
+            return unknown_op
+        right = self.compile_expr(node.right)
+        name = node.left.name
+        slot = self.slot(name)
+        if slot is not None:
+            def assign_op_slot(env):
+                current = load(env)
+                env.slots[slot] = op(current, right(env))
+            return assign_op_slot
+        def assign_op(env):
+            current = load(env)
+            env[name] = op(current, right(env))
+        return assign_op
+
+    def compile_assign_op_calls(self, node):
+        if not isinstance(node.left, Var) or node.op not in ASSIGN_OPS:
+            # raises before the right side runs
+            return _generator(self.compile_assign_op(node))
+        load = self.compile_var(node.left)
+        op = ASSIGN_OPS[node.op]
+        right = self.compile_expr(node.right)
+        name = node.left.name
+        slot = self.slot(name)
+        if slot is not None:
+            def assign_op_slot_calls(env):
+                current = load(env)
+                env.slots[slot] = op(current, (yield from right(env)))
+            return assign_op_slot_calls
+        def assign_op_calls(env):
+            current = load(env)
+            env[name] = op(current, (yield from right(env)))
+        return assign_op_calls
+
+    def compile_foreach_dict(self, node):
+        iterable = self.compile_expr(node.iterable)
+        store_key = self.compile_store(node.key)
+        store_value = self.compile_store(node.value)
+        body = self.compile_block(node.body)
+        def foreach_dict(env):
+            d = iterable(env)
+            if not isinstance(d, dict):
+                raise TypeError('ForEachDict expects a dictionary')
+            for k, v in d.items():
+                store_key(env, k)
+                store_value(env, v)
+                result = body(env)
+                if result is not None:
+                    return result
+        return foreach_dict
+
+    def compile_foreach_dict_calls(self, node):
+        iterable = self.compile_expr_calls(node.iterable)
+        store_key = self.compile_store(node.key)
+        store_value = self.compile_store(node.value)
+        body = self.compile_block(node.body)
+        body_calls = _calls(node.body)
+        def foreach_dict_calls(env):
+            d = yield from iterable(env)
+            if not isinstance(d, dict):
+                raise TypeError('ForEachDict expects a dictionary')
+            for k, v in d.items():
+                store_key(env, k)
+                store_value(env, v)
+                if body_calls:
+                    result = yield from body(env)
+                else:
+                    result = body(env)
+                if result is not None:
+                    return result
+        return foreach_dict_calls
+
+    def compile_input(self, node):
+        prompt = self.compile_expr(node.prompt)
+        store = self.compile_store('_last_input')
+        def input_(env):
+            store(env, output.read_line(str(prompt(env))))
+        return input_
+
+    def compile_input_calls(self, node):
+        prompt = self.compile_expr_calls(node.prompt)
+        store = self.compile_store('_last_input')
+        def input_calls(env):
+            store(env, output.read_line(str((yield from prompt(env)))))
+        return input_calls
+
+    def compile_assign(self, node):
+        expr = self.compile_expr(node.expr)
+        name = node.name
+        slot = self.slot(name)
+        if slot is not None:
+            def assign_slot(env):
+                val = expr(env)
+                if hasattr(val, '__call__'):
+                    val.__name__ = name
+                env.slots[slot] = val
+            return assign_slot
+        def assign(env):
+            val = expr(env)
+            if hasattr(val, '__call__'):
+                val.__name__ = name
+            env[name] = val
+        return assign
+
+    def compile_assign_calls(self, node):
+        expr = self.compile_expr(node.expr)
+        name = node.name
+        slot = self.slot(name)
+        if slot is not None:
+            def assign_slot_calls(env):
+                val = yield from expr(env)
+                if hasattr(val, '__call__'):
+                    val.__name__ = name
+                env.slots[slot] = val
+            return assign_slot_calls
+        def assign_calls(env):
+            val = yield from expr(env)
+            if hasattr(val, '__call__'):
+                val.__name__ = name
+            env[name] = val
+        return assign_calls
+
+    def compile_if(self, node):
+        cond = self.compile_expr(node.cond)
+        body = self.compile_block(node.body)
+        if not node.else_body:
+            def if_(env):
+                if cond(env):
+                    return body(env)
+            return if_
+        else_body = self.compile_block(node.else_body)
+        def if_else(env):
+            if cond(env):
+                return body(env)
+            return else_body(env)
+        return if_else
+
+    def compile_if_calls(self, node):
+        cond = self.compile_expr_calls(node.cond)
+        body = self.compile_block(node.body)
+        body_calls = _calls(node.body)
+        else_body = self.compile_block(node.else_body or ())
+        else_calls = _calls(node.else_body or ())
+        def if_calls(env):
+            if (yield from cond(env)):
+                if body_calls:
+                    return (yield from body(env))
+                return body(env)
+            if else_calls:
+                return (yield from else_body(env))
+            return else_body(env)
+        return if_calls
+
+    def compile_foreach(self, node):
+        loop = self.compile_foreach_loop(node)
+        if not node.hoisted:
+            return loop
+        clears = tuple(self.compile_store(name) for name in node.hoisted)
+        def foreach_hoisted(env):
+            for clear in clears:
+                clear(env, UNSET)
+            return loop(env)
+        return foreach_hoisted
+
+    def compile_foreach_calls(self, node):
+        loop = self.compile_foreach_loop_calls(node)
+        if not node.hoisted:
+            return loop
+        clears = tuple(self.compile_store(name) for name in node.hoisted)
+        def foreach_hoisted_calls(env):
+            for clear in clears:
+                clear(env, UNSET)
+            return (yield from loop(env))
+        return foreach_hoisted_calls
+
+    def compile_foreach_loop(self, node):
+        iterable = self.compile_expr(node.iterable)
+        var = node.var
+        slot = self.slot(var)
+        body = self.compile_block(node.body)
+        if slot is not None:
+            def foreach_slot(env):
+                items = iterable(env)
+                if not hasattr(items, '__iter__'):
+                    raise TypeError(f"Object {items} is not iterable")
+                slots = env.slots
+                for item in items:
+                    slots[slot] = item
+                    result = body(env)
+                    if result is not None:
+                        return result
+            return foreach_slot
+        def foreach(env):
+            items = iterable(env)
+            if not hasattr(items, '__iter__'):
+                raise TypeError(f"Object {items} is not iterable")
+            for item in items:
+                env[var] = item
+                result = body(env)
+                if result is not None:
+                    return result
+        return foreach
+
+    def compile_foreach_loop_calls(self, node):
+        iterable = self.compile_expr_calls(node.iterable)
+        store = self.compile_store(node.var)
+        body = self.compile_block(node.body)
+        body_calls = _calls(node.body)
+        def foreach_calls(env):
+            items = yield from iterable(env)
+            if not hasattr(items, '__iter__'):
+                raise TypeError(f"Object {items} is not iterable")
+            for item in items:
+                store(env, item)
+                if body_calls:
+                    result = yield from body(env)
+                else:
+                    result = body(env)
+                if result is not None:
+                    return result
+        return foreach_calls
+
+    def compile_funcdef(self, node):
+        self.function(node)
+        store = self.compile_store(node.name)
+        def funcdef(env):
+            store(env, node)
+        return funcdef
+
+    def compile_call_stmt(self, node):
+        call = self.compile_call_expr(node)
+        def call_stmt(env):
+            call(env)
+        return call_stmt
+
+    def compile_call_stmt_calls(self, node):
+        call = self.compile_expr(node)
+        def call_stmt_calls(env):
+            yield from call(env)
+        return call_stmt_calls
+
+    def compile_import(self, node):
+        filename_expr = self.compile_expr(node.filename)
+        def import_(env):
+            import_module(filename_expr(env), env, self.run_module)
+        return import_
+
+    def run_module(self, module, env):
+        # Compiled once per parsed module; a reload produces new statements.
+        entry = self.modules.get(module.path)
+        if entry is None or entry[0] is not module.stmts:
+            block = self.in_scope(None, self.compile_block, module.stmts)
+            entry = self.modules[module.path] = (module.stmts, block, _calls(module.stmts))
+        _run(entry[1], entry[2], env)
+
+    def compile_trycatch(self, node):
+        try_body = self.compile_block(node.try_body)
+        catch_body = self.compile_block(node.catch_body)
+        def trycatch(env):
+            try:
+                return try_body(env)
+            except Exception:
+                return catch_body(env)
+        return trycatch
+
+    def compile_trycatch_calls(self, node):
+        try_body = self.compile_block(node.try_body)
+        try_calls = _calls(node.try_body)
+        catch_body = self.compile_block(node.catch_body)
+        catch_calls = _calls(node.catch_body)
+        def trycatch_calls(env):
+            try:
+                if try_calls:
+                    result = yield from try_body(env)
+                else:
+                    result = try_body(env)
+                if type(result) is _PendingCall:
+                    # made here, so that the handler sees the callee's errors
+                    result = ('RETURN', (yield result.body))
+                return result
+            except Exception:
+                if catch_calls:
+                    return (yield from catch_body(env))
+                return catch_body(env)
+        return trycatch_calls
+
+    # Expressions
+
+    def compile_expr(self, node):
+        """Closure evaluating ``node``; a generator function if it makes calls."""
+        if makes_calls(node):
+            compile_node = self.call_expr_compilers.get(type(node))
+        else:
+            compile_node = self.expr_compilers.get(type(node))
+        if compile_node is None:
+            def unknown(env):
+                raise TypeError(f"Unknown expression type {node}")
+            return unknown
+        return compile_node(node)
+
+    def compile_expr_calls(self, node):
+        """Generator function evaluating ``node``, whether it makes calls or not."""
+        expr = self.compile_expr(node)
+        return expr if makes_calls(node) else _generator(expr)
+
+    def compile_interpolation(self, node):
+        # Each piece becomes a constant, a slot read or a local lookup by
+        # name; only names bound in the current scope are substituted.
+        pieces = []
+        for i, part in enumerate(node.parts):
+            if i % 2 == 0:
+                if part:
+                    pieces.append(self.compile_literal(Literal(part)))
+            elif self.scope is not None and not self.scope.dynamic:
+                slot = self.scope.slot(part)
+                if slot is None:
+                    pieces.append(self.compile_literal(Literal('{' + part + '}')))
+                else:
+                    pieces.append(self.compile_placeholder_slot(part, slot))
+            else:
+                pieces.append(self.compile_placeholder_name(part))
+        pieces = tuple(pieces)
+        if len(pieces) == 1:
+            return pieces[0]
+        def interpolation(env):
+            return ''.join([piece(env) for piece in pieces])
+        return interpolation
+
+    def compile_placeholder_slot(self, name, slot):
+        placeholder = '{' + name + '}'
+        def placeholder_slot(env):
+            value = env.slots[slot]
+            return placeholder if value is UNSET else str(value)
+        return placeholder_slot
+
+    def compile_placeholder_name(self, name):
+        placeholder = '{' + name + '}'
+        def placeholder_name(env):
+            value = env.get(name, UNSET)
+            return placeholder if value is UNSET else str(value)
+        return placeholder_name
+
+    def compile_lambda(self, node):
+        scope = Scope(node.params, node.body, parent=self.scope)
+        names, size, param_slots = scope.names, scope.size, scope.param_slots
+        body = self.in_scope(scope, self.compile_block, node.body)
+        calls = _calls(node.body)
+        def make_lambda(env):
+            def _lambda(*args):
+                slots = [UNSET] * size
+                for slot, arg in zip(param_slots, args):
+                    slots[slot] = arg
+                return _value(_run(body, calls, Frame(names, slots, env)))
+            return _lambda
+        return make_lambda
+
+    def compile_literal(self, node):
+        value = node.value
+        def literal(env):
+            return value
+        return literal
+
+    def compile_list(self, node):
+        elements = tuple(self.compile_expr(e) for e in node.elements)
+        def list_(env):
+            return [e(env) for e in elements]
+        return list_
+
+    def compile_list_calls(self, node):
+        elements = tuple(self.compile_expr_calls(e) for e in node.elements)
+        def list_calls(env):
+            items = []
+            for e in elements:
+                items.append((yield from e(env)))
+            return items
+        return list_calls
+
+    def compile_dict(self, node):
+        pairs = tuple((self.compile_expr(k), self.compile_expr(v)) for k, v in node.pairs)
+        def dict_(env):
+            return {k(env): v(env) for k, v in pairs}
+        return dict_
+
+    def compile_dict_calls(self, node):
+        pairs = tuple((self.compile_expr_calls(k), self.compile_expr_calls(v))
+                      for k, v in node.pairs)
+        def dict_calls(env):
+            d = {}
+            for k, v in pairs:
+                key = yield from k(env)
+                d[key] = yield from v(env)
+            return d
+        return dict_calls
+
+    def resolve(self, node):
+        if self.scope is None or not isinstance(node, Var):
+            return None
+        return self.scope.lookup(node.name)
+
+    def compile_var(self, node):
+        name = node.name
+        resolved = self.resolve(node)
+        if resolved is None:
+            def var(env):
+                return env[name]
+            return var
+        depth, slot = resolved
+        # An unset slot means the name is not bound here yet, so the
+        # lookup falls back to the enclosing environments by name.
+        if depth == 0:
+            def var_local(env):
+                value = env.slots[slot]
+                if value is UNSET:
+                    return env[name]
+                return value
+            return var_local
+        def var_outer(env):
+            frame = env
+            for _ in range(depth):
+                frame = frame.outer
+            value = frame.slots[slot]
+            if value is UNSET:
+                return env[name]
+            return value
+        return var_outer
+
+    def compile_binop(self, node):
+        op = BINARY_OPS.get(node.op)
+        left = self.compile_expr(node.left)
+        right = self.compile_expr(node.right)
+        if op is None:
+            bad_op = node.op
+            def unknown_op(env):
+                left(env)
+                right(env)
+                raise ValueError(f"Unknown operator {bad_op}")
+            return unknown_op
+        # Specialise the common shapes so a node costs a single call.
+        left_slot = self.local_slot(node.left)
+        right_slot = self.local_slot(node.right)
+        left_name = self.global_name(node.left)
+        right_name = self.global_name(node.right)
+        if isinstance(node.right, Literal):
+            const = node.right.value
+            if left_slot is not None:
+                lname = node.left.name
+                def binop_slot_const(env):
+                    value = env.slots[left_slot]
+                    if value is UNSET:
+                        value = env[lname]
+                    return op(value, const)
+                return binop_slot_const
+            if left_name is not None:
+                def binop_name_const(env):
+                    return op(env[left_name], const)
+                return binop_name_const
+            def binop_const(env):
+                return op(left(env), const)
+            return binop_const
+        if left_slot is not None and right_slot is not None:
+            lname, rname = node.left.name, node.right.name
+            def binop_slot_slot(env):
+                slots = env.slots
+                lvalue = slots[left_slot]
+                if lvalue is UNSET:
+                    lvalue = env[lname]
+                rvalue = slots[right_slot]
+                if rvalue is UNSET:
+                    rvalue = env[rname]
+                return op(lvalue, rvalue)
+            return binop_slot_slot
+        if left_name is not None and right_name is not None:
+            def binop_name_name(env):
+                return op(env[left_name], env[right_name])
+            return binop_name_name
+        def binop(env):
+            return op(left(env), right(env))
+        return binop
+
+    def compile_binop_calls(self, node):
+        op = BINARY_OPS.get(node.op)
+        if op is None:
+            left = self.compile_expr_calls(node.left)
+            right = self.compile_expr_calls(node.right)
+            bad_op = node.op
+            def unknown_op_calls(env):
+                yield from left(env)
+                yield from right(env)
+                raise ValueError(f"Unknown operator {bad_op}")
+            return unknown_op_calls
+        left = self.compile_expr(node.left)
+        right = self.compile_expr(node.right)
+        if not makes_calls(node.left):
+            def binop_right_calls(env):
+                value = left(env)
+                return op(value, (yield from right(env)))
+            return binop_right_calls
+        if not makes_calls(node.right):
+            def binop_left_calls(env):
+                value = yield from left(env)
+                return op(value, right(env))
+            return binop_left_calls
+        def binop_calls(env):
+            value = yield from left(env)
+            return op(value, (yield from right(env)))
+        return binop_calls
+
+    def local_slot(self, node):
+        resolved = self.resolve(node)
+        if resolved is not None and resolved[0] == 0:
+            return resolved[1]
+        return None
+
+    def global_name(self, node):
+        if isinstance(node, Var) and self.resolve(node) is None:
+            return node.name
+        return None
+
+    def compile_hoisted(self, node):
+        expr = self.compile_expr(node.expr)
+        name = node.name
+        slot = self.slot(name)
+        if slot is not None:
+            def hoisted_slot(env):
+                slots = env.slots
+                value = slots[slot]
+                if value is UNSET:
+                    value = slots[slot] = expr(env)
+                return value
+            return hoisted_slot
+        def hoisted(env):
+            value = env.get(name, UNSET)
+            if value is UNSET:
+                value = env[name] = expr(env)
+            return value
+        return hoisted
+
+    def compile_hoisted_calls(self, node):
+        expr = self.compile_expr(node.expr)
+        name = node.name
+        slot = self.slot(name)
+        if slot is not None:
+            def hoisted_slot_calls(env):
+                slots = env.slots
+                value = slots[slot]
+                if value is UNSET:
+                    value = slots[slot] = yield from expr(env)
+                return value
+            return hoisted_slot_calls
+        def hoisted_calls(env):
+            value = env.get(name, UNSET)
+            if value is UNSET:
+                value = env[name] = yield from expr(env)
+            return value
+        return hoisted_calls
+
+    def compile_call_expr(self, node):
+        builtin = BUILTINS.get(node.callee)
+        if builtin is None:
+            return self.compile_call(node)
+        arity, func = builtin
+        if arity is None:
+            args = tuple(self.compile_expr(a) for a in node.args)
+            def builtin_varargs(env):
+                return func(*[a(env) for a in args])
+            return builtin_varargs
+        if len(node.args) < arity:
+            def missing_args(env):
+                raise IndexError('list index out of range')
+            return missing_args
+        args = tuple(self.compile_expr(a) for a in node.args[:arity])
+        if arity == 1:
+            arg = args[0]
+            def builtin_one(env):
+                return func(arg(env))
+            return builtin_one
+        def builtin_fixed(env):
+            return func(*[a(env) for a in args])
+        return builtin_fixed
+
+    def compile_call_expr_calls(self, node):
+        builtin = BUILTINS.get(node.callee)
+        if builtin is not None:
+            arity, func = builtin
+            if arity is not None and len(node.args) < arity:
+                return _generator(self.compile_call_expr(node))
+            args = tuple(self.compile_expr_calls(a)
+                         for a in (node.args if arity is None else node.args[:arity]))
+            def builtin_calls(env):
+                values = []
+                for a in args:
+                    values.append((yield from a(env)))
+                return func(*values)
+            return builtin_calls
+        calling_builtin = CALLING_BUILTINS.get(node.callee)
+        if calling_builtin is not None:
+            args = tuple(self.compile_expr_calls(a) for a in node.args)
+            def call_builtin(env):
+                values = []
+                for a in args:
+                    values.append((yield from a(env)))
+                return calling_builtin(env, *values)
+            return call_builtin
+        callee = node.callee
+        function = self.function
+        bind, bind_calls = self.compile_bind(node)
+        def call(env):
+            func = find_function(env, callee)
+            compiled = function(func)
+            if bind is not None and compiled.plain:
+                frame = bind(env, func, compiled)
+            else:
+                frame = yield from bind_calls(env, func, compiled)
+            if compiled.leaf:
+                return _value(compiled.body(frame))
+            return (yield compiled.body(frame))
+        return call
+
+    def compile_bind(self, node):
+        """Closures that bind the arguments of a call in a new frame.
+
+        ``bind(env, func, compiled)`` returns the frame, for plain arguments
+        and defaults; it is None if an argument of the call makes calls.
+        The generator function ``bind_calls`` takes any arguments.
+        """
+        callee = node.callee
+        args = tuple(self.compile_expr(a) for a in node.args)
+        arg_calls = tuple(makes_calls(a) for a in node.args)
+        nargs = len(args)
+        default_of = self.default
+        def bind(env, func, compiled):
+            slots = [UNSET] * compiled.scope.size
+            params = func.params
+            for i, slot in enumerate(compiled.param_slots):
+                if i < nargs:
+                    slots[slot] = args[i](env)
+                elif params[i] in func.defaults:
+                    slots[slot] = default_of(compiled, params[i])[0](env)
+                else:
+                    raise TypeError(f"Function {callee} missing required argument: {params[i]}")
+            if compiled.args_slot is not None:
+                slots[compiled.args_slot] = [a(env) for a in args[len(params):]]
+            frame = Frame(compiled.scope.names, slots, env)
+            frame.skip = call_skip(compiled.bound, env)
+            return frame
+        def bind_calls(env, func, compiled):
+            slots = [UNSET] * compiled.scope.size
+            params = func.params
+            for i, slot in enumerate(compiled.param_slots):
+                if i < nargs:
+                    if arg_calls[i]:
+                        slots[slot] = yield from args[i](env)
+                    else:
+                        slots[slot] = args[i](env)
+                elif params[i] in func.defaults:
+                    default, calls = default_of(compiled, params[i])
+                    if calls:
+                        slots[slot] = yield from default(env)
+                    else:
+                        slots[slot] = default(env)
+                else:
+                    raise TypeError(f"Function {callee} missing required argument: {params[i]}")
+            if compiled.args_slot is not None:
+                extra = []
+                for i in range(len(params), nargs):
+                    if arg_calls[i]:
+                        extra.append((yield from args[i](env)))
+                    else:
+                        extra.append(args[i](env))
+                slots[compiled.args_slot] = extra
+            frame = Frame(compiled.scope.names, slots, env)
+            frame.skip = call_skip(compiled.bound, env)
+            return frame
+        return (None if any(arg_calls) else bind), bind_calls
+
+    def default(self, compiled, pname):
+        """(closure, whether it makes calls) for the default of ``pname``,
+        evaluated in the caller's environment."""
+        default = compiled.defaults.get(pname)
+        if default is None:
+            node = compiled.node.defaults[pname]
+            default = compiled.defaults[pname] = (
+                self.in_scope(None, self.compile_expr, node), makes_calls(node))
+        return default
+
+def compile_program(stmts):
+    return Compiler().compile_program(stmts)
+
+def run_stream(stmts, env=None):
+    """Compile and run statements one at a time as the iterable yields them."""
+    return Compiler().run_stream(stmts, env)
@@ -0,0 +1,68 @@
+"""File built-ins for line-oriented scripts.
+
+- ``lines_of(path)`` is the lines of a text file, without their line
+  endings, for ``for each`` to go through. The file is read a chunk at a
+  time as the loop asks for lines, so memory use does not grow with the
+  file; every loop over it reads the file again from the start.
+- ``read_text(path)`` is the whole file as text.
+- ``write_lines(path, lines)`` writes every item of a list, or of
+  ``lines_of`` another file, as a line, replacing the file, and gives the
+  number of lines written.
+
+Files are UTF-8; ``\\r\\n`` line endings read as ``\\n``.
+"""
+from .rope import Rope
+
+# Characters read at a time by ``lines_of``, and buffered by ``write_lines``
+CHUNK_SIZE = 1 << 20
+
+class Lines:
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            # pieces of a line longer than a chunk, joined once it ends
+            pending = []
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                lines = chunk.split('\n')
+                if len(lines) == 1:
+                    pending.append(chunk)
+                    continue
+                if pending:
+                    pending.append(lines[0])
+                    lines[0] = ''.join(pending)
+                pending = [lines.pop()]
+                yield from lines
+            last = ''.join(pending)
+            if last:
+                yield last
+
+    def __repr__(self):
+        return f'<lines of {self.path}>'
+
+def lines_of(path):
+    return Lines(str(path))
+
+def read_text(path):
+    with open(str(path), 'r', encoding='utf-8') as f:
+        return f.read()
+
+def write_lines(path, lines):
+    if isinstance(lines, (str, Rope)):
+        raise TypeError('write_lines expects a list of lines, not text')
+    if not hasattr(lines, '__iter__'):
+        raise TypeError(f"Object {lines} is not iterable")
+    count = 0
+    with open(str(path), 'w', encoding='utf-8', buffering=CHUNK_SIZE) as f:
+        write = f.write
+        for line in lines:
+            write(str(line))
+            write('\n')
+            count += 1
+    return count
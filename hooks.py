@@ -0,0 +1,150 @@
+"""Execution events of the tree runtime, for instrumentation.
+
+``add(event, listener)`` registers a listener for one of ``EVENTS``:
+
+- ``'statement'``: ``listener(stmt, env)`` before each statement runs;
+- ``'call'``: ``listener(func, env)`` when the body of a Velion function
+  (a ``FuncDef``) or lambda (a ``Lambda``) starts, with its arguments
+  bound in ``env``;
+- ``'return'``: ``listener(func, value)`` when that body ends. ``value``
+  is ``TAIL_CALL`` when it ended by calling another function in tail
+  position, which starts right after, and ``RAISED`` when an exception
+  left it;
+- ``'exception'``: ``listener(exc, stmt, env)`` when the ``try`` statement
+  ``stmt`` catches ``exc``.
+
+Listeners run synchronously; an exception one raises propagates into the
+program. While an event has no listeners the runtime runs exactly the
+code it runs without this module: the first listener for an event puts an
+instrumented version of the runtime functions involved in place of the
+originals, and removing the last one puts the originals back. Functions
+already compiled by ``tiering`` emit calls and returns, but not their
+statements.
+"""
+import threading
+
+from . import runtime
+
+EVENTS = ('statement', 'call', 'return', 'exception')
+
+class _Marker:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+TAIL_CALL = _Marker('TAIL_CALL')
+RAISED = _Marker('RAISED')
+
+# event -> tuple of listeners, replaced whole so emitting needs no lock
+_listeners = {event: () for event in EVENTS}
+_lock = threading.Lock()
+# runtime functions replaced while 'statement' or 'call'/'return' listeners exist
+_originals = {}
+
+def add(event, listener):
+    if event not in EVENTS:
+        raise ValueError(f"Unknown event '{event}'")
+    with _lock:
+        _listeners[event] += (listener,)
+        _update()
+
+def remove(event, listener):
+    """Unregister ``listener``; raises ValueError if it was not added for ``event``."""
+    with _lock:
+        listeners = list(_listeners.get(event, ()))
+        listeners.remove(listener)
+        _listeners[event] = tuple(listeners)
+        _update()
+
+def clear():
+    with _lock:
+        for event in EVENTS:
+            _listeners[event] = ()
+        _update()
+
+def _update():
+    _swap(('exec_stmt', '_exec'), _statement_versions, bool(_listeners['statement']))
+    _swap(('_call_body', '_lambda_body'), _call_versions,
+          bool(_listeners['call'] or _listeners['return']))
+    runtime._caught = _emit_exception if _listeners['exception'] else None
+
+def _swap(names, make_versions, wanted):
+    installed = names[0] in _originals
+    if wanted and not installed:
+        originals = [getattr(runtime, name) for name in names]
+        for name, original, version in zip(names, originals, make_versions(*originals)):
+            _originals[name] = original
+            setattr(runtime, name, version)
+    elif installed and not wanted:
+        for name in names:
+            setattr(runtime, name, _originals.pop(name))
+
+def _emit_exception(exc, stmt, env):
+    for listener in _listeners['exception']:
+        listener(exc, stmt, env)
+
+def _statement_versions(exec_stmt, exec_gen):
+    def hooked_exec_stmt(stmt, env, local_vars):
+        for listener in _listeners['statement']:
+            listener(stmt, env)
+        return exec_stmt(stmt, env, local_vars)
+
+    def hooked_exec(stmt, env, local_vars):
+        for listener in _listeners['statement']:
+            listener(stmt, env)
+        return (yield from exec_gen(stmt, env, local_vars))
+
+    return hooked_exec_stmt, hooked_exec
+
+def _call_versions(call_body, lambda_body):
+    def started(func, env):
+        for listener in _listeners['call']:
+            listener(func, env)
+
+    def ended(func, value):
+        for listener in _listeners['return']:
+            listener(func, value)
+
+    def watched(func, body, env):
+        # the body of a call run by the driver, which starts it later
+        started(func, env)
+        try:
+            result = yield from body
+        except BaseException:
+            ended(func, RAISED)
+            raise
+        if type(result) is runtime._PendingCall:
+            ended(func, TAIL_CALL)
+        else:
+            ended(func, result[1] if result is not None else None)
+        return result
+
+    def hooked_call_body(func, plan, local_env):
+        if not plan.leaf:
+            pending = call_body(func, plan, local_env)
+            pending.body = watched(func, pending.body, local_env)
+            return pending
+        started(func, local_env)
+        try:
+            result = call_body(func, plan, local_env)
+        except BaseException:
+            ended(func, RAISED)
+            raise
+        ended(func, result[1] if result is not None else None)
+        return result
+
+    def hooked_lambda_body(node, env):
+        started(node, env)
+        try:
+            value = lambda_body(node, env)
+        except BaseException:
+            ended(node, RAISED)
+            raise
+        ended(node, value)
+        return value
+
+    return hooked_call_body, hooked_lambda_body
@@ -1,4 +1,6 @@
 import re
+from array import array
+from bisect import bisect_right
 
 TOKEN_SPEC = [
     ('NUMBER',   r'\d+(\.\d+)?'),
@@ -21,8 +23,175 @@ TOKEN_SPEC = [
     ('MISMATCH', r'.'),
 ]
 
+KEYWORD_NAMES = ('say', 'input', 'remember', 'if', 'then', 'end', 'for', 'each', 'in', 'do',
+                 'when', 'else', 'as', 'is', 'greater', 'less', 'than', 'not', 'and', 'or',
+                 'yes', 'no', 'return', 'length', 'to_number', 'to_string', 'get', 'try',
+                 'if_it_fails', 'lambda', 'exit', 'wait', 'clear', 'min', 'max', 'sort',
+                 'reverse', 'doc')
+
+# Integer token kinds for lex_stream(). Punctuation and every keyword get a
+# kind of their own (SAY, END, LPAREN, ...), so the parser never needs to
+# look at their text.
+KIND_NAMES = ['NUMBER', 'STRING', 'COMMENT', 'IDENT', 'COMPARE', 'CONCAT', 'PLUS', 'MINUS',
+              'MULT', 'DIV', 'LBRACE', 'RBRACE', 'COLON', 'LPAREN', 'RPAREN', 'COMMA',
+              'LBRACKET', 'RBRACKET', 'MISMATCH', 'EOF']
+for _kind, _name in enumerate(KIND_NAMES):
+    globals()[_name] = _kind
+FIRST_KEYWORD = len(KIND_NAMES)
+KEYWORDS = {}
+for _kind, _word in enumerate(KEYWORD_NAMES, FIRST_KEYWORD):
+    globals()[_word.upper()] = KEYWORDS[_word] = _kind
+PUNCT_KINDS = frozenset((LPAREN, RPAREN, COMMA, LBRACKET, RBRACKET))
+
+# (category, fixed text) of each kind, as the tuple tokens from lex() spell it
+KIND_INFO = [(name, None) for name in KIND_NAMES]
+for _kind, _text in ((LPAREN, '('), (RPAREN, ')'), (COMMA, ','), (LBRACKET, '['), (RBRACKET, ']')):
+    KIND_INFO[_kind] = ('PUNCT', _text)
+KIND_INFO += [('KEYWORD', word) for word in KEYWORD_NAMES]
+
 token_re = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_SPEC))
 
+# Same tokens as TOKEN_SPEC, but keywords come out of the IDENT rule and are
+# told apart with a dict lookup. Whitespace is skipped in front of each token
+# by the same match; group n holds a token of kind STREAM_SPEC[n - 1].
+STREAM_SPEC = [
+    (NUMBER,   r'\d+(?:\.\d+)?'),
+    (STRING,   r'"(?:[^"\\]|\\.)*"'),
+    (COMMENT,  r'#.*'),
+    (IDENT,    r'[A-Za-z_][A-Za-z0-9_]*'),
+    (COMPARE,  r'==|!=|<=|>=|<|>'),
+    (CONCAT,   r'\.\.'),
+    (PLUS,     r'\+'),
+    (MINUS,    r'-'),
+    (MULT,     r'\*'),
+    (DIV,      r'/'),
+    (LBRACE,   r'\{'),
+    (RBRACE,   r'\}'),
+    (COLON,    r':'),
+    (LPAREN,   r'\('),
+    (RPAREN,   r'\)'),
+    (COMMA,    r','),
+    (LBRACKET, r'\['),
+    (RBRACKET, r'\]'),
+    (MISMATCH, r'[^ \t\n]'),
+]
+stream_re = re.compile(r'[ \t\n]*(?:' + '|'.join(f'({pattern})' for _, pattern in STREAM_SPEC) + ')')
+GROUP_KINDS = [None] + [kind for kind, _ in STREAM_SPEC]
+
+class TokenStream:
+    """Tokens as parallel arrays of kinds and source offsets.
+
+    Token text is only sliced out of the source when ``value(i)`` asks for
+    it; string tokens give their contents without the quotes.
+    """
+    __slots__ = ('source', 'kinds', 'starts', 'ends', 'first_line', '_lines')
+
+    def __init__(self, source, kinds, starts, ends, first_line=1):
+        self.source = source
+        self.kinds = kinds
+        self.starts = starts
+        self.ends = ends
+        # line of the file that ``source`` starts on
+        self.first_line = first_line
+        self._lines = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def value(self, i):
+        kind, fixed = KIND_INFO[self.kinds[i]]
+        if fixed is not None:
+            return fixed
+        if kind == 'STRING':
+            return self.source[self.starts[i] + 1:self.ends[i] - 1]
+        return self.source[self.starts[i]:self.ends[i]]
+
+    def token(self, i):
+        """The ``(kind, value)`` tuple lex() gives for token ``i``."""
+        return (KIND_INFO[self.kinds[i]][0], self.value(i))
+
+    def tuples(self):
+        return [self.token(i) for i in range(len(self.kinds))]
+
+    def line(self, i):
+        """1-based line number token ``i`` starts on."""
+        if self._lines is None:
+            self._lines = [m.end() for m in re.finditer('\n', self.source)]
+        return bisect_right(self._lines, self.starts[i]) + self.first_line
+
+def _is_word(char):
+    return char == '_' or char.isalnum()
+
+def _scan(code):
+    kinds = array('B')
+    starts = array('I')
+    ends = array('I')
+    add_kind, add_start, add_end = kinds.append, starts.append, ends.append
+    keywords = KEYWORDS
+    for m in stream_re.finditer(code):
+        group = m.lastindex
+        kind = GROUP_KINDS[group]
+        start, end = m.span(group)
+        if kind == IDENT:
+            word = keywords.get(m.group(group))
+            # the keyword rule needs a word boundary on both sides, as \b
+            if word is not None and not (
+                    (start and _is_word(code[start - 1])) or
+                    (end < len(code) and _is_word(code[end]))):
+                kind = word
+        add_kind(kind)
+        add_start(start)
+        add_end(end)
+    return kinds, starts, ends
+
+def lex_stream(code):
+    kinds, starts, ends = _scan(code)
+    kinds.append(EOF)
+    starts.append(len(code))
+    ends.append(len(code))
+    return TokenStream(code, kinds, starts, ends)
+
+def _open_quote(stream):
+    """Index of a '"' that did not start a string token, or None."""
+    kinds = stream.kinds
+    i = -1
+    while True:
+        try:
+            i = kinds.index(MISMATCH, i + 1)
+        except ValueError:
+            return None
+        if stream.source[stream.starts[i]] == '"':
+            return i
+
+def lex_chunks(chunks):
+    """Lex source text that arrives in pieces, one piece at a time.
+
+    Yields a TokenStream without the EOF token for each run of complete
+    lines. Only a string literal can span lines; one still open at the end
+    of the text read so far is held back until its closing quote arrives.
+    """
+    pending = ''
+    open_string = False
+    for chunk in chunks:
+        pending += chunk
+        if open_string and '"' not in chunk:
+            continue
+        cut = pending.rfind('\n') + 1
+        if not cut:
+            continue
+        text, pending = pending[:cut], pending[cut:]
+        stream = TokenStream(text, *_scan(text))
+        quote = _open_quote(stream)
+        open_string = quote is not None
+        if open_string:
+            start = stream.starts[quote]
+            pending = text[start:] + pending
+            stream = TokenStream(text[:start], stream.kinds[:quote],
+                                 stream.starts[:quote], stream.ends[:quote])
+        yield stream
+    if pending:
+        yield TokenStream(pending, *_scan(pending))
+
 def lex(code):
     pos = 0
     tokens = []
@@ -0,0 +1,114 @@
+"""Process-wide registry of modules loaded with ``get``.
+
+Each file is read and parsed once per process (through the ``.vlc`` cache);
+later ``get`` statements for the same file reuse the parsed program and only
+run it in the calling environment, which is what makes its definitions
+visible there. With ``check_mtime`` on, a file that changed on disk is
+parsed again. A module that is already being run further up the ``get``
+chain is not entered again, so modules that get each other terminate.
+"""
+import os
+import threading
+import time
+
+from .cache import load_program
+from .output import say
+
+class Module:
+    __slots__ = ('path', 'stmts', 'mtime', 'size', 'load_time', 'loads', 'uses')
+
+    def __init__(self, path):
+        self.path = path
+        self.stmts = None
+        self.mtime = None
+        self.size = None
+        self.load_time = 0.0
+        self.loads = 0
+        self.uses = 0
+
+class ModuleRegistry:
+    def __init__(self, check_mtime=False):
+        self.check_mtime = check_mtime
+        self.modules = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def load(self, filename):
+        path = os.path.abspath(filename)
+        with self.lock:
+            module = self.modules.get(path)
+            if module is None:
+                module = self.modules[path] = Module(path)
+            if module.stmts is None or (self.check_mtime and self.changed(module)):
+                self.parse(module)
+            module.uses += 1
+        return module
+
+    def changed(self, module):
+        try:
+            st = os.stat(module.path)
+        except OSError:
+            return True
+        return (st.st_mtime_ns, st.st_size) != (module.mtime, module.size)
+
+    def parse(self, module):
+        start = time.perf_counter()
+        st = os.stat(module.path)
+        from . import optimizer
+        module.stmts = load_program(module.path)
+        if optimizer.enabled:
+            module.stmts = optimizer.optimize(module.stmts)
+        module.mtime, module.size = st.st_mtime_ns, st.st_size
+        module.load_time += time.perf_counter() - start
+        module.loads += 1
+
+    def enter(self, module):
+        """Mark ``module`` as running; False if it is already running (a cycle)."""
+        running = getattr(self.local, 'running', None)
+        if running is None:
+            running = self.local.running = []
+        if module.path in running:
+            return False
+        running.append(module.path)
+        return True
+
+    def leave(self, module):
+        self.local.running.remove(module.path)
+
+    def report(self):
+        with self.lock:
+            return [
+                {
+                    'path': m.path,
+                    'load_ms': round(m.load_time * 1000, 3),
+                    'loads': m.loads,
+                    'uses': m.uses,
+                }
+                for m in self.modules.values() if m.loads
+            ]
+
+    def clear(self):
+        with self.lock:
+            self.modules.clear()
+
+registry = ModuleRegistry(check_mtime=bool(os.environ.get('VELION_RELOAD_MODULES')))
+
+def loaded_modules():
+    return registry.report()
+
+def import_module(filename, env, execute):
+    """Run the module ``filename`` in ``env`` with ``execute(module, env)``.
+
+    Shared by every engine's handling of ``get``.
+    """
+    if not filename.endswith('.vl'):
+        filename += '.vl'
+    try:
+        module = registry.load(filename)
+        if registry.enter(module):
+            try:
+                execute(module, env)
+            finally:
+                registry.leave(module)
+    except Exception as e:
+        say(f"Erro ao importar {filename}: {e}")
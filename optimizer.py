@@ -0,0 +1,273 @@
+"""AST optimization pass run between parsing and execution.
+
+``optimize(stmts)`` returns an equivalent program in which
+
+- operators whose operands are all literals are folded into a ``Literal``
+  (unless evaluating them raises, so the error still happens at run time);
+- ``if`` statements with a constant condition are replaced by the branch
+  that runs;
+- pure expressions inside a ``for each`` body that do not depend on
+  anything the body assigns become ``Hoisted`` nodes, which every engine
+  evaluates at most once per run of the loop.
+
+The input statements are not modified. Every engine runs the result.
+"""
+import os
+
+from .ast_nodes import *
+from .rope import flatten
+from .runtime import BINARY_OPS
+
+# Turned off by `--no-optimize` or VELION_NO_OPTIMIZE=1.
+enabled = not os.environ.get('VELION_NO_OPTIMIZE')
+
+# Folded strings longer than this stay as expressions, as in CPython's
+# peephole optimizer, so that constants cannot blow up the program size.
+MAX_FOLDED_LENGTH = 4096
+
+def assigned_names(stmts, names=None):
+    """Names ``stmts`` may bind in their own scope, or None after a ``get``."""
+    if names is None:
+        names = set()
+    for stmt in stmts:
+        if isinstance(stmt, Assign):
+            names.add(stmt.name)
+        elif isinstance(stmt, AssignOp):
+            if isinstance(stmt.left, Var):
+                names.add(stmt.left.name)
+        elif isinstance(stmt, ForEach):
+            names.add(stmt.var)
+            if assigned_names(stmt.body, names) is None:
+                return None
+        elif isinstance(stmt, ForEachDict):
+            names.update((stmt.key, stmt.value))
+            if assigned_names(stmt.body, names) is None:
+                return None
+        elif isinstance(stmt, If):
+            if (assigned_names(stmt.body, names) is None or
+                    assigned_names(stmt.else_body or (), names) is None):
+                return None
+        elif isinstance(stmt, TryCatch):
+            if (assigned_names(stmt.try_body, names) is None or
+                    assigned_names(stmt.catch_body, names) is None):
+                return None
+        elif isinstance(stmt, FuncDef):
+            names.add(stmt.name)
+        elif isinstance(stmt, Input):
+            names.add('_last_input')
+        elif isinstance(stmt, Doc):
+            names.add(f'_doc_{getattr(stmt.stmt, "name", id(stmt.stmt))}')
+            if assigned_names([stmt.stmt], names) is None:
+                return None
+        elif isinstance(stmt, Import):
+            return None
+    return names
+
+class Optimizer:
+    def __init__(self):
+        self.hoisted = 0
+
+    # Statements
+
+    def block(self, stmts):
+        result = []
+        for stmt in stmts:
+            result.extend(self.stmt(stmt))
+        return result
+
+    def stmt(self, node):
+        """Optimized replacement for ``node``, as a list of statements."""
+        if isinstance(node, If):
+            cond = self.expr(node.cond)
+            body = self.block(node.body)
+            else_body = self.block(node.else_body) if node.else_body else None
+            if isinstance(cond, Literal):
+                taken = body if cond.value else else_body
+                return taken or []
+            return [copy_line(If(cond, body, else_body), node)]
+        return [self.single(node)]
+
+    def single(self, node):
+        return copy_line(self.rebuild(node), node)
+
+    def rebuild(self, node):
+        if isinstance(node, Return):
+            return Return(self.expr(node.expr))
+        if isinstance(node, Doc):
+            return Doc(node.text, self.single(node.stmt))
+        if isinstance(node, If):
+            return If(self.expr(node.cond), self.block(node.body),
+                      self.block(node.else_body) if node.else_body else None)
+        if isinstance(node, Print):
+            return Print([self.expr(e) for e in node.exprs],
+                         self.expr(node.sep) if node.sep else node.sep)
+        if isinstance(node, Assign):
+            return Assign(node.name, self.expr(node.expr))
+        if isinstance(node, AssignOp):
+            return AssignOp(node.left, node.op, self.expr(node.right))
+        if isinstance(node, ForEach):
+            return ForEach(node.var, self.expr(node.iterable), self.block(node.body))
+        if isinstance(node, ForEachDict):
+            return ForEachDict(node.key, node.value, self.expr(node.iterable), self.block(node.body))
+        if isinstance(node, TryCatch):
+            return TryCatch(self.block(node.try_body), self.block(node.catch_body))
+        if isinstance(node, FuncDef):
+            return FuncDef(node.name, node.params, self.block(node.body),
+                           node.defaults, node.variadic)
+        if isinstance(node, Input):
+            return Input(self.expr(node.prompt))
+        if isinstance(node, Import):
+            return Import(self.expr(node.filename))
+        if isinstance(node, Spawn):
+            return Spawn(self.expr(node.call))
+        return self.expr(node)
+
+    # Expressions
+
+    def expr(self, node):
+        if isinstance(node, BinOp):
+            left, right = self.expr(node.left), self.expr(node.right)
+            if isinstance(left, Literal) and isinstance(right, Literal):
+                folded = self.fold(node.op, left.value, right.value)
+                if folded is not None:
+                    return folded
+            return BinOp(left, node.op, right)
+        if isinstance(node, StringInterpolation):
+            if len(node.parts) == 1:
+                return Literal(node.parts[0])
+            return node
+        if isinstance(node, ListLiteral):
+            return ListLiteral([self.expr(e) for e in node.elements])
+        if isinstance(node, DictLiteral):
+            return DictLiteral([(self.expr(k), self.expr(v)) for k, v in node.pairs])
+        if isinstance(node, Call):
+            return Call(node.callee, [self.expr(a) for a in node.args])
+        if isinstance(node, Lambda):
+            return Lambda(node.params, self.block(node.body))
+        return node
+
+    def fold(self, op, left, right):
+        func = BINARY_OPS.get(op)
+        if func is None:
+            return None
+        try:
+            value = flatten(func(left, right))
+        except Exception:
+            return None
+        if not isinstance(value, (bool, int, float, str)):
+            return None
+        if isinstance(value, str) and len(value) > MAX_FOLDED_LENGTH:
+            return None
+        return Literal(value)
+
+    # Loop-invariant hoisting, outermost loops first so that an expression
+    # is cached by the outermost loop it is invariant in. Works in place on
+    # the nodes the passes above created.
+
+    def hoist_loops(self, stmts):
+        for stmt in stmts:
+            while isinstance(stmt, Doc):
+                stmt = stmt.stmt
+            if isinstance(stmt, ForEach):
+                self.hoist(stmt)
+                self.hoist_loops(stmt.body)
+            elif isinstance(stmt, (ForEachDict, FuncDef, Lambda)):
+                self.hoist_loops(stmt.body)
+            elif isinstance(stmt, If):
+                self.hoist_loops(stmt.body)
+                self.hoist_loops(stmt.else_body or ())
+            elif isinstance(stmt, TryCatch):
+                self.hoist_loops(stmt.try_body)
+                self.hoist_loops(stmt.catch_body)
+        return stmts
+
+    def hoist(self, loop):
+        assigned = assigned_names(loop.body)
+        if assigned is None:
+            # `get` can bind any name
+            return loop
+        assigned.add(loop.var)
+        names = []
+        loop.body = [self.hoist_stmt(s, assigned, names) for s in loop.body]
+        loop.hoisted = tuple(names)
+        return loop
+
+    def hoist_stmt(self, node, assigned, names):
+        return copy_line(self.hoist_rebuild(node, assigned, names), node)
+
+    def hoist_rebuild(self, node, assigned, names):
+        def block(stmts):
+            return [self.hoist_stmt(s, assigned, names) for s in stmts]
+        def expr(e):
+            return self.hoist_expr(e, assigned, names)
+        if isinstance(node, Return):
+            return Return(expr(node.expr))
+        if isinstance(node, Doc):
+            return Doc(node.text, self.hoist_stmt(node.stmt, assigned, names))
+        if isinstance(node, Print):
+            return Print([expr(e) for e in node.exprs], expr(node.sep) if node.sep else node.sep)
+        if isinstance(node, Assign):
+            return Assign(node.name, expr(node.expr))
+        if isinstance(node, AssignOp):
+            return AssignOp(node.left, node.op, expr(node.right))
+        if isinstance(node, If):
+            return If(expr(node.cond), block(node.body),
+                      block(node.else_body) if node.else_body else None)
+        if isinstance(node, ForEach):
+            return ForEach(node.var, expr(node.iterable), block(node.body), node.hoisted)
+        if isinstance(node, ForEachDict):
+            return ForEachDict(node.key, node.value, expr(node.iterable), block(node.body))
+        if isinstance(node, TryCatch):
+            return TryCatch(block(node.try_body), block(node.catch_body))
+        if isinstance(node, Input):
+            return Input(expr(node.prompt))
+        if isinstance(node, Spawn):
+            return Spawn(expr(node.call))
+        # function and lambda bodies run in scopes of their own
+        if isinstance(node, (FuncDef, Lambda, Import)):
+            return node
+        return expr(node)
+
+    def hoist_expr(self, node, assigned, names):
+        if self.invariant(node, assigned):
+            if isinstance(node, (BinOp, StringInterpolation)):
+                name = f'$hoisted{self.hoisted}'
+                self.hoisted += 1
+                names.append(name)
+                return Hoisted(name, node)
+            return node
+        if isinstance(node, BinOp):
+            return BinOp(self.hoist_expr(node.left, assigned, names), node.op,
+                         self.hoist_expr(node.right, assigned, names))
+        if isinstance(node, ListLiteral):
+            return ListLiteral([self.hoist_expr(e, assigned, names) for e in node.elements])
+        if isinstance(node, DictLiteral):
+            return DictLiteral([(self.hoist_expr(k, assigned, names),
+                                 self.hoist_expr(v, assigned, names)) for k, v in node.pairs])
+        if isinstance(node, Call):
+            return Call(node.callee, [self.hoist_expr(a, assigned, names) for a in node.args])
+        return node
+
+    def invariant(self, node, assigned):
+        """True if ``node`` is pure and reads nothing in ``assigned``."""
+        if isinstance(node, Literal):
+            return True
+        if isinstance(node, Hoisted):
+            return self.invariant(node.expr, assigned)
+        if isinstance(node, Var):
+            return node.name not in assigned
+        if isinstance(node, BinOp):
+            return (node.op in BINARY_OPS and self.invariant(node.left, assigned)
+                    and self.invariant(node.right, assigned))
+        if isinstance(node, StringInterpolation):
+            return not any(name in assigned for name in node.parts[1::2])
+        return False
+
+def optimize(stmts):
+    optimizer = Optimizer()
+    return optimizer.hoist_loops(optimizer.block(stmts))
+
+def optimize_stream(stmts):
+    """Optimize statements one at a time as the iterable yields them."""
+    for stmt in stmts:
+        yield from optimize([stmt])
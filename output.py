@@ -0,0 +1,98 @@
+"""Buffered output for ``say``.
+
+Every engine hands the lines ``say`` prints to ``say()``, which collects
+them and writes them to ``sys.stdout`` in large pieces instead of paying
+for a ``print`` call per line. When collected lines are written depends on
+the policy:
+
+- ``line``: every line as it is said, like ``print`` (the default when
+  stdout is a terminal);
+- ``block``: each time ``BLOCK_SIZE`` characters have been collected (the
+  default otherwise);
+- ``full``: only at the points below, or past ``FULL_SIZE`` characters.
+
+Whatever the policy, what has been collected is written and stdout flushed
+before ``input`` reads, ``wait`` waits and ``clear`` clears the screen, and
+when a program ends, with an error or ``exit`` too. Lines are collected per
+thread, so programs running in several threads do not mix their output.
+
+``--output-buffering`` or ``VELION_OUTPUT_BUFFERING=line|block|full`` sets
+the policy.
+"""
+import os
+import sys
+import threading
+
+BLOCK_SIZE = 1 << 16
+FULL_SIZE = 1 << 24
+
+# policy -> characters collected before they are written
+POLICIES = {'line': 0, 'block': BLOCK_SIZE, 'full': FULL_SIZE}
+
+class _Pending:
+    __slots__ = ('lines', 'size')
+
+    def __init__(self):
+        self.lines = []
+        self.size = 0
+
+_local = threading.local()
+
+policy = None
+_limit = 0
+
+def set_policy(name=None):
+    """Use the policy ``name``; None picks the default for the real stdout."""
+    global policy, _limit
+    if name is None:
+        stream = sys.__stdout__
+        name = 'line' if stream is not None and stream.isatty() else 'block'
+    if name not in POLICIES:
+        raise ValueError(f"Unknown output buffering '{name}'")
+    flush()
+    policy, _limit = name, POLICIES[name]
+
+def say(text):
+    """Print the line ``text``."""
+    try:
+        pending = _local.pending
+    except AttributeError:
+        pending = _local.pending = _Pending()
+    pending.lines.append(text)
+    pending.size += len(text)
+    if pending.size >= _limit:
+        _write(pending)
+
+def _write(pending):
+    lines = pending.lines
+    pending.lines, pending.size = [], 0
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+def flush():
+    """Write the lines this thread has collected and flush stdout."""
+    pending = getattr(_local, 'pending', None)
+    if pending is not None and pending.lines:
+        _write(pending)
+    if sys.stdout is not None:
+        sys.stdout.flush()
+
+def write(text):
+    """Write ``text``, which holds whole lines, after those said so far."""
+    pending = getattr(_local, 'pending', None)
+    if pending is not None and pending.lines:
+        _write(pending)
+    sys.stdout.write(text)
+
+def read_line(prompt):
+    """``input(prompt)``, once what was said before it is on the screen."""
+    flush()
+    return input(prompt)
+
+def _forget():
+    # lines collected before a fork are the parent's to write
+    _local.pending = _Pending()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget)
+
+set_policy(os.environ.get('VELION_OUTPUT_BUFFERING') or None)
@@ -0,0 +1,217 @@
+"""``parallel_map`` and ``parallel_each``: calls to a Velion function spread
+over worker processes.
+
+``parallel_map(fn, items)`` is the list of ``fn(item)`` for every item, in
+order; ``parallel_each(fn, items)`` calls ``fn`` on every item for what it
+does and gives nothing back. An optional third argument is the number of
+items sent to a worker at a time (by default about four chunks per
+worker).
+
+A worker gets a pickled copy of ``fn`` and of what it can see: the
+variables it reads and, transitively, the functions it calls, as found
+where the built-in is called, which each worker loads once per call.
+Assignments it makes to those copies do not reach the program. What ``fn``
+prints in a worker is printed by the program when its chunk comes back, so
+the output is in item order; after an error, up to the failing item.
+
+Lists shorter than ``min_items`` run in the calling process, one item
+after another, like a ``for each`` loop would; so do lambdas, functions
+that see values which cannot be pickled, and calls made from a worker.
+"""
+import contextlib
+import io
+import itertools
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from . import output
+from .ast_nodes import *
+
+# Worker processes: VELION_WORKERS=N, one per CPU by default
+workers = int(os.environ.get('VELION_WORKERS') or 0) or os.cpu_count() or 1
+
+# Shorter lists are not worth the round trips to the workers
+min_items = 64
+
+# Chunks per worker when the program does not give a chunk size
+CHUNKS_PER_WORKER = 4
+
+_pool = None
+# tells the payloads of calls apart in the workers
+_keys = itertools.count()
+# set in worker processes, which do not start workers of their own
+_in_worker = False
+
+def parallel_map(env, fn, items, chunk_size=None):
+    return _run(env, fn, items, chunk_size, True)
+
+def parallel_each(env, fn, items, chunk_size=None):
+    _run(env, fn, items, chunk_size, False)
+
+def _run(env, fn, items, chunk_size, keep):
+    from .runtime import call_function
+    if not hasattr(items, '__iter__'):
+        raise TypeError(f"Object {items} is not iterable")
+    items = list(items)
+    if chunk_size is not None:
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError('Chunk size must be at least 1')
+    payload = None
+    if not _in_worker and workers > 1 and len(items) >= min_items and isinstance(fn, FuncDef):
+        try:
+            payload = pack(fn, env)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            payload = None
+    if payload is None:
+        results = [call_function(fn, (item,), env) for item in items]
+        return results if keep else None
+
+    if chunk_size is None:
+        chunk_size = -(-len(items) // (workers * CHUNKS_PER_WORKER))
+    pool = _get_pool()
+    # the payload goes through a file, so that each worker reads it once
+    # instead of it being sent again with every chunk
+    fd, path = tempfile.mkstemp(prefix='velion-', suffix='.payload')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        key = (next(_keys), path)
+        futures = [pool.submit(_run_chunk, key, items[i:i + chunk_size], keep)
+                   for i in range(0, len(items), chunk_size)]
+        results = []
+        try:
+            for future in futures:
+                values, text, error = future.result()
+                # what the chunk printed before an error is printed too
+                if text:
+                    output.write(text)
+                if error is not None:
+                    raise error
+                if keep:
+                    results.extend(values)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    finally:
+        os.remove(path)
+    return results if keep else None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        from . import tiering
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                    initargs=(tiering.threshold,))
+    return _pool
+
+def _init_worker(threshold):
+    global _in_worker
+    from . import tiering
+    _in_worker = True
+    tiering.threshold = threshold
+    # what a chunk prints is sent back in one piece anyway
+    output.set_policy('full')
+
+# Shipping functions
+
+def captures(func, env):
+    """Values, looked up from ``env``, of the names ``func`` reads or calls
+    and of those the functions among them read or call."""
+    from .runtime import lookup
+    captured = {}
+    pending, seen = [func], set()
+    while pending:
+        node = pending.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        for name in _names(node):
+            if name in captured:
+                continue
+            try:
+                value = captured[name] = lookup(env, name)
+            except NameError:
+                continue
+            if isinstance(value, FuncDef):
+                pending.append(value)
+    return captured
+
+def _names(func):
+    """Names a FuncDef reads or calls, other than its parameters."""
+    from .runtime import BUILTINS, _children
+    names = set()
+    pending = [*func.body, *func.defaults.values()]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, Var):
+            names.add(node.name)
+        elif isinstance(node, Call) and node.callee not in BUILTINS:
+            names.add(node.callee)
+        if isinstance(node, (FuncDef, Lambda)):
+            pending.extend(node.body)
+        elif isinstance(node, Hoisted):
+            pending.append(node.expr)
+        else:
+            pending.extend(_children(node))
+    return names - set(func.params)
+
+class _Pickler(pickle.Pickler):
+    # AST nodes carry caches the runtime adds under names starting with
+    # '_' (call plans, call sites), which are not needed and not picklable
+    def reducer_override(self, obj):
+        if isinstance(obj, Node):
+            state = {name: getattr(obj, name) for name in _fields(type(obj))
+                     if hasattr(obj, name)}
+            return _node, (type(obj), state)
+        return NotImplemented
+
+def _fields(cls):
+    return [name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ())
+            if not name.startswith('_')]
+
+def _node(cls, state):
+    node = cls.__new__(cls)
+    for name, value in state.items():
+        setattr(node, name, value)
+    return node
+
+def pack(func, env):
+    """``func`` and what it captures from ``env``, pickled for a worker."""
+    buffer = io.BytesIO()
+    _Pickler(buffer, pickle.HIGHEST_PROTOCOL).dump((func, captures(func, env)))
+    return buffer.getvalue()
+
+# In the worker
+
+# (key, FuncDef, captured values) of the last payload loaded
+_unpacked = (None, None, None)
+
+def _run_chunk(key, chunk, keep):
+    """(values or None, printed text, error or None) of running a chunk.
+
+    ``key`` is (number of the call, path of its payload file).
+    """
+    global _unpacked
+    from .runtime import Environment, call_function
+    if _unpacked[0] != key:
+        with open(key[1], 'rb') as f:
+            _unpacked = (key, *pickle.load(f))
+    _, func, captured = _unpacked
+    # names the function assigns do not carry over to the next chunk
+    env = Environment()
+    env.update(captured)
+    buffer = io.StringIO()
+    values, error = [], None
+    with contextlib.redirect_stdout(buffer):
+        try:
+            for item in chunk:
+                values.append(call_function(func, (item,), env))
+        except BaseException as exc:
+            error = exc
+        finally:
+            output.flush()
+    return (values if keep else None), buffer.getvalue(), error
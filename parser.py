@@ -1,403 +1,489 @@
-from .lexer import lex
+from array import array
+
+from .lexer import *
 from .ast_nodes import *
 
+# Binding power and operator text of each infix operator kind; comparison
+# operators take their text from the token.
+INFIX_OPERATORS = {
+    CONCAT: (1, '..'),
+    COMPARE: (2, None),
+    PLUS: (3, '+'), MINUS: (3, '-'),
+    MULT: (4, '*'), DIV: (4, '/'),
+}
+
+# Words after `is` in a condition, up to the first 'than' or 'not'.
+CONDITION_OPERATORS = {
+    'greater than': '>',
+    'less than': '<',
+    'greater than or equal to': '>=',
+    'less than or equal to': '<=',
+    'equal to': '==',
+    'not equal to': '!=',
+    'not greater than': '<=',
+    'not less than': '>=',
+}
+
+# Keywords that name built-in functions; followed by '(' they are calls.
+BUILTIN_KEYWORDS = (LENGTH, TO_NUMBER, TO_STRING, EXIT, WAIT, CLEAR, MIN, MAX, SORT, REVERSE)
+
 class Parser:
+    """Recursive-descent parser over a ``lexer.TokenStream``.
+
+    ``Parser(lex_stream(code)).parse()`` returns the program's statements.
+    """
     def parse_add_to(self):
-        self.consume('KEYWORD', 'add')
+        self.consume_word('add')
         value = self.parse_expr()
-        self.consume('KEYWORD', 'to')
-        var_token = self.consume('IDENT')
+        self.consume_word('to')
+        var_token = self.consume(IDENT)
         return AssignOp(Var(var_token[1]), 'add', value)
 
     def parse_subtract_from(self):
-        self.consume('KEYWORD', 'subtract')
+        self.consume_word('subtract')
         value = self.parse_expr()
-        self.consume('KEYWORD', 'from')
-        var_token = self.consume('IDENT')
+        self.consume_word('from')
+        var_token = self.consume(IDENT)
         return AssignOp(Var(var_token[1]), 'subtract', value)
 
     def parse_multiply_by(self):
-        self.consume('KEYWORD', 'multiply')
-        var_token = self.consume('IDENT')
-        self.consume('KEYWORD', 'by')
+        self.consume_word('multiply')
+        var_token = self.consume(IDENT)
+        self.consume_word('by')
         value = self.parse_expr()
         return AssignOp(Var(var_token[1]), 'multiply', value)
 
     def parse_divide_by(self):
-        self.consume('KEYWORD', 'divide')
-        var_token = self.consume('IDENT')
-        self.consume('KEYWORD', 'by')
+        self.consume_word('divide')
+        var_token = self.consume(IDENT)
+        self.consume_word('by')
         value = self.parse_expr()
         return AssignOp(Var(var_token[1]), 'divide', value)
     def __init__(self, tokens):
         self.tokens = tokens
+        self.kinds = tokens.kinds
+        self.source = tokens.source
+        self.starts = tokens.starts
+        self.ends = tokens.ends
         self.pos = 0
 
     def peek(self):
-        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+        return self.kinds[self.pos]
 
     def peek_ahead(self, n):
-        if self.pos + n < len(self.tokens):
-            return self.tokens[self.pos + n]
-        return ('EOF', '')
+        if self.pos + n < len(self.kinds):
+            return self.kinds[self.pos + n]
+        return EOF
+
+    def value(self):
+        return self.tokens.value(self.pos)
+
+    def text(self, i):
+        return self.source[self.starts[i]:self.ends[i]]
 
     def advance(self):
         self.pos += 1
-        return self.tokens[self.pos -1]
-
-    def match(self, *kinds):
-        tk = self.peek()
-        if tk and tk[0] in kinds:
-            return self.advance()
-        return None
-
-    def consume(self, kind, value=None):
-        tk = self.peek()
-        if not tk or tk[0] != kind or (value is not None and tk[1] != value):
-            raise SyntaxError(f"Expected {kind} {value if value else ''}, got {tk}")
+        return self.tokens.token(self.pos - 1)
+
+    def at_word(self, word):
+        # Keyword-only spelling check, for words the lexer has no kind for.
+        kind = self.kinds[self.pos]
+        return kind >= FIRST_KEYWORD and KEYWORD_NAMES[kind - FIRST_KEYWORD] == word
+
+    def error(self, kind, value):
+        got = self.tokens.token(self.pos)
+        return SyntaxError(f"Expected {kind} {value if value else ''}, got {got}")
+
+    def consume(self, kind):
+        """Consume a token of ``kind``; returns it as a ``(kind, value)`` tuple."""
+        if self.kinds[self.pos] != kind:
+            raise self.error(*KIND_INFO[kind])
         return self.advance()
 
+    def expect(self, kind):
+        # consume() without building the token
+        if self.kinds[self.pos] != kind:
+            raise self.error(*KIND_INFO[kind])
+        self.pos += 1
+
+    def consume_word(self, word):
+        if not self.at_word(word):
+            raise self.error('KEYWORD', word)
+        self.pos += 1
+
     def parse(self):
         stmts = []
-        while self.peek()[0] != 'EOF':
+        while self.kinds[self.pos] != EOF:
             stmts.append(self.parse_stmt())
         return stmts
 
     def parse_stmt(self):
-        tk = self.peek()
-        if tk[0] == 'KEYWORD':
-            if tk[1] == 'lambda' or (tk[1] == 'do' and self.peek_ahead(1)[0] == 'PUNCT' and self.peek_ahead(2)[0] == 'IDENT'):
-                return self.parse_lambda()
-            if tk[1] == 'doc':
-                return self.parse_doc()
-            if tk[1] == 'try':
-                return self.parse_trycatch()
-            if tk[1] == 'say':
-                return self.parse_print()
-            elif tk[1] == 'add':
-                return self.parse_add_to()
-            elif tk[1] == 'subtract':
-                return self.parse_subtract_from()
-            elif tk[1] == 'multiply':
-                return self.parse_multiply_by()
-            elif tk[1] == 'divide':
-                return self.parse_divide_by()
-            elif tk[1] == 'input':
-                return self.parse_input()
-            elif tk[1] == 'remember':
-                return self.parse_assign()
-            elif tk[1] == 'if':
-                return self.parse_if()
-            elif tk[1] == 'for':
-                return self.parse_for()
-            elif tk[1] == 'when':
-                return self.parse_funcdef()
-            elif tk[1] == 'return':
-                return self.parse_return()
-            elif tk[1] == 'get':
-                return self.parse_import()
-            else:
-                raise SyntaxError(f"Unknown keyword {tk[1]}")
+        start = self.pos
+        kind = self.kinds[start]
+        if kind >= FIRST_KEYWORD:
+            parse = self.STATEMENTS.get(kind)
+            if parse is None:
+                raise SyntaxError(f"Unknown keyword {self.value()}")
+            stmt = parse(self)
+        elif kind == IDENT and self.at_spawn():
+            stmt = self.parse_spawn()
         else:
-            return self.parse_expr()
+            stmt = self.parse_expr()
+        stmt.line = self.tokens.line(start)
+        return stmt
 
-    def parse_lambda(self):
-        if self.match('KEYWORD') and self.tokens[self.pos-1][1] == 'lambda':
-            # lambda (a, b) -> ... end
-            self.consume('PUNCT', '(')
-            params = []
-            if not (self.peek()[0] == 'PUNCT' and self.peek()[1] == ')'):
-                while True:
-                    param = self.consume('IDENT')
-                    params.append(param[1])
-                    if self.peek()[0] == 'PUNCT' and self.peek()[1] == ')':
-                        break
-                    self.consume('PUNCT', ',')
-            self.consume('PUNCT', ')')
-            self.consume('PUNCT', '-')
-            self.consume('PUNCT', '>')
-            body = []
-            while True:
-                tk = self.peek()
-                if tk[0] == 'KEYWORD' and tk[1] == 'end':
-                    self.consume('KEYWORD', 'end')
-                    break
-                body.append(self.parse_stmt())
-            return Lambda(params, body)
-        elif self.match('KEYWORD') and self.tokens[self.pos-1][1] == 'do':
-            # do (a, b) -> ... end
-            self.consume('PUNCT', '(')
-            params = []
-            if not (self.peek()[0] == 'PUNCT' and self.peek()[1] == ')'):
-                while True:
-                    param = self.consume('IDENT')
-                    params.append(param[1])
-                    if self.peek()[0] == 'PUNCT' and self.peek()[1] == ')':
-                        break
-                    self.consume('PUNCT', ',')
-            self.consume('PUNCT', ')')
-            self.consume('PUNCT', '-')
-            self.consume('PUNCT', '>')
-            body = []
+    def parse_block(self, *terminators):
+        """Statements up to (not including) the first token in ``terminators``."""
+        body = []
+        kinds = self.kinds
+        while kinds[self.pos] not in terminators:
+            body.append(self.parse_stmt())
+        return body
+
+    def parse_params(self):
+        self.expect(LPAREN)
+        params = []
+        if self.kinds[self.pos] != RPAREN:
             while True:
-                tk = self.peek()
-                if tk[0] == 'KEYWORD' and tk[1] == 'end':
-                    self.consume('KEYWORD', 'end')
+                param = self.consume(IDENT)
+                params.append(param[1])
+                if self.kinds[self.pos] == RPAREN:
                     break
-                body.append(self.parse_stmt())
-            return Lambda(params, body)
+                self.expect(COMMA)
+        self.expect(RPAREN)
+        return params
+
+    def parse_lambda(self):
+        # lambda (a, b) -> ... end
+        # do (a, b) -> ... end
+        self.pos += 1
+        params = self.parse_params()
+        # '->' lexes as MINUS followed by COMPARE '>'
+        self.expect(MINUS)
+        if self.kinds[self.pos] != COMPARE or self.value() != '>':
+            raise self.error('COMPARE', '>')
+        self.pos += 1
+        body = self.parse_block(END)
+        self.expect(END)
+        return Lambda(params, body)
+
+    def parse_do(self):
+        if self.peek_ahead(1) in PUNCT_KINDS and self.peek_ahead(2) == IDENT:
+            return self.parse_lambda()
+        raise SyntaxError("Unknown keyword do")
 
     def parse_doc(self):
-        self.consume('KEYWORD', 'doc')
-        text = self.consume('STRING')[1]
+        self.expect(DOC)
+        text = self.consume(STRING)[1]
         stmt = self.parse_stmt()
         return Doc(text, stmt)
 
     def parse_trycatch(self):
-        self.consume('KEYWORD', 'try')
-        try_body = []
-        while True:
-            tk = self.peek()
-            if tk[0] == 'KEYWORD' and tk[1] == 'if_it_fails':
-                self.consume('KEYWORD', 'if_it_fails')
-                break
-            try_body.append(self.parse_stmt())
-        catch_body = []
-        while True:
-            tk = self.peek()
-            if tk[0] == 'KEYWORD' and tk[1] == 'end':
-                self.consume('KEYWORD', 'end')
-                break
-            catch_body.append(self.parse_stmt())
+        self.expect(TRY)
+        try_body = self.parse_block(IF_IT_FAILS)
+        self.expect(IF_IT_FAILS)
+        catch_body = self.parse_block(END)
+        self.expect(END)
         return TryCatch(try_body, catch_body)
 
     def parse_import(self):
-        self.consume('KEYWORD', 'get')
+        self.expect(GET)
         filename = self.parse_expr()
         return Import(filename)
 
     def parse_input(self):
-        self.consume('KEYWORD', 'input')
+        self.expect(INPUT)
         prompt = self.parse_expr()
         return Input(prompt)
 
     def parse_return(self):
-        self.consume('KEYWORD', 'return')
+        self.expect(RETURN)
         expr = self.parse_expr()
-        return ('RETURN', expr)
+        return Return(expr)
 
     def parse_print(self):
-        self.consume('KEYWORD', 'say')
+        self.expect(SAY)
         exprs = [self.parse_expr()]
         sep = None
         # Allow: say expr, expr, expr with "..." between
-        while self.peek() and self.peek()[0] == 'PUNCT' and self.peek()[1] == ',':
-            self.consume('PUNCT', ',')
+        while self.kinds[self.pos] == COMMA:
+            self.pos += 1
             exprs.append(self.parse_expr())
         # Optional: with "..." between
-        if self.peek() and self.peek()[0] == 'KEYWORD' and self.peek()[1] == 'with':
-            self.consume('KEYWORD', 'with')
+        if self.at_word('with'):
+            self.pos += 1
             sep = self.parse_expr()
-            if self.peek() and self.peek()[0] == 'KEYWORD' and self.peek()[1] == 'between':
-                self.consume('KEYWORD', 'between')
+            if self.at_word('between'):
+                self.pos += 1
         return Print(exprs, sep)
 
     def parse_assign(self):
-        self.consume('KEYWORD', 'remember')
+        self.expect(REMEMBER)
         expr = self.parse_expr()
-        self.consume('KEYWORD', 'as')
-        name_token = self.consume('IDENT')
+        self.expect(AS)
+        name_token = self.consume(IDENT)
         return Assign(name_token[1], expr)
 
     def parse_if(self):
-        self.consume('KEYWORD', 'if')
+        self.expect(IF)
         cond = self.parse_condition()
-        self.consume('KEYWORD', 'then')
-        body = []
+        self.expect(THEN)
+        body = self.parse_block(END, ELSE)
         else_body = []
-        while True:
-            tk = self.peek()
-            if tk[0] == 'KEYWORD' and tk[1] == 'end':
-                self.consume('KEYWORD', 'end')
-                break
-            elif tk[0] == 'KEYWORD' and tk[1] == 'else':
-                self.consume('KEYWORD', 'else')
-                while True:
-                    tk2 = self.peek()
-                    if tk2[0] == 'KEYWORD' and tk2[1] == 'end':
-                        break
-                    else_body.append(self.parse_stmt())
-                continue
-            else:
-                body.append(self.parse_stmt())
+        while self.kinds[self.pos] == ELSE:
+            self.pos += 1
+            else_body.extend(self.parse_block(END))
+        self.expect(END)
         return If(cond, body, else_body if else_body else None)
 
     def parse_for(self):
-        self.consume('KEYWORD', 'for')
-        self.consume('KEYWORD', 'each')
-        var_token = self.consume('IDENT')
-        self.consume('KEYWORD', 'in')
+        self.expect(FOR)
+        self.expect(EACH)
+        var_token = self.consume(IDENT)
+        value_token = None
+        if self.kinds[self.pos] == COMMA:
+            # for each key, value in dict do
+            self.pos += 1
+            value_token = self.consume(IDENT)
+        self.expect(IN)
         iterable = self.parse_expr()
-        self.consume('KEYWORD', 'do')
-        body = []
-        while True:
-            tk = self.peek()
-            if tk[0] == 'KEYWORD' and tk[1] == 'end':
-                self.consume('KEYWORD', 'end')
-                break
-            body.append(self.parse_stmt())
+        self.expect(DO)
+        body = self.parse_block(END)
+        self.expect(END)
+        if value_token is not None:
+            return ForEachDict(var_token[1], value_token[1], iterable, body)
         return ForEach(var_token[1], iterable, body)
 
     def parse_funcdef(self):
-        self.consume('KEYWORD', 'when')
-        name_token = self.consume('IDENT')
-        self.consume('PUNCT', '(')
-        params = []
-        if not (self.peek()[0] == 'PUNCT' and self.peek()[1] == ')'):
-            while True:
-                param = self.consume('IDENT')
-                params.append(param[1])
-                if self.peek()[0] == 'PUNCT' and self.peek()[1] == ')':
-                    break
-                self.consume('PUNCT', ',')
-        self.consume('PUNCT', ')')
-        body = []
-        while True:
-            tk = self.peek()
-            if tk[0] == 'KEYWORD' and tk[1] == 'end':
-                self.consume('KEYWORD', 'end')
-                break
-            stmt = self.parse_stmt()
-            body.append(stmt)
+        self.expect(WHEN)
+        name_token = self.consume(IDENT)
+        params = self.parse_params()
+        body = self.parse_block(END)
+        self.expect(END)
         return FuncDef(name_token[1], params, body)
 
+    def at_spawn(self):
+        # 'spawn' is a name everywhere except in front of a call that starts
+        # a statement, so programs may still use it as a variable
+        return (self.peek_ahead(1) == IDENT and self.peek_ahead(2) == LPAREN
+                and self.text(self.pos) == 'spawn')
+
+    def parse_spawn(self):
+        # spawn name(args)
+        self.pos += 1
+        call = self.parse_expr()
+        if not isinstance(call, Call):
+            raise SyntaxError('spawn needs a function call')
+        return Spawn(call)
+
+    # 'add', 'subtract', 'multiply', 'divide' and 'spawn' are not keywords
+    # to the lexer, so their parsers have no entry here.
+    STATEMENTS = {
+        LAMBDA: parse_lambda,
+        DO: parse_do,
+        DOC: parse_doc,
+        TRY: parse_trycatch,
+        SAY: parse_print,
+        INPUT: parse_input,
+        REMEMBER: parse_assign,
+        IF: parse_if,
+        FOR: parse_for,
+        WHEN: parse_funcdef,
+        RETURN: parse_return,
+        GET: parse_import,
+    }
+
     def parse_expr(self, prec=0):
         left = self.parse_primary()
+        kinds = self.kinds
         while True:
-            tk = self.peek()
-            if not tk:
-                break
-            prec_table = {
-                '..': 1,
-                '==': 2, '!=': 2, '>=': 2, '<=': 2, '>': 2, '<': 2,
-                '+': 3, '-': 3,
-                '*': 4, '/': 4,
-            }
-            if tk[0] == 'CONCAT':
-                op = '..'
-                op_prec = prec_table[op]
-            elif tk[0] == 'COMPARE':
-                op = tk[1]
-                op_prec = prec_table[op]
-            elif tk[0] in ['PLUS', 'MINUS', 'MULT', 'DIV']:
-                op = tk[1]
-                op_prec = prec_table[op]
-            else:
+            operator = INFIX_OPERATORS.get(kinds[self.pos])
+            if operator is None:
                 break
+            op_prec, op = operator
             if op_prec < prec:
                 break
-            self.advance()
+            if op is None:
+                op = self.text(self.pos)
+            self.pos += 1
             right = self.parse_expr(op_prec + 1)
             left = BinOp(left, op, right)
         return left
 
+    def parse_number(self, i):
+        text = self.text(i)
+        return Literal(float(text) if '.' in text else int(text))
+
+    def parse_string(self, i):
+        text = self.source[self.starts[i] + 1:self.ends[i] - 1]
+        # String interpolation: detect {var} inside string
+        if '{' in text and '}' in text:
+            return StringInterpolation(text)
+        return Literal(text)
+
+    def parse_bool(self, i):
+        return Literal(self.kinds[i] == YES)
+
+    def parse_name(self, i):
+        if self.kinds[self.pos] == LPAREN:
+            return self.parse_call(self.text(i))
+        return Var(self.text(i))
+
+    def parse_builtin(self, i):
+        # built-in names are keywords to the lexer
+        return self.parse_call(KEYWORD_NAMES[self.kinds[i] - FIRST_KEYWORD])
+
+    def parse_group(self, i):
+        expr = self.parse_expr()
+        self.expect(RPAREN)
+        return expr
+
     def parse_primary(self):
-        tk = self.peek()
-        if tk[0] == 'NUMBER':
-            self.consume('NUMBER')
-            val = float(tk[1]) if '.' in tk[1] else int(tk[1])
-            return Literal(val)
-        elif tk[0] == 'STRING':
-            self.consume('STRING')
-            # String interpolation: detect {var} inside string
-            if '{' in tk[1] and '}' in tk[1]:
-                # Use a generic AST node, to be defined in ast_nodes.py
-                return StringInterpolation(tk[1])
-            return Literal(tk[1])
-        elif tk[0] == 'KEYWORD' and tk[1] in ('yes', 'no'):
-            self.consume('KEYWORD', tk[1])
-            return Literal(True if tk[1] == 'yes' else False)
-        elif tk[0] == 'PUNCT' and tk[1] == '[':
-            return self.parse_list()
-        elif tk[0] == 'LBRACE':
-            return self.parse_dict()
-        elif tk[0] == 'IDENT':
-            self.consume('IDENT')
-            if self.peek()[0] == 'PUNCT' and self.peek()[1] == '(': 
-                return self.parse_call(tk[1])
-            return Var(tk[1])
-        elif tk[0] == 'PUNCT' and tk[1] == '(': 
-            self.consume('PUNCT', '(')
-            expr = self.parse_expr()
-            self.consume('PUNCT', ')')
-            return expr
-        else:
-            raise SyntaxError(f"Unexpected token: {tk}")
+        i = self.pos
+        parse = self.PREFIX.get(self.kinds[i])
+        if parse is None:
+            raise SyntaxError(f"Unexpected token: {self.tokens.token(i)}")
+        self.pos = i + 1
+        return parse(self, i)
 
-    def parse_dict(self):
-        self.consume('LBRACE')
+    def parse_dict(self, i=None):
+        if i is None:
+            self.expect(LBRACE)
         pairs = []
+        kinds = self.kinds
         while True:
-            if self.peek()[0] == 'RBRACE':
-                self.consume('RBRACE')
+            if kinds[self.pos] == RBRACE:
+                self.pos += 1
                 break
             key = self.parse_expr()
-            self.consume('COLON')
+            self.expect(COLON)
             value = self.parse_expr()
             pairs.append((key, value))
-            if self.peek()[0] == 'RBRACE':
+            if kinds[self.pos] == RBRACE:
                 continue
-            self.consume('PUNCT', ',')
+            self.expect(COMMA)
         return DictLiteral(pairs)
 
-    def parse_list(self):
-        self.consume('PUNCT', '[')
+    def parse_list(self, i=None):
+        if i is None:
+            self.expect(LBRACKET)
         elements = []
+        kinds = self.kinds
         while True:
-            if self.peek()[0] == 'PUNCT' and self.peek()[1] == ']':
-                self.consume('PUNCT', ']')
+            if kinds[self.pos] == RBRACKET:
+                self.pos += 1
                 break
             elements.append(self.parse_expr())
-            if self.peek()[0] == 'PUNCT' and self.peek()[1] == ']':
+            if kinds[self.pos] == RBRACKET:
                 continue
-            self.consume('PUNCT', ',')
+            self.expect(COMMA)
         return ListLiteral(elements)
 
+    # Prefix parsers by token kind, called with the token's index once it
+    # has been consumed.
+    PREFIX = {
+        NUMBER: parse_number,
+        STRING: parse_string,
+        YES: parse_bool,
+        NO: parse_bool,
+        LBRACKET: parse_list,
+        LPAREN: parse_group,
+        LBRACE: parse_dict,
+        IDENT: parse_name,
+    }
+    PREFIX.update(dict.fromkeys(BUILTIN_KEYWORDS, parse_builtin))
+    STATEMENTS.update(dict.fromkeys(BUILTIN_KEYWORDS, parse_expr))
+
     def parse_call(self, name):
-        self.consume('PUNCT', '(')
+        self.expect(LPAREN)
         args = []
-        if not (self.peek()[0] == 'PUNCT' and self.peek()[1] == ')'):
+        kinds = self.kinds
+        if kinds[self.pos] != RPAREN:
             while True:
                 args.append(self.parse_expr())
-                if self.peek()[0] == 'PUNCT' and self.peek()[1] == ')':
+                if kinds[self.pos] == RPAREN:
                     break
-                self.consume('PUNCT', ',')
-        self.consume('PUNCT', ')')
+                self.expect(COMMA)
+        self.expect(RPAREN)
         return Call(name, args)
 
     def parse_condition(self):
         left = self.parse_expr()
-        if self.match('KEYWORD') and self.tokens[self.pos-1][1] == 'is':
+        if self.kinds[self.pos] == IS:
+            self.pos += 1
             op_words = []
-            while self.match('KEYWORD'):
-                op_words.append(self.tokens[self.pos-1][1])
-                if op_words[-1] in ['than', 'not']:
+            while self.kinds[self.pos] >= FIRST_KEYWORD:
+                op_words.append(self.value())
+                self.pos += 1
+                if op_words[-1] in ('than', 'not'):
                     break
             op = ' '.join(op_words)
             right = self.parse_expr()
-            ops_map = {
-                'greater than': '>',
-                'less than': '<',
-                'greater than or equal to': '>=',
-                'less than or equal to': '<=',
-                'equal to': '==',
-                'not equal to': '!=',
-                'not greater than': '<=',
-                'not less than': '>=',
-            }
-            op_sym = ops_map.get(op, None)
+            op_sym = CONDITION_OPERATORS.get(op)
             if not op_sym:
                 raise SyntaxError(f"Unknown operator '{op}'")
             return BinOp(left, op_sym, right)
         else:
             return left
+
+def _refill(tokens, start, pieces, count):
+    """Parser over the tokens of ``tokens`` from ``start`` on, followed by up
+    to ``count`` more pieces; also says whether ``pieces`` ran out."""
+    base = tokens.starts[start]
+    texts = [tokens.source[base:]]
+    kinds = tokens.kinds[start:-1]
+    starts = array('I', [s - base for s in tokens.starts[start:-1]])
+    ends = array('I', [e - base for e in tokens.ends[start:-1]])
+    offset = len(texts[0])
+    exhausted = False
+    for _ in range(count):
+        piece = next(pieces, None)
+        if piece is None:
+            exhausted = True
+            break
+        kinds.extend(piece.kinds)
+        starts.extend([s + offset for s in piece.starts])
+        ends.extend([e + offset for e in piece.ends])
+        texts.append(piece.source)
+        offset += len(piece.source)
+    kinds.append(EOF)
+    starts.append(offset)
+    ends.append(offset)
+    stream = TokenStream(''.join(texts), kinds, starts, ends, tokens.line(start))
+    return Parser(stream), exhausted
+
+def parse_stream(chunks):
+    """Yield the top-level statements of source text arriving in ``chunks``.
+
+    Each statement is yielded as soon as it is complete, that is once the
+    token after it has been read, so it can run before the rest of the input
+    exists. Only the unfinished statement and the rest of the current piece
+    of input are kept. A statement that runs past the end of what has been
+    read is parsed again with more input, reading twice as many pieces each
+    time. Statements and errors are the same as parsing the whole text.
+    """
+    pieces = lex_chunks(chunks)
+    parser, exhausted = _refill(lex_stream(''), 0, pieces, 1)
+    want = 1
+    while True:
+        start = parser.pos
+        eof = len(parser.kinds) - 1
+        kind = parser.kinds[start]
+        if kind == EOF and exhausted:
+            return
+        # `do` looks two tokens ahead before deciding what it starts
+        if exhausted or (kind != EOF and (kind != DO or eof - start > 2)):
+            try:
+                stmt = parser.parse_stmt()
+            except SyntaxError:
+                if exhausted or parser.pos < eof:
+                    raise
+            else:
+                # a statement that stopped at the end of the input read so
+                # far might go on in the next piece
+                if exhausted or parser.pos < eof:
+                    want = 1
+                    yield stmt
+                    continue
+        parser, exhausted = _refill(parser.tokens, start, pieces, want)
+        want *= 2
@@ -0,0 +1,184 @@
+"""Profiler for Velion programs on the tree runtime (``--profile``).
+
+While a ``Profiler`` is active (``with Profiler(filename): run(stmts)``), it
+listens to the runtime's ``hooks`` and records:
+
+- calls, inclusive and exclusive time for every Velion function and
+  lambda, keyed by name and the line it is defined on;
+- how many times each statement ran;
+- exclusive time per call stack, for flame graph tools.
+
+A call is timed from when its body starts, so a function that ends with a
+tail call stops being timed when the function it calls starts. Functions
+do not tier up while a profiler is active: their statements would not be
+counted.
+"""
+import linecache
+import os
+import time
+from collections import Counter
+
+from . import hooks, modules, tiering
+from .ast_nodes import *
+
+# Label of the top-level code of the program
+PROGRAM = '<program>'
+
+# Statements listed in the report, most often run first
+TOP_STATEMENTS = 20
+
+class FunctionStats:
+    __slots__ = ('calls', 'inclusive', 'exclusive')
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+
+class _StackNode:
+    """One call path: the function ``label`` called along ``parent``'s path."""
+    __slots__ = ('label', 'parent', 'children', 'exclusive')
+
+    def __init__(self, label, parent):
+        self.label = label
+        self.parent = parent
+        self.children = {}
+        self.exclusive = 0.0
+
+    def child(self, label):
+        node = self.children.get(label)
+        if node is None:
+            node = self.children[label] = _StackNode(label, self)
+        return node
+
+class Profiler:
+    def __init__(self, filename='<program>', clock=time.perf_counter):
+        self.filename = filename
+        self.clock = clock
+        self.functions = {}
+        self.hits = Counter()
+        self.root = _StackNode(None, None)
+        # [stack node, start time, time spent in calls made from it]
+        self.frames = []
+        # label -> activations on the stack, so recursion is timed once
+        self.active = Counter()
+        self.labels = {}
+        self.total = 0.0
+        self._saved_threshold = None
+
+    # Recording
+
+    def label(self, node, name):
+        label = self.labels.get(node)
+        if label is None:
+            line = line_of(node)
+            label = self.labels[node] = name if line is None else f'{name}:{line}'
+        return label
+
+    def enter(self, label):
+        parent = self.frames[-1][0] if self.frames else self.root
+        self.frames.append([parent.child(label), self.clock(), 0.0])
+        self.active[label] += 1
+
+    def exit(self):
+        node, start, children = self.frames.pop()
+        elapsed = self.clock() - start
+        label = node.label
+        stats = self.functions.get(label)
+        if stats is None:
+            stats = self.functions[label] = FunctionStats()
+        stats.calls += 1
+        self.active[label] -= 1
+        if not self.active[label]:
+            stats.inclusive += elapsed
+        stats.exclusive += elapsed - children
+        node.exclusive += elapsed - children
+        if self.frames:
+            self.frames[-1][2] += elapsed
+
+    # Installing
+
+    def on_statement(self, stmt, env):
+        self.hits[stmt] += 1
+
+    def on_call(self, func, env):
+        self.enter(self.label(func, getattr(func, 'name', '<lambda>')))
+
+    def on_return(self, func, value):
+        self.exit()
+
+    def __enter__(self):
+        self._saved_threshold = tiering.threshold
+        tiering.threshold = None
+        hooks.add('statement', self.on_statement)
+        hooks.add('call', self.on_call)
+        hooks.add('return', self.on_return)
+        self.start = self.clock()
+        self.enter(PROGRAM)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self.frames:
+            self.exit()
+        self.total += self.clock() - self.start
+        hooks.remove('statement', self.on_statement)
+        hooks.remove('call', self.on_call)
+        hooks.remove('return', self.on_return)
+        tiering.threshold = self._saved_threshold
+
+    # Output
+
+    def statement_files(self):
+        """Path of the file each statement of a loaded module came from."""
+        files = {}
+        def walk(stmts, path):
+            for stmt in stmts:
+                files[id(stmt)] = path
+                if isinstance(stmt, Doc):
+                    walk([stmt.stmt], path)
+                for name in ('body', 'else_body', 'try_body', 'catch_body'):
+                    walk(getattr(stmt, name, None) or (), path)
+        for module in list(modules.registry.modules.values()):
+            walk(module.stmts or (), module.path)
+        return files
+
+    def report(self):
+        lines = [f'Velion profile of {self.filename}: {self.total * 1000:.2f} ms',
+                 '',
+                 f"{'function':<32}{'calls':>10}{'incl (ms)':>12}{'excl (ms)':>12}{'excl/call (us)':>16}"]
+        ordered = sorted(self.functions.items(), key=lambda item: item[1].exclusive, reverse=True)
+        for label, stats in ordered:
+            lines.append(f'{label:<32}{stats.calls:>10}{stats.inclusive * 1000:>12.2f}'
+                         f'{stats.exclusive * 1000:>12.2f}'
+                         f'{stats.exclusive / stats.calls * 1e6:>16.2f}')
+        lines += ['', f"{'line':<32}{'hits':>10}  statement"]
+        files = self.statement_files()
+        for stmt, count in self.hits.most_common(TOP_STATEMENTS):
+            line = line_of(stmt)
+            path = files.get(id(stmt), self.filename)
+            where = f'{os.path.basename(path)}:{line}' if line is not None else '?'
+            text = linecache.getline(path, line).strip() if line is not None else ''
+            lines.append(f'{where:<32}{count:>10}  {text or _kind(stmt)}')
+        return '\n'.join(lines)
+
+    def collapsed_stacks(self):
+        """Lines of ``a;b;c <microseconds>``, the format flamegraph.pl reads.
+
+        Yielded one at a time: deep recursion makes many long lines.
+        """
+        pending = [(node, node.label) for node in self.root.children.values()]
+        while pending:
+            node, path = pending.pop()
+            micros = round(node.exclusive * 1e6)
+            if micros > 0:
+                yield f'{path} {micros}'
+            pending.extend((child, f'{path};{child.label}')
+                           for child in reversed(list(node.children.values())))
+
+    def write_stacks(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in self.collapsed_stacks():
+                f.write(line + '\n')
+
+def _kind(stmt):
+    return 'return' if isinstance(stmt, Return) else type(stmt).__name__
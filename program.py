@@ -0,0 +1,206 @@
+"""Programs parsed once and run many times, for applications that embed Velion.
+
+    program = Program.from_file('rules.vl')
+    for request in requests:
+        result = program.run({'request': request}, capture_output=True)
+        respond(result.value, result.output)
+
+``Program`` reads, parses and optimizes the source once; each ``run`` starts
+from a new global environment holding copies of the names it is given. Runs
+from several threads share only the parsed statements. The closure and
+bytecode engines compile the program once per thread that runs it, and
+output captured by one run does not include what other threads print.
+Values passed in ``globals`` are not copied: a list given to two
+concurrent runs is the same list in both.
+"""
+import io
+import sys
+import threading
+
+from . import cache, optimizer, output
+from .rope import flatten
+from .runtime import Environment, run
+
+ENGINES = ('tree', 'closure', 'vm')
+
+def parse_file(filename):
+    """Statements of ``filename``, through the parse cache, optimized."""
+    stmts = cache.load_program(filename)
+    if optimizer.enabled:
+        stmts = optimizer.optimize(stmts)
+    return stmts
+
+def parse_source(source):
+    stmts = cache.parse_source(source)
+    if optimizer.enabled:
+        stmts = optimizer.optimize(stmts)
+    return stmts
+
+class Execution:
+    """What one run of a program produced.
+
+    ``value`` is the value of a top-level ``return`` (None without one),
+    ``globals`` the program's global variables when it ended, and ``output``
+    what it printed, or None if output was not captured.
+    """
+    __slots__ = ('value', 'globals', 'output')
+
+    def __init__(self, value, globals, output):
+        self.value = value
+        self.globals = globals
+        self.output = output
+
+    def __repr__(self):
+        return f'Execution(value={self.value!r})'
+
+class Program:
+    def __init__(self, stmts, engine='tree', name='<program>'):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'")
+        self.stmts = stmts
+        self.engine = engine
+        self.name = name
+        # closure program or (VM, bytecode) of each thread, compiled on first use
+        self._compiled = threading.local()
+        self._bytecode = None
+
+    @classmethod
+    def from_file(cls, filename, engine='tree'):
+        return cls(parse_file(filename), engine, filename)
+
+    @classmethod
+    def from_source(cls, source, engine='tree', name='<string>'):
+        return cls(parse_source(source), engine, name)
+
+    def run(self, globals=None, capture_output=False):
+        """Run the program once and return an ``Execution``.
+
+        ``globals`` maps names to values the program sees as global
+        variables. Exceptions raised by the program propagate.
+        """
+        env = Environment()
+        if globals:
+            env.update(globals)
+        if not capture_output:
+            value = self._execute(env)
+            return Execution(_plain(value), _visible(env), None)
+        buffer = io.StringIO()
+        with capture(buffer):
+            value = self._execute(env)
+        return Execution(_plain(value), _visible(env), buffer.getvalue())
+
+    def _execute(self, env):
+        if self.engine == 'tree':
+            return run(self.stmts, env)
+        compiled = self._compiled
+        if self.engine == 'closure':
+            program = getattr(compiled, 'program', None)
+            if program is None:
+                from .compiler import compile_program
+                program = compiled.program = compile_program(self.stmts)
+            return program(env)
+        vm = getattr(compiled, 'vm', None)
+        if vm is None:
+            from .vm import VM
+            vm = compiled.vm = VM()
+        if self._bytecode is None:
+            # bytecode is immutable, so all threads can share it
+            from .bytecode import compile_program
+            self._bytecode = compile_program(self.stmts)
+        return vm.run(self._bytecode, env)
+
+    def __repr__(self):
+        return f'<Program {self.name} ({self.engine})>'
+
+def _visible(env):
+    # names starting with '$' hold values the optimizer hoisted out of loops
+    return {name: _plain(value) for name, value in env.items() if not name.startswith('$')}
+
+def _plain(value):
+    """``value`` with the ropes in it, also inside lists and dicts, made strings."""
+    if type(value) is not list and type(value) is not dict:
+        return flatten(value)
+    # a loop, not recursion: lists may be nested deeper than Python's stack;
+    # a list or dict that holds itself, or is held twice, is copied once
+    copies = {}
+    pending = []
+
+    def copy_of(item):
+        if type(item) is not list and type(item) is not dict:
+            return flatten(item)
+        copy = copies.get(id(item))
+        if copy is None:
+            copy = copies[id(item)] = type(item)()
+            pending.append((item, copy))
+        return copy
+
+    result = copy_of(value)
+    while pending:
+        original, copy = pending.pop()
+        if type(copy) is list:
+            copy.extend(copy_of(item) for item in original)
+        else:
+            for key, item in original.items():
+                copy[flatten(key)] = copy_of(item)
+    return result
+
+class _ThreadOutput:
+    """Stands in for sys.stdout: writes from a thread that is capturing go
+    to that thread's buffer, everything else to the real stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        buffers = getattr(self.local, 'buffers', None)
+        return buffers[-1] if buffers else self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        return self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+_output = None
+_output_users = 0
+_output_lock = threading.Lock()
+
+class capture:
+    """Send what the current thread prints to ``buffer`` while active.
+
+    The stand-in for sys.stdout is only in place while some thread captures.
+    Lines ``say`` has collected are written where they were said.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __enter__(self):
+        global _output, _output_users
+        output.flush()
+        with _output_lock:
+            if _output_users == 0:
+                _output = _ThreadOutput(sys.stdout)
+                sys.stdout = _output
+            _output_users += 1
+            stand_in = _output
+        buffers = getattr(stand_in.local, 'buffers', None)
+        if buffers is None:
+            buffers = stand_in.local.buffers = []
+        buffers.append(self.buffer)
+        self.stand_in = stand_in
+
+    def __exit__(self, *exc_info):
+        global _output, _output_users
+        output.flush()
+        self.stand_in.local.buffers.pop()
+        with _output_lock:
+            _output_users -= 1
+            if _output_users == 0:
+                if sys.stdout is _output:
+                    sys.stdout = _output.stream
+                _output = None
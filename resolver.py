@@ -0,0 +1,87 @@
+"""Compile-time variable resolution for the closure and bytecode engines.
+
+A ``Scope`` gives every name a function or lambda binds a fixed slot in its
+``runtime.Frame``. ``Scope.lookup`` turns a variable reference into a
+``(depth, slot)`` pair, where depth counts lexical (lambda) links outward.
+Function bodies see their callers' variables through dynamic scoping, so
+names a function does not bind itself are still looked up by name at run
+time, and so is everything in a scope that runs ``get`` (which can bind
+arbitrary names).
+"""
+from .ast_nodes import *
+
+class Scope:
+    def __init__(self, params=(), body=(), parent=None):
+        # parent is only set for lambdas, which close over where they are made
+        self.parent = parent
+        self.names = {}
+        self.dynamic = False
+        for param in params:
+            self.bind(param)
+        self.param_slots = tuple(self.names[p] for p in params)
+        self.collect(body)
+
+    @classmethod
+    def for_function(cls, node):
+        params = list(node.params)
+        if node.variadic:
+            params.append('args')
+        scope = cls(params, node.body)
+        # 'args' is bound separately from the declared parameters
+        scope.param_slots = scope.param_slots[:len(node.params)]
+        return scope
+
+    @property
+    def size(self):
+        return len(self.names)
+
+    def bind(self, name):
+        if name not in self.names:
+            self.names[name] = len(self.names)
+
+    def collect(self, stmts):
+        for stmt in stmts:
+            if isinstance(stmt, Assign):
+                self.bind(stmt.name)
+            elif isinstance(stmt, AssignOp):
+                if isinstance(stmt.left, Var):
+                    self.bind(stmt.left.name)
+            elif isinstance(stmt, ForEach):
+                self.bind(stmt.var)
+                for name in stmt.hoisted:
+                    self.bind(name)
+                self.collect(stmt.body)
+            elif isinstance(stmt, ForEachDict):
+                self.bind(stmt.key)
+                self.bind(stmt.value)
+                self.collect(stmt.body)
+            elif isinstance(stmt, If):
+                self.collect(stmt.body)
+                self.collect(stmt.else_body or ())
+            elif isinstance(stmt, TryCatch):
+                self.collect(stmt.try_body)
+                self.collect(stmt.catch_body)
+            elif isinstance(stmt, FuncDef):
+                self.bind(stmt.name)
+            elif isinstance(stmt, Input):
+                self.bind('_last_input')
+            elif isinstance(stmt, Doc):
+                self.bind(f'_doc_{getattr(stmt.stmt, "name", id(stmt.stmt))}')
+                self.collect([stmt.stmt])
+            elif isinstance(stmt, Import):
+                self.dynamic = True
+
+    def lookup(self, name):
+        """Return ``(depth, slot)`` for ``name``, or None to look it up by name."""
+        scope, depth = self, 0
+        while scope is not None and not scope.dynamic:
+            slot = scope.names.get(name)
+            if slot is not None:
+                return depth, slot
+            scope = scope.parent
+            depth += 1
+        return None
+
+    def slot(self, name):
+        """Slot that a binding of ``name`` in this scope writes to."""
+        return self.names.get(name)
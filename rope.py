@@ -0,0 +1,122 @@
+"""Text built up with ``..`` without copying it at every step.
+
+``text .. piece`` copies both strings, so a loop that grows a report with
+``remember report .. line as report`` takes time quadratic in its length.
+Once a concatenation is ``MIN_LENGTH`` characters or longer it gives a
+``Rope`` instead: the pieces so far, in a list. Adding to the end of a rope
+appends to that list and takes time proportional to the new piece only.
+
+Ropes made by adding to the same one share its list. A rope is the first
+``count`` pieces of the list, so appending to it again after another rope
+has been made from it copies the pieces first, and no rope ever changes.
+
+A rope stands in for the string it holds: printing, comparing, hashing,
+``length``, indexing and the like join the pieces once and keep the
+string. Values leaving Velion (pickled for a worker, the globals and
+return value of a ``Program`` run, also inside lists and dicts) are plain
+strings.
+"""
+
+# Shorter results of ``..`` are plain strings
+MIN_LENGTH = 1024
+
+def concat(left, right):
+    """``left .. right``."""
+    if type(left) is Rope:
+        return left.add(str(right))
+    left, right = str(left), str(right)
+    if len(left) + len(right) < MIN_LENGTH:
+        return left + right
+    return Rope([left, right], 2, len(left) + len(right))
+
+def flatten(value):
+    """``value``, or the string it holds if it is a rope."""
+    return str(value) if type(value) is Rope else value
+
+class Rope:
+    __slots__ = ('parts', 'count', 'size', 'text')
+
+    def __init__(self, parts, count, size):
+        self.parts = parts
+        self.count = count
+        self.size = size
+        self.text = None
+
+    def add(self, piece):
+        parts = self.parts
+        if len(parts) != self.count:
+            parts = parts[:self.count]
+        parts.append(piece)
+        return Rope(parts, self.count + 1, self.size + len(piece))
+
+    def __str__(self):
+        text = self.text
+        if text is None:
+            parts = self.parts
+            text = self.text = ''.join(parts if len(parts) == self.count else parts[:self.count])
+        return text
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+    def __reduce__(self):
+        return str, (str(self),)
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        return str(self) == flatten(other)
+
+    def __ne__(self, other):
+        return str(self) != flatten(other)
+
+    def __lt__(self, other):
+        return str(self) < flatten(other)
+
+    def __le__(self, other):
+        return str(self) <= flatten(other)
+
+    def __gt__(self, other):
+        return str(self) > flatten(other)
+
+    def __ge__(self, other):
+        return str(self) >= flatten(other)
+
+    def __add__(self, other):
+        return str(self) + flatten(other)
+
+    def __radd__(self, other):
+        return flatten(other) + str(self)
+
+    def __mul__(self, other):
+        return str(self) * other
+
+    __rmul__ = __mul__
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __reversed__(self):
+        return reversed(str(self))
+
+    def __getitem__(self, index):
+        return str(self)[index]
+
+    def __contains__(self, item):
+        return flatten(item) in str(self)
+
+    def __float__(self):
+        return float(str(self))
+
+    def __int__(self):
+        return int(str(self))
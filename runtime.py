@@ -1,33 +1,382 @@
+import operator
+import os
+import sys
+import weakref
+
+from . import files, output, parallel, tasks, tiering
 from .ast_nodes import *
+from .modules import import_module, loaded_modules
+from .output import say
+from .rope import concat
+from .resolver import Scope
+
+class _Unset:
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNSET'
+
+# Marks an empty frame slot, and a missing key in lookups.
+UNSET = _Unset()
+
+def lookup(env, key):
+    # Walk the chain of environments and frames without recursing.
+    while env is not None:
+        skip = env.skip
+        if skip is not None and key not in skip[0]:
+            env = skip[1]
+            continue
+        value = env.get(key, UNSET)
+        if value is not UNSET:
+            return value
+        env = env.outer
+    raise NameError(f"Variable '{key}' not found")
 
 class Environment(dict):
     def __init__(self, outer=None):
         super().__init__()
         self.outer = outer
+        # set by call_skip() for function activations
+        self.skip = None
     def __getitem__(self, key):
-        if key in self:
-            return super().__getitem__(key)
-        elif self.outer:
-            return self.outer[key]
-        else:
-            raise NameError(f"Variable '{key}' not found")
+        value = self.get(key, UNSET)
+        if value is not UNSET:
+            return value
+        return lookup(self.outer, key)
+
+class Frame:
+    """Fixed-size local storage for one function or lambda activation.
+
+    ``names`` maps each statically bound name to its slot (shared by every
+    activation of the same function); names that only appear at run time,
+    for example through ``get``, live in ``extra``. Lookups that miss here
+    continue in ``outer`` just like ``Environment`` does.
+    """
+    __slots__ = ('names', 'slots', 'outer', 'extra', 'skip')
+
+    def __init__(self, names, slots, outer=None):
+        self.names = names
+        self.slots = slots
+        self.outer = outer
+        self.extra = None
+        self.skip = None
+
+    def get(self, key, default=None):
+        slot = self.names.get(key)
+        if slot is not None:
+            value = self.slots[slot]
+            return default if value is UNSET else value
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, UNSET)
+        if value is not UNSET:
+            return value
+        return lookup(self.outer, key)
+
     def __setitem__(self, key, value):
-        super().__setitem__(key, value)
+        slot = self.names.get(key)
+        if slot is not None:
+            self.slots[slot] = value
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, UNSET) is not UNSET
+
+# Velion calls deeper than this raise RecursionError. Calls are not Python
+# calls in the tree runtime and the VM, so only memory bounds the depth.
+MAX_CALL_DEPTH = 100000
+
+def find_function(env, name):
+    """The FuncDef that calling ``name`` in ``env`` runs."""
+    while env is not None:
+        skip = env.skip
+        if skip is not None and name not in skip[0]:
+            env = skip[1]
+            continue
+        func = env.get(name, UNSET)
+        if func is not UNSET:
+            if not isinstance(func, FuncDef):
+                raise TypeError(f"{name} is not a function")
+            return func
+        env = env.outer
+    raise NameError(f"Function '{name}' not defined")
+
+def call_skip(names, caller):
+    """``skip`` for a new activation of a function that binds only ``names``.
+
+    ``names`` is None for a function that runs ``get``. A lookup of any
+    other name passes over the activation, and over the run of activations
+    of the same function that called it, in one step, so deep recursion does
+    not make lookups of outer names walk one scope per call.
+    """
+    if names is None:
+        return None
+    skip = caller.skip
+    if skip is not None and skip[0] is names:
+        return skip
+    return (names, caller)
+
+class _CallerScope(Environment):
+    """Variables of frames dropped by tail calls; see ``drop_caller``."""
+
+def drop_caller(env):
+    """Take out of the scope chain of ``env`` the frame whose tail call made it.
+
+    With dynamic scoping the callee still sees the variables of the frame
+    it replaces, so they are copied into one environment that also takes in
+    the copy left by an earlier tail call. A chain of tail calls then keeps
+    name lookups from walking one scope per call.
+    """
+    caller = env.outer
+    outer = caller.outer
+    if type(outer) is _CallerScope:
+        scope = _CallerScope(outer.outer)
+        scope.update(outer)
+    else:
+        scope = _CallerScope(outer)
+    if isinstance(caller, Frame):
+        items = [(name, caller.slots[slot]) for name, slot in caller.names.items()]
+        if caller.extra:
+            items.extend(caller.extra.items())
+    else:
+        items = caller.items()
+    for name, value in items:
+        if value is not UNSET:
+            scope[name] = value
+    env.outer = scope
+    env.skip = None
+
+# Shared operator and built-in tables, so every execution engine agrees on
+# what an operator or built-in does.
+BINARY_OPS = {
+    '..': concat,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    'and': lambda left, right: bool(left) and bool(right),
+    'or': lambda left, right: bool(left) or bool(right),
+}
+
+ASSIGN_OPS = {
+    'add': operator.add,
+    'subtract': operator.sub,
+    'multiply': operator.mul,
+    'divide': operator.truediv,
+}
+
+def _exit():
+    sys.exit(0)
+
+def _join(items, sep=''):
+    if not hasattr(items, '__iter__'):
+        raise TypeError(f"Object {items} is not iterable")
+    return str(sep).join([str(item) for item in items])
+
+def _clear():
+    output.flush()
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+# name -> (number of arguments evaluated, or None for all of them, function)
+BUILTINS = {
+    'length': (1, len),
+    'to_number': (1, float),
+    'to_string': (1, str),
+    'min': (None, min),
+    'max': (None, max),
+    'sort': (1, sorted),
+    'reverse': (1, lambda value: list(reversed(value))),
+    'join': (None, _join),
+    'lines_of': (1, files.lines_of),
+    'read_text': (1, files.read_text),
+    'write_lines': (2, files.write_lines),
+    'exit': (0, _exit),
+    'clear': (0, _clear),
+    'loaded_modules': (0, loaded_modules),
+}
+
+# Built-ins that call Velion functions: name -> function taking the calling
+# environment, then the values of all the arguments
+CALLING_BUILTINS = {
+    'parallel_map': parallel.parallel_map,
+    'parallel_each': parallel.parallel_each,
+    'wait': tasks.wait,
+    'wait_all': tasks.wait_all,
+}
+
+def interpolate(parts, env):
+    # Replace {var} with the value of var in this scope; unknown names stay.
+    pieces = list(parts)
+    for i in range(1, len(pieces), 2):
+        value = env.get(pieces[i], UNSET)
+        pieces[i] = '{' + pieces[i] + '}' if value is UNSET else str(value)
+    return ''.join(pieces)
+
+class _PendingCall:
+    """A Velion call with its arguments bound, ready to run ``body``.
+
+    As a block result, it is the tail call made by ``return f(...)``.
+    """
+    __slots__ = ('body', 'env')
+
+    def __init__(self, body, env):
+        self.body = body
+        self.env = env
+
+class _Suspend:
+    """Yielded by an activation to wait for something without blocking.
+
+    The driver in ``tasks`` awaits ``start()`` and sends back the result.
+    ``_drive`` takes it for the body of a call, which runs ``block()``.
+    """
+    __slots__ = ('start', 'block')
+
+    def __init__(self, start, block):
+        self.start = start
+        self.block = block
+
+    def send(self, value):
+        raise StopIteration(('RETURN', self.block()))
+
+    def throw(self, exc):
+        raise exc
+
+# Called with (exception, try statement, env) when a try statement catches
+# an exception; set by ``hooks``.
+_caught = None
 
 def run(stmts, env=None, local_vars=None):
     if env is None:
         env = Environment()
     if local_vars is None:
         local_vars = set()
-    i = 0
-    while i < len(stmts):
-        stmt = stmts[i]
+    try:
+        result = _drive(_block(stmts, env, local_vars))
+    finally:
+        output.flush()
+    return result[1] if result is not None else None
+
+def run_stream(stmts, env=None):
+    """Like run(), but takes statements from any iterable as they come."""
+    if env is None:
+        env = Environment()
+    local_vars = set()
+    try:
+        for stmt in stmts:
+            result = _drive(_block((stmt,), env, local_vars))
+            if result is not None:
+                return result[1]
+    finally:
+        output.flush()
+
+def _drive(activation):
+    """Run a generator from ``_block`` and every Velion call it makes.
+
+    A generator yields the body of a function it calls and is sent back the
+    return value. Suspended callers wait on an explicit stack instead of in
+    Python frames, so the depth of Velion recursion does not depend on
+    Python's recursion limit. A ``_PendingCall`` result, from a tail call,
+    replaces the activation that returned it instead of growing the stack.
+    """
+    callers = []
+    value = error = None
+    while True:
+        try:
+            if error is None:
+                body = activation.send(value)
+            else:
+                error, exc = None, error
+                body = activation.throw(exc)
+        except StopIteration as stop:
+            result = stop.value
+            if type(result) is _PendingCall:
+                if callers:
+                    drop_caller(result.env)
+                activation, value = result.body, None
+                continue
+            if not callers:
+                return result
+            activation = callers.pop()
+            value = result[1] if result is not None else None
+            continue
+        except Exception as exc:
+            if not callers:
+                raise
+            activation, error = callers.pop(), exc
+            continue
+        if len(callers) >= MAX_CALL_DEPTH:
+            error = RecursionError('maximum Velion call depth exceeded')
+            continue
+        callers.append(activation)
+        activation, value = body, None
+
+def makes_calls(node):
+    """True if running ``node`` can call a Velion function or suspend a task."""
+    try:
+        return node._calls
+    except AttributeError:
+        pass
+    calls = ((isinstance(node, Call) and node.callee not in BUILTINS)
+             or isinstance(node, Input)
+             or any(makes_calls(child) for child in _children(node)))
+    try:
+        node._calls = calls
+    except AttributeError:
+        # not an AST node; evaluating it raises
+        pass
+    return calls
+
+def _children(node):
+    """Statements and expressions run as part of ``node``."""
+    if isinstance(node, Call):
+        return node.args
+    if isinstance(node, BinOp):
+        return (node.left, node.right)
+    if isinstance(node, (Assign, Hoisted, Return)):
+        return (node.expr,)
+    if isinstance(node, If):
+        return [node.cond, *node.body, *(node.else_body or ())]
+    if isinstance(node, (ForEach, ForEachDict)):
+        return [node.iterable, *node.body]
+    if isinstance(node, Print):
+        return [*node.exprs, node.sep] if node.sep else node.exprs
+    if isinstance(node, ListLiteral):
+        return node.elements
+    if isinstance(node, DictLiteral):
+        return [e for pair in node.pairs for e in pair]
+    if isinstance(node, AssignOp):
+        return (node.right,)
+    if isinstance(node, TryCatch):
+        return [*node.try_body, *node.catch_body]
+    if isinstance(node, Input):
+        return (node.prompt,)
+    if isinstance(node, Doc):
+        return (node.stmt,)
+    if isinstance(node, Spawn):
+        return (node.call,)
+    return ()
+
+def exec_block(stmts, env, local_vars):
+    for stmt in stmts:
         result = exec_stmt(stmt, env, local_vars)
-        if isinstance(result, tuple) and result[0] == 'RETURN':
-            return result[1]
-        i += 1
+        if result is not None:
+            return result
 
 def exec_stmt(stmt, env, local_vars):
+    if isinstance(stmt, Return):
+        return ('RETURN', eval_expr(stmt.expr, env))
     # Built-in doc
     if isinstance(stmt, Doc):
         # Storage docstring in the environment, can be expanded
@@ -37,23 +386,17 @@ def exec_stmt(stmt, env, local_vars):
         # Supports multiple expressions and separator
         vals = [eval_expr(e, env) for e in stmt.exprs]
         sep = eval_expr(stmt.sep, env) if stmt.sep else ' '
-        print(sep.join(str(v) for v in vals))
+        say(sep.join(str(v) for v in vals))
     elif isinstance(stmt, AssignOp):
         # Natural assignment: add 1 to x, subtract 2 from x, multiply x by 3, divide x by 2
         if not isinstance(stmt.left, Var):
             raise SyntaxError('Left side of assignment must be a variable')
         varname = stmt.left.name
         current = env[varname]
-        if stmt.op == 'add':
-            env[varname] = current + eval_expr(stmt.right, env)
-        elif stmt.op == 'subtract':
-            env[varname] = current - eval_expr(stmt.right, env)
-        elif stmt.op == 'multiply':
-            env[varname] = current * eval_expr(stmt.right, env)
-        elif stmt.op == 'divide':
-            env[varname] = current / eval_expr(stmt.right, env)
-        else:
+        op = ASSIGN_OPS.get(stmt.op)
+        if op is None:
             raise SyntaxError(f'Unknown assignment operator {stmt.op}')
+        env[varname] = op(current, eval_expr(stmt.right, env))
     elif isinstance(stmt, ForEachDict):
         d = eval_expr(stmt.iterable, env)
         if not isinstance(d, dict):
@@ -61,9 +404,11 @@ def exec_stmt(stmt, env, local_vars):
         for k, v in d.items():
             env[stmt.key] = k
             env[stmt.value] = v
-            run(stmt.body, env, local_vars.copy())
+            result = exec_block(stmt.body, env, local_vars.copy())
+            if result is not None:
+                return result
     elif isinstance(stmt, Input):
-        val = input(str(eval_expr(stmt.prompt, env)))
+        val = output.read_line(str(eval_expr(stmt.prompt, env)))
         env['_last_input'] = val
     elif isinstance(stmt, Assign):
         val = eval_expr(stmt.expr, env)
@@ -77,152 +422,441 @@ def exec_stmt(stmt, env, local_vars):
     elif isinstance(stmt, If):
         cond = eval_expr(stmt.cond, env)
         if cond:
-            run(stmt.body, env, local_vars.copy())
+            return exec_block(stmt.body, env, local_vars.copy())
         elif stmt.else_body:
-            run(stmt.else_body, env, local_vars.copy())
+            return exec_block(stmt.else_body, env, local_vars.copy())
     elif isinstance(stmt, ForEach):
         iterable = eval_expr(stmt.iterable, env)
         if not hasattr(iterable, '__iter__'):
             raise TypeError(f"Object {iterable} is not iterable")
+        for name in stmt.hoisted:
+            env[name] = UNSET
         for item in iterable:
             env[stmt.var] = item
-            run(stmt.body, env, local_vars.copy())
+            result = exec_block(stmt.body, env, local_vars.copy())
+            if result is not None:
+                return result
     elif isinstance(stmt, FuncDef):
+        call_plan(stmt)
         env[stmt.name] = stmt
     elif isinstance(stmt, Call):
-        eval_call(stmt, env)
+        eval_expr(stmt, env)
+    elif isinstance(stmt, Spawn):
+        # a built-in; calls to functions run through _exec
+        eval_expr(stmt.call, env)
     elif isinstance(stmt, Lambda):
-        return stmt
+        pass
     elif isinstance(stmt, Import):
         filename = eval_expr(stmt.filename, env)
-        if not filename.endswith('.vl'):
-            filename += '.vl'
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                code = f.read()
-            from .lexer import lex
-            from .parser import Parser
-            tokens = lex(code)
-            parser = Parser(tokens)
-            stmts = parser.parse()
-            run(stmts, env)
-        except Exception as e:
-            print(f"Erro ao importar {filename}: {e}")
+        import_module(filename, env, lambda module, env: _drive(_block(module.stmts, env, set())))
     elif isinstance(stmt, TryCatch):
         try:
-            run(stmt.try_body, env, local_vars.copy())
-        except Exception:
-            run(stmt.catch_body, env, local_vars.copy())
-    elif isinstance(stmt, tuple) and stmt[0] == 'RETURN':
-        return ('RETURN', eval_expr(stmt[1], env))
+            return exec_block(stmt.try_body, env, local_vars.copy())
+        except Exception as exc:
+            if _caught is not None:
+                _caught(exc, stmt, env)
+            return exec_block(stmt.catch_body, env, local_vars.copy())
     else:
         eval_expr(stmt, env)
 
+# Generator versions of exec_stmt and eval_expr for code that calls Velion
+# functions; code that does not runs through the plain functions above.
+
+def _block(stmts, env, local_vars):
+    for stmt in stmts:
+        if makes_calls(stmt):
+            result = yield from _exec(stmt, env, local_vars)
+        else:
+            result = exec_stmt(stmt, env, local_vars)
+        if result is not None:
+            return result
+
+def _exec(stmt, env, local_vars):
+    if isinstance(stmt, Doc):
+        env[f'_doc_{getattr(stmt.stmt, "name", id(stmt.stmt))}'] = stmt.text
+        return (yield from _block((stmt.stmt,), env, local_vars))
+    if isinstance(stmt, Print):
+        vals = []
+        for e in stmt.exprs:
+            vals.append((yield from _eval(e, env)))
+        sep = (yield from _eval(stmt.sep, env)) if stmt.sep else ' '
+        say(sep.join(str(v) for v in vals))
+    elif isinstance(stmt, AssignOp):
+        if not isinstance(stmt.left, Var):
+            raise SyntaxError('Left side of assignment must be a variable')
+        varname = stmt.left.name
+        current = env[varname]
+        op = ASSIGN_OPS.get(stmt.op)
+        if op is None:
+            raise SyntaxError(f'Unknown assignment operator {stmt.op}')
+        env[varname] = op(current, (yield from _eval(stmt.right, env)))
+    elif isinstance(stmt, ForEachDict):
+        d = yield from _eval(stmt.iterable, env)
+        if not isinstance(d, dict):
+            raise TypeError('ForEachDict expects a dictionary')
+        for k, v in d.items():
+            env[stmt.key] = k
+            env[stmt.value] = v
+            result = yield from _block(stmt.body, env, local_vars.copy())
+            if result is not None:
+                return result
+    elif isinstance(stmt, Input):
+        line = tasks.read_line(str((yield from _eval(stmt.prompt, env))))
+        if type(line) is _Suspend:
+            line = yield line
+        env['_last_input'] = line
+    elif isinstance(stmt, Assign):
+        val = yield from _eval(stmt.expr, env)
+        if hasattr(val, '__call__'):
+            val.__name__ = stmt.name
+        env[stmt.name] = val
+        local_vars.add(stmt.name)
+    elif isinstance(stmt, If):
+        if (yield from _eval(stmt.cond, env)):
+            return (yield from _block(stmt.body, env, local_vars.copy()))
+        elif stmt.else_body:
+            return (yield from _block(stmt.else_body, env, local_vars.copy()))
+    elif isinstance(stmt, ForEach):
+        iterable = yield from _eval(stmt.iterable, env)
+        if not hasattr(iterable, '__iter__'):
+            raise TypeError(f"Object {iterable} is not iterable")
+        for name in stmt.hoisted:
+            env[name] = UNSET
+        for item in iterable:
+            env[stmt.var] = item
+            result = yield from _block(stmt.body, env, local_vars.copy())
+            if result is not None:
+                return result
+    elif isinstance(stmt, Call):
+        if stmt.callee in BUILTINS:
+            yield from _eval(stmt, env)
+            return
+        call = yield from _enter(stmt, env)
+        if type(call) is _PendingCall:
+            yield call.body
+    elif isinstance(stmt, Spawn):
+        call = stmt.call
+        if call.callee in BUILTINS:
+            yield from _eval(call, env)
+        elif not tasks.running() or call.callee in CALLING_BUILTINS:
+            # outside the async mode, and for built-ins, a call like any other
+            call = yield from _enter(call, env)
+            if type(call) is _PendingCall:
+                yield call.body
+        else:
+            site, func, plan = _resolve(call, env)
+            if site.plain and plan.plain:
+                local_env = _bind(plan, call, env)
+            else:
+                local_env = yield from _bind_calls(plan, call, env)
+            tasks.spawn(_start(func, plan, local_env))
+    elif isinstance(stmt, TryCatch):
+        try:
+            result = yield from _block(stmt.try_body, env, local_vars.copy())
+            if type(result) is _PendingCall:
+                # not a tail call: the handler must see the callee's errors
+                result = ('RETURN', (yield result.body))
+            return result
+        except Exception as exc:
+            if _caught is not None:
+                _caught(exc, stmt, env)
+            return (yield from _block(stmt.catch_body, env, local_vars.copy()))
+    elif isinstance(stmt, Return):
+        expr = stmt.expr
+        if isinstance(expr, Call) and expr.callee not in BUILTINS:
+            result = yield from _enter(expr, env)
+            if type(result) is _PendingCall:
+                return result
+            return ('RETURN', result[1] if result is not None else None)
+        return ('RETURN', (yield from _eval(expr, env)))
+    else:
+        yield from _eval(stmt, env)
+
+def _eval(expr, env):
+    if not makes_calls(expr):
+        return eval_expr(expr, env)
+    if isinstance(expr, Call):
+        builtin = BUILTINS.get(expr.callee)
+        if builtin is None:
+            call = yield from _enter(expr, env)
+            if type(call) is _PendingCall:
+                return (yield call.body)
+            return call[1] if call is not None else None
+        arity, func = builtin
+        args = []
+        for i in range(len(expr.args) if arity is None else arity):
+            args.append((yield from _eval(expr.args[i], env)))
+        return func(*args)
+    if isinstance(expr, BinOp):
+        left = yield from _eval(expr.left, env)
+        right = yield from _eval(expr.right, env)
+        op = BINARY_OPS.get(expr.op)
+        if op is None:
+            raise ValueError(f"Unknown operator {expr.op}")
+        return op(left, right)
+    if isinstance(expr, ListLiteral):
+        items = []
+        for e in expr.elements:
+            items.append((yield from _eval(e, env)))
+        return items
+    if isinstance(expr, DictLiteral):
+        d = {}
+        for k, v in expr.pairs:
+            key = yield from _eval(k, env)
+            d[key] = yield from _eval(v, env)
+        return d
+    # Hoisted
+    value = env.get(expr.name, UNSET)
+    if value is UNSET:
+        value = env[expr.name] = yield from _eval(expr.expr, env)
+    return value
+
+class CallPlan:
+    """How calls to one FuncDef bind their arguments, worked out once.
+
+    ``defaults`` has an entry for each parameter: None if it is required,
+    ``(True, value)`` for a literal default and ``(False, expr)`` for one
+    that is evaluated at the call. ``leaf`` is true when the body calls no
+    Velion function, so it can run without the generators of ``_block``.
+    ``countdown`` counts calls down to tiering (see ``tiering``), and
+    ``tiered`` is the compiled body once the function has been tiered up.
+    """
+    __slots__ = ('params', 'defaults', 'variadic', 'bound', 'leaf', 'plain',
+                 'countdown', 'tiered')
+
+    def __init__(self, func):
+        self.params = tuple(func.params)
+        defaults = []
+        for pname in self.params:
+            if pname not in func.defaults:
+                defaults.append(None)
+            elif isinstance(func.defaults[pname], Literal):
+                defaults.append((True, func.defaults[pname].value))
+            else:
+                defaults.append((False, func.defaults[pname]))
+        self.defaults = tuple(defaults)
+        self.variadic = func.variadic
+        scope = Scope.for_function(func)
+        self.bound = None if scope.dynamic else frozenset(scope.names)
+        self.leaf = not any(makes_calls(stmt) for stmt in func.body)
+        # no default makes a call
+        self.plain = not any(d is not None and not d[0] and makes_calls(d[1])
+                             for d in self.defaults)
+        self.countdown = tiering.threshold
+        self.tiered = None
+
+def call_plan(func):
+    try:
+        return func._plan
+    except AttributeError:
+        plan = func._plan = CallPlan(func)
+        return plan
+
+class _CallSite:
+    """What a call expression needs each time it runs, kept on the node.
+
+    ``cache`` is ``(env, local, func, plan)`` from the last call made here,
+    with ``env`` a weak reference to the calling environment. While code runs
+    in an environment only that environment changes; the scopes behind it
+    belong to suspended callers. So for the same environment the function
+    found before is still the one a lookup would find, as long as the local
+    binding of the name is what it was: the function itself if ``local``,
+    else nothing. The tuple is replaced whole, so threads running the same
+    code never see half an update.
+    """
+    __slots__ = ('plain', 'cache', 'builtin')
+
+    def __init__(self, call):
+        # no argument makes a call
+        self.plain = not any(makes_calls(arg) for arg in call.args)
+        self.cache = None
+        self.builtin = CALLING_BUILTINS.get(call.callee)
+
+def _resolve(call, env):
+    """Call site, FuncDef and plan for running ``call`` from ``env``.
+
+    The FuncDef and plan are None for a call to one of ``CALLING_BUILTINS``.
+    """
+    try:
+        site = call._site
+    except AttributeError:
+        site = call._site = _CallSite(call)
+    cache = site.cache
+    if cache is not None and cache[0]() is env:
+        if env.get(call.callee, UNSET) is (cache[2] if cache[1] else UNSET):
+            return site, cache[2], cache[3]
+    if site.builtin is not None:
+        return site, None, None
+    func = find_function(env, call.callee)
+    plan = call_plan(func)
+    site.cache = (weakref.ref(env), env.get(call.callee, UNSET) is func, func, plan)
+    return site, func, plan
+
+def _bind(plan, call, env):
+    """A new environment for a call with plain arguments and defaults."""
+    local_env = Environment(outer=env)
+    local_env.skip = call_skip(plan.bound, env)
+    args = call.args
+    nargs = len(args)
+    for i, pname in enumerate(plan.params):
+        if i < nargs:
+            local_env[pname] = eval_expr(args[i], env)
+        else:
+            default = plan.defaults[i]
+            if default is None:
+                raise TypeError(f"Function {call.callee} missing required argument: {pname}")
+            local_env[pname] = default[1] if default[0] else eval_expr(default[1], env)
+    if plan.variadic:
+        local_env['args'] = [eval_expr(arg, env) for arg in args[len(plan.params):]]
+    return local_env
+
+def _bind_calls(plan, call, env):
+    """Like _bind(), for arguments or defaults that call Velion functions."""
+    local_env = Environment(outer=env)
+    local_env.skip = call_skip(plan.bound, env)
+    args = call.args
+    nargs = len(args)
+    for i, pname in enumerate(plan.params):
+        if i < nargs:
+            local_env[pname] = yield from _eval(args[i], env)
+        else:
+            default = plan.defaults[i]
+            if default is None:
+                raise TypeError(f"Function {call.callee} missing required argument: {pname}")
+            local_env[pname] = default[1] if default[0] else (yield from _eval(default[1], env))
+    if plan.variadic:
+        extra = []
+        for arg in args[len(plan.params):]:
+            extra.append((yield from _eval(arg, env)))
+        local_env['args'] = extra
+    return local_env
+
+def _enter(call, env):
+    """Bind the arguments of ``call`` in a new environment and start the call.
+
+    Returns what ``_call_body`` does.
+    """
+    site, func, plan = _resolve(call, env)
+    if func is None:
+        args = []
+        for arg in call.args:
+            args.append((yield from _eval(arg, env)))
+        value = site.builtin(env, *args)
+        if type(value) is _Suspend:
+            value = yield value
+        return ('RETURN', value)
+    if site.plain and plan.plain:
+        local_env = _bind(plan, call, env)
+    else:
+        local_env = yield from _bind_calls(plan, call, env)
+    return _call_body(func, plan, local_env)
+
+def _start(func, plan, local_env):
+    # the body of a spawned task: the call starts when the task does
+    return _call_body(func, plan, local_env)
+    yield
+
+def _call_body(func, plan, local_env):
+    """Run the body of a call whose arguments are bound in ``local_env``.
+
+    Tiered and leaf functions run here, and the block result is returned;
+    otherwise the ``_PendingCall`` for the driver to run the body.
+    """
+    if plan.tiered is not None:
+        return ('RETURN', plan.tiered(local_env))
+    if plan.countdown is not None:
+        plan.countdown -= 1
+        if plan.countdown <= 0:
+            plan.countdown = None
+            plan.tiered = tiering.tier_up(func)
+            if plan.tiered is not None:
+                return ('RETURN', plan.tiered(local_env))
+    if plan.leaf:
+        return exec_block(func.body, local_env, set(plan.params))
+    return _PendingCall(_block(func.body, local_env, set(plan.params)), local_env)
+
 def eval_expr(expr, env):
-    if isinstance(expr, StringInterpolation):
-        # Replace {var} with value from env
-        import re
-        def replacer(match):
-            var = match.group(1)
-            return str(env[var]) if var in env else '{' + var + '}'
-        return re.sub(r'\{([a-zA-Z_][a-zA-Z0-9_]*)\}', replacer, expr.template)
-    if isinstance(expr, Lambda):
+    # most common node types first: argument and return expressions of
+    # small functions are mostly names, constants and arithmetic
+    if isinstance(expr, Var):
+        return env[expr.name]
+    elif isinstance(expr, Literal):
+        return expr.value
+    elif isinstance(expr, BinOp):
+        left = eval_expr(expr.left, env)
+        right = eval_expr(expr.right, env)
+        op = BINARY_OPS.get(expr.op)
+        if op is None:
+            raise ValueError(f"Unknown operator {expr.op}")
+        return op(left, right)
+    elif isinstance(expr, Hoisted):
+        value = env.get(expr.name, UNSET)
+        if value is UNSET:
+            value = env[expr.name] = eval_expr(expr.expr, env)
+        return value
+    elif isinstance(expr, Call):
+        # Built-in functions
+        builtin = BUILTINS.get(expr.callee)
+        if builtin is None:
+            return eval_call(expr, env)
+        arity, func = builtin
+        if arity is None:
+            return func(*(eval_expr(arg, env) for arg in expr.args))
+        return func(*[eval_expr(expr.args[i], env) for i in range(arity)])
+    elif isinstance(expr, StringInterpolation):
+        return interpolate(expr.parts, env)
+    elif isinstance(expr, Lambda):
         def _lambda(*args):
             local_env = Environment(outer=env)
             for param, arg in zip(expr.params, args):
                 local_env[param] = arg
-            return run(expr.body, local_env, set(expr.params))
+            return _lambda_body(expr, local_env)
         return _lambda
-    if isinstance(expr, Literal):
-        return expr.value
     elif isinstance(expr, ListLiteral):
         return [eval_expr(e, env) for e in expr.elements]
     elif isinstance(expr, DictLiteral):
         return {eval_expr(k, env): eval_expr(v, env) for k, v in expr.pairs}
-    elif isinstance(expr, Var):
-        return env[expr.name]
-    elif isinstance(expr, BinOp):
-        left = eval_expr(expr.left, env)
-        right = eval_expr(expr.right, env)
-        op = expr.op
-        if op == '..':
-            return str(left) + str(right)
-        elif op == '==':
-            return left == right
-        elif op == '!=':
-            return left != right
-        elif op == '>=':
-            return left >= right
-        elif op == '<=':
-            return left <= right
-        elif op == '>':
-            return left > right
-        elif op == '<':
-            return left < right
-        elif op == '+':
-            return left + right
-        elif op == '-':
-            return left - right
-        elif op == '*':
-            return left * right
-        elif op == '/':
-            return left / right
-        elif op == 'and':
-            return bool(left) and bool(right)
-        elif op == 'or':
-            return bool(left) or bool(right)
-        else:
-            raise ValueError(f"Unknown operator {op}")
-    elif isinstance(expr, Call):
-        # Built-in functions
-        if expr.callee == 'length':
-            return len(eval_expr(expr.args[0], env))
-        elif expr.callee == 'to_number':
-            return float(eval_expr(expr.args[0], env))
-        elif expr.callee == 'to_string':
-            return str(eval_expr(expr.args[0], env))
-        elif expr.callee == 'min':
-            return min(*(eval_expr(arg, env) for arg in expr.args))
-        elif expr.callee == 'max':
-            return max(*(eval_expr(arg, env) for arg in expr.args))
-        elif expr.callee == 'sort':
-            return sorted(eval_expr(expr.args[0], env))
-        elif expr.callee == 'reverse':
-            return list(reversed(eval_expr(expr.args[0], env)))
-        elif expr.callee == 'exit':
-            import sys; sys.exit(0)
-        elif expr.callee == 'wait':
-            import time; time.sleep(float(eval_expr(expr.args[0], env)))
-        elif expr.callee == 'clear':
-            import os; os.system('cls' if os.name == 'nt' else 'clear')
-        else:
-            return eval_call(expr, env)
     else:
         raise TypeError(f"Unknown expression type {expr}")
 
-def eval_call(call, env):
-    if call.callee in env:
-        func = env[call.callee]
-        if isinstance(func, FuncDef):
-            local_env = Environment(outer=env)
-            local_vars = set(func.params)
-            # Handle optional and variadic arguments
-            args = list(call.args)
-            params = list(func.params)
-            # Fill in defaults
-            for i, pname in enumerate(params):
-                if i < len(args):
-                    local_env[pname] = eval_expr(args[i], env)
-                elif pname in getattr(func, 'defaults', {}):
-                    local_env[pname] = eval_expr(func.defaults[pname], env)
-                else:
-                    raise TypeError(f"Function {call.callee} missing required argument: {pname}")
-            # Variadic: when thing(a, ...)
-            if getattr(func, 'variadic', None):
-                local_env['args'] = [eval_expr(arg, env) for arg in args[len(params):]]
-            result = run(func.body, local_env, local_vars)
-            return result
+def call_function(func, args, env):
+    """Call the Velion function ``func`` with the values ``args`` from ``env``.
+
+    For built-ins that take a function; ``func`` may also be a lambda.
+    """
+    if not isinstance(func, FuncDef):
+        if not callable(func):
+            raise TypeError(f"{func} is not a function")
+        return func(*args)
+    plan = call_plan(func)
+    local_env = Environment(outer=env)
+    local_env.skip = call_skip(plan.bound, env)
+    nargs = len(args)
+    for i, pname in enumerate(plan.params):
+        if i < nargs:
+            local_env[pname] = args[i]
         else:
-            raise TypeError(f"{call.callee} is not a function")
-    else:
-        raise NameError(f"Function '{call.callee}' not defined")
+            default = plan.defaults[i]
+            if default is None:
+                raise TypeError(f"Function {func.name} missing required argument: {pname}")
+            local_env[pname] = default[1] if default[0] else eval_expr(default[1], env)
+    if plan.variadic:
+        local_env['args'] = list(args[len(plan.params):])
+    result = _call_body(func, plan, local_env)
+    if type(result) is _PendingCall:
+        result = _drive(result.body)
+    return result[1] if result is not None else None
+
+def _lambda_body(node, env):
+    # output is flushed when the program ends, not after every call
+    result = _drive(_block(node.body, env, set(node.params)))
+    return result[1] if result is not None else None
+
+def eval_call(call, env):
+    return _drive(_call(call, env))
+
+def _call(call, env):
+    call = yield from _enter(call, env)
+    if type(call) is _PendingCall:
+        return (yield call.body)
+    return call[1] if call is not None else None
@@ -0,0 +1,156 @@
+"""Daemon mode (``--serve``): run scripts for ``velion.client`` in a warm process.
+
+Starting Velion for a short script costs more than running it: Python
+starts, imports the interpreter and compiles the lexer's regular
+expressions. The daemon pays for that once. It listens on a Unix socket
+and runs each script a client sends (see ``client.py`` for the protocol)
+with ``Program``, in the client's working directory, reading the client's
+standard input and sending what the script prints back as it is written.
+
+Programs stay parsed between requests and are parsed again when their file
+changes on disk; files loaded with ``get`` are checked the same way. Only
+the ``MAX_PROGRAMS`` most recently run programs are kept, and a program
+is forgotten when its file is deleted. A
+script's arguments are the list ``args`` in its globals. Requests are run
+one at a time, in the order they arrive.
+
+    python -m velion --serve [--socket PATH] [--latency]
+"""
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from . import modules
+from .client import socket_path
+from .program import Program, capture
+
+# (path, engine) -> ((mtime, size) of the file when it was parsed, Program),
+# least recently run first
+_programs = {}
+
+# Programs kept parsed; the least recently run one is dropped past this
+MAX_PROGRAMS = 256
+
+def program(path, engine):
+    """The ``Program`` for ``path``, parsed again if the file changed."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        for key in [key for key in _programs if key[0] == path]:
+            del _programs[key]
+        raise
+    version = (stat.st_mtime_ns, stat.st_size)
+    known = _programs.pop((path, engine), None)
+    if known is not None and known[0] == version:
+        _programs[path, engine] = known
+        return known[1]
+    loaded = Program.from_file(path, engine)
+    _programs[path, engine] = (version, loaded)
+    if len(_programs) > MAX_PROGRAMS:
+        del _programs[next(iter(_programs))]
+    return loaded
+
+class _Frames:
+    """Sends what a script writes to its client as it is written."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def write(self, text):
+        if text:
+            self.send(output=str(text))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def send(self, **frame):
+        self.connection.sendall(json.dumps(frame).encode() + b'\n')
+
+def handle(connection, engine='tree'):
+    """Run the request on ``connection``: (path, exit status, milliseconds)."""
+    start = time.perf_counter()
+    reader = connection.makefile('rb')
+    request = json.loads(reader.readline())
+    path = request['path']
+    frames = _Frames(connection)
+    status, error = 0, None
+    previous = os.getcwd(), sys.stdin
+    try:
+        os.chdir(request['cwd'])
+        sys.stdin = io.TextIOWrapper(reader, encoding='utf-8')
+        with capture(frames):
+            program(path, request['engine'] or engine).run({'args': request['args']})
+    except SystemExit as exc:
+        if exc.code is not None and not isinstance(exc.code, int):
+            status, error = 1, str(exc.code)
+        else:
+            status = exc.code or 0
+    except Exception as exc:
+        status, error = 1, ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+    finally:
+        os.chdir(previous[0])
+        sys.stdin = previous[1]
+    ms = (time.perf_counter() - start) * 1000
+    frames.send(status=status, error=error, ms=ms)
+    return path, status, ms
+
+def _warm_up():
+    # the engines the first requests would otherwise import
+    from . import bytecode, compiler, vm
+
+def listen(path):
+    """A socket listening at ``path``; a stale socket file is replaced."""
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with probe:
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                raise OSError(f'a daemon is already listening at {path}')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(previous)
+    server.listen()
+    return server
+
+def _stop(signum, frame):
+    # stop like on Ctrl-C, removing the socket
+    raise KeyboardInterrupt
+
+def serve(path=None, engine='tree', latency=False):
+    """Answer requests on the socket ``path`` until interrupted."""
+    path = path or socket_path()
+    _warm_up()
+    # a long-lived process sees files change under it
+    modules.registry.check_mtime = True
+    server = listen(path)
+    signal.signal(signal.SIGTERM, _stop)
+    print(f'velion: serving on {path}', file=sys.stderr)
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    request_path, status, ms = handle(connection, engine)
+                except (OSError, ValueError, KeyError) as exc:
+                    # the client went away, or did not send a request
+                    print(f'velion: dropped a request: {exc}', file=sys.stderr)
+                    continue
+            if latency:
+                print(f'{ms:9.2f} ms  exit {status}  {request_path}', file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
@@ -0,0 +1,188 @@
+"""Concurrent Velion tasks on asyncio (``--async``, tree runtime).
+
+``run(stmts)`` runs a program as an asyncio task. In it:
+
+- ``spawn f(x)`` evaluates the arguments and starts the call ``f(x)`` as a
+  task of its own, which runs once the spawning task waits, then goes on.
+  Spawned built-ins run in place;
+- ``wait(seconds)`` and ``input`` suspend the task that runs them, and other
+  tasks run meanwhile; a sleeping task is a suspended generator and a timer;
+- ``wait_all()`` waits until every task the running task has spawned has
+  finished. A task, and the program, also wait for theirs before they end.
+  An error raised in a spawned task is raised again where it is waited for.
+
+Tasks switch only at those points. Velion functions called from a lambda or
+from a built-in such as ``parallel_map`` run to the end without switching:
+``wait`` blocks there, and ``wait_all`` raises.
+
+Outside this mode, ``spawn`` runs the call to the end before going on, ``wait``
+sleeps and ``wait_all()`` does nothing, so programs run on every engine.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+
+from . import output
+
+# Tasks spawned by the running task; None outside the async mode
+_group = contextvars.ContextVar('velion_tasks', default=None)
+
+class _Group:
+    __slots__ = ('tasks',)
+
+    def __init__(self):
+        self.tasks = []
+
+    async def join(self):
+        error = None
+        while self.tasks:
+            tasks, self.tasks = self.tasks, []
+            for task in tasks:
+                try:
+                    await task
+                except Exception as exc:
+                    if error is None:
+                        error = exc
+        if error is not None:
+            raise error
+
+def running():
+    """True in code running in the async mode."""
+    return _group.get() is not None
+
+def spawn(body):
+    """Start ``body``, an activation for a bound Velion call, as a task."""
+    _group.get().tasks.append(asyncio.get_running_loop().create_task(_task(body)))
+
+async def _task(body):
+    group = _Group()
+    _group.set(group)
+    await drive(body)
+    await group.join()
+
+# Built-ins
+
+def wait(env, seconds):
+    seconds = float(seconds)
+    output.flush()
+    if _group.get() is None:
+        time.sleep(seconds)
+        return None
+    from .runtime import _Suspend
+    return _Suspend(lambda: asyncio.sleep(seconds), lambda: time.sleep(seconds))
+
+def wait_all(env):
+    group = _group.get()
+    if group is None or not group.tasks:
+        return None
+    from .runtime import _Suspend
+    return _Suspend(group.join, _cannot_wait_all)
+
+def _cannot_wait_all():
+    raise RuntimeError('wait_all() cannot wait inside a lambda or built-in')
+
+def read_line(prompt):
+    """``input(prompt)``, or what a task suspends on to read it in a thread."""
+    if _group.get() is None:
+        return output.read_line(prompt)
+    from .runtime import _Suspend
+    output.flush()
+    return _Suspend(lambda: asyncio.get_running_loop().run_in_executor(None, input, prompt),
+                    lambda: input(prompt))
+
+# Running
+
+async def drive(activation):
+    """``runtime._drive`` for tasks: an activation that yields a
+    ``runtime._Suspend`` is resumed when what it waits for is done."""
+    from .runtime import MAX_CALL_DEPTH, _PendingCall, _Suspend, drop_caller
+    callers = []
+    value = error = None
+    while True:
+        try:
+            if error is None:
+                body = activation.send(value)
+            else:
+                error, exc = None, error
+                body = activation.throw(exc)
+        except StopIteration as stop:
+            result = stop.value
+            if type(result) is _PendingCall:
+                if callers:
+                    drop_caller(result.env)
+                activation, value = result.body, None
+                continue
+            if not callers:
+                return result
+            activation = callers.pop()
+            value = result[1] if result is not None else None
+            continue
+        except Exception as exc:
+            if not callers:
+                raise
+            activation, error = callers.pop(), exc
+            continue
+        if type(body) is _Suspend:
+            try:
+                value = await body.start()
+            except Exception as exc:
+                error = exc
+            continue
+        if len(callers) >= MAX_CALL_DEPTH:
+            error = RecursionError('maximum Velion call depth exceeded')
+            continue
+        callers.append(activation)
+        activation, value = body, None
+
+async def run_async(stmts, env=None):
+    """Run ``stmts`` as a task of the running event loop; what ``runtime.run`` returns."""
+    from .runtime import Environment, _block
+    if env is None:
+        env = Environment()
+    group = _Group()
+    token = _group.set(group)
+    _uncache_calls(1)
+    try:
+        result = await drive(_block(stmts, env, set()))
+        await group.join()
+    finally:
+        _uncache_calls(-1)
+        _group.reset(token)
+        output.flush()
+    return result[1] if result is not None else None
+
+def run(stmts, env=None):
+    return asyncio.run(run_async(stmts, env))
+
+# While a task is suspended another one can define a function under a name
+# the suspended one has already called through; call-site caches assume
+# that only code running in an environment changes it. So while any program
+# runs in this mode, calls are resolved without them.
+
+_uncached_runs = 0
+_cached_resolve = None
+_lock = threading.Lock()
+
+def _uncache_calls(delta):
+    global _uncached_runs, _cached_resolve
+    from . import runtime
+    with _lock:
+        _uncached_runs += delta
+        if _uncached_runs and _cached_resolve is None:
+            _cached_resolve = runtime._resolve
+            runtime._resolve = _resolve_uncached
+        elif not _uncached_runs and _cached_resolve is not None:
+            runtime._resolve = _cached_resolve
+            _cached_resolve = None
+
+def _resolve_uncached(call, env):
+    from .runtime import _CallSite, call_plan, find_function
+    try:
+        site = call._site
+    except AttributeError:
+        site = call._site = _CallSite(call)
+    if site.builtin is not None:
+        return site, None, None
+    func = find_function(env, call.callee)
+    return site, func, call_plan(func)
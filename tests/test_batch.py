@@ -0,0 +1,35 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ..batch import run_batch
+
+SCRIPTS = {
+    'ask.vl': 'input "name? "\nsay "hello"\n',
+    'count.vl': 'for each i in [1, 2, 3] do\n    say i\nend\n',
+}
+
+class JobsTest(unittest.TestCase):
+    """A batch gives the same results whatever the number of workers."""
+
+    def test_one_job_runs_like_a_worker(self):
+        with tempfile.TemporaryDirectory() as directory:
+            scripts = []
+            for name, source in sorted(SCRIPTS.items()):
+                path = os.path.join(directory, name)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(source)
+                scripts.append(path)
+            results = {}
+            for jobs in (1, 2):
+                with mock.patch('sys.stdin', io.StringIO('someone\n')):
+                    results[jobs] = [(result.status, result.output, result.error)
+                                     for result in run_batch(scripts, jobs)]
+            self.assertEqual(results[1], results[2])
+            self.assertEqual(results[1][0][0], 1)
+            self.assertEqual(results[1][1], (0, '1\n2\n3\n', None))
+
+if __name__ == '__main__':
+    unittest.main()
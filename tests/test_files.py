@@ -0,0 +1,37 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from .. import files
+
+class LinesTest(unittest.TestCase):
+    """``lines_of`` splits a file into lines a chunk at a time."""
+
+    def lines(self, text, chunk_size):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False,
+                                         encoding='utf-8', newline='') as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        with mock.patch.object(files, 'CHUNK_SIZE', chunk_size):
+            return list(files.lines_of(f.name))
+
+    def test_lines_across_chunks(self):
+        text = 'one\ntwo\r\n\nthree and more\nfour'
+        for size in (1, 2, 3, 5, 8, 100):
+            with self.subTest(chunk_size=size):
+                self.assertEqual(self.lines(text, size), text.replace('\r\n', '\n').split('\n'))
+
+    def test_trailing_newline(self):
+        self.assertEqual(self.lines('a\nb\n', 1), ['a', 'b'])
+
+    def test_long_line_is_linear(self):
+        # a line of 2000 chunks, copied again for every chunk, takes seconds
+        line = 'x' * 20_000_000
+        start = time.perf_counter()
+        self.assertEqual(self.lines(line + '\nend\n', 10_000), [line, 'end'])
+        self.assertLess(time.perf_counter() - start, 2)
+
+if __name__ == '__main__':
+    unittest.main()
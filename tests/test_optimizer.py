@@ -0,0 +1,176 @@
+"""The optimizer must not change what a program does.
+
+Every case runs as parsed and optimized, on every engine, and must print
+the same output, return the same value and raise the same error.
+"""
+import io
+import os
+import tempfile
+import unittest
+
+from ..cache import parse_source
+from ..optimizer import optimize
+from ..program import ENGINES, Program, capture
+
+def outcome(stmts, engine):
+    """(output, returned value, error) of running ``stmts`` on ``engine``."""
+    buffer = io.StringIO()
+    try:
+        with capture(buffer):
+            value = Program(stmts, engine).run().value
+    except Exception as exc:
+        return buffer.getvalue(), None, f'{type(exc).__name__}: {exc}'
+    return buffer.getvalue(), value, None
+
+CASES = {
+    'folded_arithmetic': """
+say 60 * 60 * 24, "a" .. "b" .. 1 + 2, 7 / 2
+return 2 * 21
+""",
+    'division_by_zero': """
+say "before"
+say 1 / 0
+say "after"
+""",
+    'division_by_zero_in_condition': """
+if 1 / 0 == 1 then
+    say "never"
+end
+""",
+    'division_by_zero_caught': """
+for each i in [1, 2] do
+    try
+        say 1 / 0 + i
+    if_it_fails
+        say "caught", i
+    end
+end
+""",
+    'division_by_zero_not_run': """
+when broken()
+    return 1 / 0
+end
+say "defined"
+""",
+    'dead_branch_with_define': """
+if 1 == 2 then
+    when hidden()
+        return "hidden"
+    end
+end
+say "no call"
+say hidden()
+""",
+    'live_branch_with_define': """
+if 2 > 1 then
+    when shown()
+        return "shown"
+    end
+else
+    when shown()
+        return "other"
+    end
+end
+say shown()
+""",
+    'dead_branch_with_import': """
+if 1 == 2 then
+    get "missing_module.vl"
+end
+say "skipped the import"
+""",
+    'live_branch_with_import': """
+if 1 == 1 then
+    get "{module}"
+end
+say from_module
+""",
+    'import_inside_loop': """
+remember 1 as factor
+for each i in [1, 2, 3] do
+    say factor * 10, i
+    get "{module}"
+end
+""",
+    'hoisted_name_shadows_global': """
+remember 3 as width
+when area(width)
+    remember 0 as total
+    for each i in [1, 2, 3] do
+        remember total + width * width as total
+    end
+    return total
+end
+say area(5), width * width
+for each width in [7, 8] do
+    say width * 2
+end
+say width * 2
+""",
+    'loop_assigns_invariant_name': """
+remember 2 as k
+for each i in [1, 2, 3] do
+    say k * 2, i * k
+    remember k * 2 as k
+    for each j in [1, 2] do
+        say k + 1, "{{k}}-{{j}}"
+    end
+end
+""",
+    'call_changes_global_in_loop': """
+remember 1 as scale
+when grow()
+    remember scale + 1 as scale
+end
+for each i in [1, 2, 3] do
+    say scale * 10
+    grow()
+end
+say scale
+""",
+    'early_return_in_constant_if': """
+when early(n)
+    if 1 == 1 then
+        return n
+    end
+    return 0
+end
+return early(4)
+""",
+}
+
+class OptimizerEquivalenceTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.module = os.path.join(directory.name, 'module.vl')
+        with open(self.module, 'w', encoding='utf-8') as f:
+            f.write('remember 5 as from_module\nremember 2 as factor\n')
+
+    def test_same_behaviour_with_and_without_optimizer(self):
+        for name, source in CASES.items():
+            stmts = parse_source(source.format(module=self.module))
+            for engine in ENGINES:
+                with self.subTest(case=name, engine=engine):
+                    self.assertEqual(outcome(optimize(stmts), engine), outcome(stmts, engine))
+
+    def test_engines_agree(self):
+        for name, source in CASES.items():
+            stmts = optimize(parse_source(source.format(module=self.module)))
+            expected = outcome(stmts, 'tree')
+            for engine in ENGINES[1:]:
+                with self.subTest(case=name, engine=engine):
+                    self.assertEqual(outcome(stmts, engine), expected)
+
+    def test_folding_keeps_errors_at_run_time(self):
+        stmts = optimize(parse_source('say 1 / 0\n'))
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(outcome(stmts, engine)[2], 'ZeroDivisionError: division by zero')
+
+    def test_dead_branch_is_removed(self):
+        stmts = optimize(parse_source(CASES['dead_branch_with_import']))
+        self.assertEqual(len(stmts), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+"""When ``say`` output is written and flushed."""
+import unittest
+from unittest import mock
+
+from .. import output, parallel
+from ..ast_nodes import *
+from ..program import ENGINES, Program
+
+class CountingStream:
+    def __init__(self):
+        self.text = []
+        self.flushes = 0
+
+    def write(self, text):
+        self.text.append(text)
+        return len(text)
+
+    def flush(self):
+        self.flushes += 1
+
+def lambda_program(count):
+    # remember <lambda (x) -> say x end> as show; parallel_each(show, [0, ..., count - 1])
+    show = Lambda(['x'], [Print([Var('x')], None)])
+    items = ListLiteral([Literal(i) for i in range(count)])
+    return [Assign('show', show), Call('parallel_each', [Var('show'), items])]
+
+class FullBufferingTest(unittest.TestCase):
+    def setUp(self):
+        previous = output.policy
+        output.set_policy('full')
+        self.addCleanup(output.set_policy, previous)
+        # lambdas run in this process
+        patcher = mock.patch.object(parallel, 'workers', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lambda_calls_do_not_flush(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                stream = CountingStream()
+                with mock.patch('sys.stdout', stream):
+                    Program(lambda_program(100), engine).run()
+                self.assertEqual(''.join(stream.text), ''.join(f'{i}\n' for i in range(100)))
+                # once, when the program ends
+                self.assertEqual(stream.flushes, 1)
+                self.assertEqual(len(stream.text), 1)
+
+if __name__ == '__main__':
+    unittest.main()
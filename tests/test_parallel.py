@@ -0,0 +1,61 @@
+import pickle
+import unittest
+from unittest import mock
+
+from .. import parallel
+from ..program import ENGINES, Program
+
+ITEMS = ', '.join(str(i) for i in range(100))
+
+FAILING = f"""
+when show(x)
+    say x
+    remember 1 / (x - 70) as y
+end
+parallel_each(show, [{ITEMS}], 50)
+"""
+
+CAPTURING = f"""
+remember [{', '.join(['"' + 'x' * 100 + '"'] * 1000)}] as table
+when pick(x)
+    return length(table) + x
+end
+say parallel_map(pick, [{ITEMS}], 1)
+"""
+
+class _RecordingPool:
+    # the real pool, noting the size of what each task sends
+    def __init__(self, pool):
+        self.pool = pool
+        self.sizes = []
+
+    def submit(self, fn, *args):
+        self.sizes.append(len(pickle.dumps(args)))
+        return self.pool.submit(fn, *args)
+
+class ParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(parallel, 'workers', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_output_up_to_an_error(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                output = []
+                with mock.patch.object(parallel.output, 'write', output.append):
+                    with self.assertRaises(ZeroDivisionError):
+                        Program.from_source(FAILING, engine).run(capture_output=True)
+                self.assertEqual(''.join(output), ''.join(f'{i}\n' for i in range(71)))
+
+    def test_payload_is_not_sent_with_every_chunk(self):
+        pool = _RecordingPool(parallel._get_pool())
+        with mock.patch.object(parallel, '_get_pool', lambda: pool):
+            result = Program.from_source(CAPTURING, 'tree').run(capture_output=True)
+        self.assertEqual(result.output, str(list(range(1000, 1100))) + '\n')
+        self.assertEqual(len(pool.sizes), 100)
+        self.assertLess(max(pool.sizes), 1000)
+
+if __name__ == '__main__':
+    unittest.main()
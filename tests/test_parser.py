@@ -0,0 +1,35 @@
+import unittest
+
+from ..ast_nodes import Assign, Call, Spawn, Var
+from ..lexer import lex_stream
+from ..parser import Parser
+from ..program import ENGINES, Program
+
+def parse(source):
+    return Parser(lex_stream(source)).parse()
+
+class SpawnTest(unittest.TestCase):
+    """``spawn`` starts a statement's call, and is an ordinary name elsewhere."""
+
+    def test_spawn_statement(self):
+        [stmt] = parse('spawn work(1, 2)\n')
+        self.assertIs(type(stmt), Spawn)
+        self.assertEqual(stmt.call.callee, 'work')
+
+    def test_spawn_as_a_name(self):
+        assign, call, say = parse('remember 3 as spawn\nspawn(4)\nsay spawn + 1\n')
+        self.assertIs(type(assign), Assign)
+        self.assertEqual(assign.name, 'spawn')
+        self.assertIs(type(call), Call)
+        self.assertEqual(call.callee, 'spawn')
+        self.assertIs(type(say.exprs[0].left), Var)
+
+    def test_spawn_variable_runs(self):
+        source = 'remember 3 as spawn\nremember spawn * 2 as twice\nsay twice\n'
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result = Program.from_source(source, engine).run(capture_output=True)
+                self.assertEqual(result.output, '6\n')
+
+if __name__ == '__main__':
+    unittest.main()
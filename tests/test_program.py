@@ -0,0 +1,40 @@
+import json
+import unittest
+
+from ..program import ENGINES, Program
+
+SOURCE = """
+remember "" as report
+for each i in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+    remember report .. "line of the report number " .. i .. "; " as report
+end
+for each i in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] do
+    remember report .. report as report
+end
+remember [report, {"text": report}] as nested
+return report
+"""
+
+class RopeValuesTest(unittest.TestCase):
+    """Long ``..`` results leave a run as plain strings."""
+
+    def test_return_value_is_str(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                value = Program.from_source(SOURCE, engine).run().value
+                self.assertIs(type(value), str)
+                self.assertGreater(len(value), 1024)
+                self.assertTrue(value.startswith('line of the report number 1; '))
+
+    def test_globals_are_plain(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result = Program.from_source(SOURCE, engine).run()
+                report, nested = result.globals['report'], result.globals['nested']
+                self.assertIs(type(report), str)
+                self.assertIs(type(nested[0]), str)
+                self.assertIs(type(nested[1]['text']), str)
+                self.assertEqual(json.loads(json.dumps(nested)), [report, {'text': report}])
+
+if __name__ == '__main__':
+    unittest.main()
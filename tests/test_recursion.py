@@ -0,0 +1,78 @@
+"""Deep Velion recursion does not use up Python's stack on any engine."""
+import sys
+import unittest
+
+from ..cache import parse_source
+from ..program import ENGINES, Program
+
+# Python frames allowed while the programs run, well under their depth
+RECURSION_LIMIT = 300
+
+SUM_TO = """
+when sum_to(n)
+    if n == 0 then
+        return 0
+    end
+    return n + sum_to(n - 1)
+end
+say sum_to({depth})
+"""
+
+TREE_WALK = """
+when size(node)
+    remember 1 as total
+    for each child in node do
+        remember total + size(child) as total
+    end
+    return total
+end
+remember [] as tree
+for each i in [{zeros}] do
+    remember [tree, []] as tree
+end
+say size(tree)
+"""
+
+ERROR_AT_THE_BOTTOM = """
+when boom(n)
+    if n == 0 then
+        return 1 / 0
+    end
+    return 1 + boom(n - 1)
+end
+try
+    say boom({depth})
+if_it_fails
+    say "caught"
+end
+"""
+
+class RecursionDepthTest(unittest.TestCase):
+    def run_shallow(self, source, engine):
+        program = Program(parse_source(source), engine)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(RECURSION_LIMIT)
+        try:
+            return program.run(capture_output=True).output
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def test_non_tail_calls(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(self.run_shallow(SUM_TO.format(depth=3000), engine), '4501500\n')
+
+    def test_calls_in_a_loop(self):
+        source = TREE_WALK.format(zeros=', '.join(['0'] * 1000))
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(self.run_shallow(source, engine), '2001\n')
+
+    def test_error_reaches_a_handler_far_up(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(self.run_shallow(ERROR_AT_THE_BOTTOM.format(depth=2000), engine),
+                                 'caught\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import server
+
+class ProgramCacheTest(unittest.TestCase):
+    """The daemon keeps a bounded number of parsed programs."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = mock.patch.object(server, '_programs', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def script(self, name):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'say "{name}"\n')
+        return path
+
+    def test_least_recently_run_is_dropped(self):
+        first, second, third = (self.script(f'{n}.vl') for n in 'abc')
+        with mock.patch.object(server, 'MAX_PROGRAMS', 2):
+            kept = server.program(first, 'tree')
+            server.program(second, 'tree')
+            self.assertIs(server.program(first, 'tree'), kept)
+            server.program(third, 'tree')
+        self.assertEqual(list(server._programs), [(first, 'tree'), (third, 'tree')])
+
+    def test_deleted_file_is_forgotten(self):
+        path = self.script('gone.vl')
+        server.program(path, 'tree')
+        server.program(path, 'vm')
+        os.remove(path)
+        with self.assertRaises(FileNotFoundError):
+            server.program(path, 'tree')
+        self.assertEqual(server._programs, {})
+
+if __name__ == '__main__':
+    unittest.main()
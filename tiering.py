@@ -0,0 +1,252 @@
+"""Tiered execution: hot Velion functions run as compiled Python code.
+
+The tree runtime counts calls to every function. Once a function has been
+called ``threshold`` times, ``tier_up`` translates its body to Python
+source and compiles it with ``compile()``, and later calls run that code
+instead of walking the tree. Functions that use anything the translator
+does not handle stay interpreted.
+
+The translated code keeps the function's variables in Python locals. That
+is only safe because a tiered function calls no Velion functions (built-ins
+are fine): with dynamic scoping a callee could read the caller's variables,
+and a Python call per Velion call would also bring back the recursion limit
+the runtime's explicit call stack avoids. What the body reads but does not
+bind is looked up in the calling environment at each use, and a local read
+before it is assigned falls back to the same lookup, as in the interpreter.
+"""
+import os
+import re
+
+from . import output, runtime
+from .ast_nodes import *
+from .resolver import Scope
+
+def _env_threshold():
+    value = os.environ.get('VELION_TIER_THRESHOLD')
+    return int(value) if value else None
+
+# Calls before a function is translated: `--tier-threshold N` or
+# VELION_TIER_THRESHOLD=N. None leaves every function interpreted.
+threshold = _env_threshold()
+
+# (function name, None if tiered up or why it was not), in tiering order
+report = []
+
+# BINARY_OPS entries that mean the same as a Python operator
+_INFIX = {'==': '==', '!=': '!=', '>=': '>=', '<=': '<=', '>': '>', '<': '<',
+          '+': '+', '-': '-', '*': '*', '/': '/'}
+_ASSIGN_INFIX = {'add': '+', 'subtract': '-', 'multiply': '*', 'divide': '/'}
+
+def _python_name(func):
+    return 'tiered_' + func.name
+
+class Untranslatable(Exception):
+    """Raised by the translator for code only the interpreter can run."""
+
+def _named(value, name):
+    if hasattr(value, '__call__'):
+        value.__name__ = name
+    return value
+
+def _not_iterable(value):
+    raise TypeError(f"Object {value} is not iterable")
+
+def _not_dict(value):
+    raise TypeError('ForEachDict expects a dictionary')
+
+class Translator:
+    """Writes the Python source for one FuncDef."""
+
+    def __init__(self, func):
+        self.func = func
+        scope = Scope.for_function(func)
+        if scope.dynamic:
+            raise Untranslatable("runs 'get'")
+        self.locals = {name: f'l{slot}_{re.sub(r"[^A-Za-z0-9_]", "", name)}'
+                       for name, slot in scope.names.items()}
+        self.params = set(func.params)
+        if func.variadic:
+            self.params.add('args')
+        # values the generated code refers to by name
+        self.namespace = {'_runtime': runtime, '_U': runtime.UNSET, '_lookup': runtime.lookup,
+                          '_named': _named, '_not_iterable': _not_iterable,
+                          '_not_dict': _not_dict, '_say': output.say}
+        self.lines = []
+        self.temps = 0
+
+    def source(self):
+        func = self.func
+        self.emit(0, f'def {_python_name(func)}(_env):')
+        self.emit(1, '_caller = _env.outer')
+        for name, local in self.locals.items():
+            if name in self.params:
+                self.emit(1, f'{local} = _env.get({name!r})')
+            else:
+                self.emit(1, f'{local} = _U')
+        self.block(func.body, 1)
+        self.emit(1, 'return None')
+        return '\n'.join(self.lines) + '\n'
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def temp(self, prefix):
+        self.temps += 1
+        return f'_{prefix}{self.temps}'
+
+    def constant(self, value):
+        if value is None or type(value) in (bool, int, str):
+            return repr(value)
+        name = self.temp('k')
+        self.namespace[name] = value
+        return name
+
+    def block(self, stmts, depth):
+        if not stmts:
+            self.emit(depth, 'pass')
+        for stmt in stmts:
+            self.stmt(stmt, depth)
+
+    def stmt(self, stmt, depth):
+        if isinstance(stmt, Return):
+            self.emit(depth, f'return {self.expr(stmt.expr)}')
+        elif isinstance(stmt, Assign):
+            value = self.expr(stmt.expr)
+            if isinstance(stmt.expr, (Var, Call)):
+                # the value may be a lambda, which takes the name it is bound to
+                value = f'_named({value}, {stmt.name!r})'
+            self.emit(depth, f'{self.locals[stmt.name]} = {value}')
+        elif isinstance(stmt, AssignOp):
+            if not isinstance(stmt.left, Var) or stmt.op not in _ASSIGN_INFIX:
+                raise Untranslatable('has an assignment the interpreter rejects')
+            name = stmt.left.name
+            self.emit(depth, f'{self.locals[name]} = {self.read(name)} '
+                             f'{_ASSIGN_INFIX[stmt.op]} {self.expr(stmt.right)}')
+        elif isinstance(stmt, If):
+            self.emit(depth, f'if {self.expr(stmt.cond)}:')
+            self.block(stmt.body, depth + 1)
+            if stmt.else_body:
+                self.emit(depth, 'else:')
+                self.block(stmt.else_body, depth + 1)
+        elif isinstance(stmt, ForEach):
+            iterable = self.temp('it')
+            self.emit(depth, f'{iterable} = {self.expr(stmt.iterable)}')
+            self.emit(depth, f"if not hasattr({iterable}, '__iter__'):")
+            self.emit(depth + 1, f'_not_iterable({iterable})')
+            for name in stmt.hoisted:
+                self.emit(depth, f'{self.locals[name]} = _U')
+            self.emit(depth, f'for {self.locals[stmt.var]} in {iterable}:')
+            self.block(stmt.body, depth + 1)
+        elif isinstance(stmt, ForEachDict):
+            items = self.temp('d')
+            self.emit(depth, f'{items} = {self.expr(stmt.iterable)}')
+            self.emit(depth, f'if not isinstance({items}, dict):')
+            self.emit(depth + 1, f'_not_dict({items})')
+            self.emit(depth, f'for {self.locals[stmt.key]}, {self.locals[stmt.value]} '
+                             f'in {items}.items():')
+            self.block(stmt.body, depth + 1)
+        elif isinstance(stmt, Print):
+            values = self.temp('v')
+            self.emit(depth, f"{values} = [{', '.join(self.expr(e) for e in stmt.exprs)}]")
+            sep = self.expr(stmt.sep) if stmt.sep else "' '"
+            self.emit(depth, f'_say({sep}.join([str(v) for v in {values}]))')
+        elif isinstance(stmt, TryCatch):
+            self.emit(depth, 'try:')
+            self.block(stmt.try_body, depth + 1)
+            error = self.temp('e')
+            self.emit(depth, f'except Exception as {error}:')
+            # the environment passed to hooks holds the arguments only
+            self.emit(depth + 1, '_caught = _runtime._caught')
+            self.emit(depth + 1, 'if _caught is not None:')
+            self.emit(depth + 2, f'_caught({error}, {self.constant(stmt)}, _env)')
+            self.block(stmt.catch_body, depth + 1)
+        elif isinstance(stmt, (Var, Literal, BinOp, Hoisted, ListLiteral, DictLiteral,
+                               StringInterpolation)):
+            self.emit(depth, self.expr(stmt))
+        else:
+            raise Untranslatable(f'uses {type(stmt).__name__} statements')
+
+    def read(self, name):
+        local = self.locals.get(name)
+        if local is None:
+            return f'_lookup(_caller, {name!r})'
+        if name in self.params:
+            return local
+        return f'({local} if {local} is not _U else _lookup(_caller, {name!r}))'
+
+    def expr(self, expr):
+        if isinstance(expr, Var):
+            return self.read(expr.name)
+        if isinstance(expr, Literal):
+            return self.constant(expr.value)
+        if isinstance(expr, BinOp):
+            left, right = self.expr(expr.left), self.expr(expr.right)
+            if expr.op in _INFIX:
+                return f'({left} {_INFIX[expr.op]} {right})'
+            op = runtime.BINARY_OPS.get(expr.op)
+            if op is None:
+                raise Untranslatable(f'uses the unknown operator {expr.op}')
+            return f'{self.constant(op)}({left}, {right})'
+        if isinstance(expr, Hoisted):
+            local = self.locals[expr.name]
+            return f'({local} if {local} is not _U else ({local} := {self.expr(expr.expr)}))'
+        if isinstance(expr, Call):
+            builtin = runtime.BUILTINS.get(expr.callee)
+            if builtin is None:
+                raise Untranslatable('calls Velion functions')
+            arity, func = builtin
+            if arity is not None and len(expr.args) < arity:
+                raise Untranslatable(f'calls {expr.callee} with too few arguments')
+            args = expr.args if arity is None else expr.args[:arity]
+            return f"{self.constant(func)}({', '.join(self.expr(arg) for arg in args)})"
+        if isinstance(expr, ListLiteral):
+            return f"[{', '.join(self.expr(e) for e in expr.elements)}]"
+        if isinstance(expr, DictLiteral):
+            return '{' + ', '.join(f'{self.expr(k)}: {self.expr(v)}' for k, v in expr.pairs) + '}'
+        if isinstance(expr, StringInterpolation):
+            # like runtime.interpolate(): only names bound in the activation
+            # itself are filled in
+            pieces = []
+            for i, part in enumerate(expr.parts):
+                if i % 2 == 0:
+                    pieces.append(repr(part))
+                elif part in self.locals:
+                    local = self.locals[part]
+                    pieces.append(f"('{{{part}}}' if {local} is _U else str({local}))")
+                else:
+                    pieces.append(repr('{' + part + '}'))
+            return f"''.join(({', '.join(pieces)},))"
+        raise Untranslatable(f'uses {type(expr).__name__} expressions')
+
+def translate(func):
+    """Python source for ``func`` and the namespace it runs in.
+
+    Raises Untranslatable if only the interpreter can run the function.
+    """
+    translator = Translator(func)
+    return translator.source(), translator.namespace
+
+def tier_up(func):
+    """Compiled replacement for ``func``'s body, or None to keep interpreting it.
+
+    The replacement takes the environment with the call's arguments bound and
+    returns what the call returns. The outcome is added to ``report``.
+    """
+    try:
+        source, namespace = translate(func)
+    except Untranslatable as exc:
+        report.append((func.name, str(exc)))
+        return None
+    exec(compile(source, f'<tiered {func.name}>', 'exec'), namespace)
+    report.append((func.name, None))
+    return namespace[_python_name(func)]
+
+def format_report():
+    if threshold is None:
+        return 'tiering is off (see --tier-threshold)'
+    lines = [f'tiering threshold: {threshold} calls']
+    for name, reason in report:
+        lines.append(f'  {name:<24} ' + ('tiered up' if reason is None else f'interpreted: {reason}'))
+    if not report:
+        lines.append('  no function reached the threshold')
+    return '\n'.join(lines)
@@ -0,0 +1,304 @@
+"""Stack virtual machine for code produced by ``bytecode``.
+
+Velion calls do not call back into Python: ``execute`` keeps the frames of
+suspended callers on a stack of its own and switches between them, so the
+depth of Velion recursion does not depend on Python's recursion limit.
+"""
+from . import output
+from .bytecode import *
+from .bytecode import compile_expression, compile_funcdef, compile_program
+from .modules import import_module
+from .output import say
+from .runtime import (MAX_CALL_DEPTH, UNSET, Environment, Frame, call_skip, drop_caller,
+                      find_function, interpolate)
+
+_DONE = object()
+_NO_RETURN = object()
+
+class VM:
+    def __init__(self):
+        # id(FuncDef) -> (FuncDef, body Code, {param: default Code})
+        self.functions = {}
+        # module path -> (statements, compiled code)
+        self.modules = {}
+
+    def function(self, node):
+        entry = self.functions.get(id(node))
+        if entry is None or entry[0] is not node:
+            body = compile_funcdef(node)
+            entry = (node, body, {})
+            self.functions[id(node)] = entry
+        return entry
+
+    def function_codes(self):
+        return {node: body for node, body, _ in self.functions.values()}
+
+    def run(self, code, env=None):
+        if env is None:
+            env = Environment()
+        try:
+            return self.execute(code, env)
+        finally:
+            output.flush()
+
+    def enter(self, func, args, env):
+        """Body of ``func`` and a new frame with ``args`` bound, called from ``env``."""
+        node, body, defaults = self.function(func)
+        slots = [UNSET] * body.size
+        params = func.params
+        nargs = len(args)
+        for i, slot in enumerate(body.param_slots):
+            if i < nargs:
+                slots[slot] = args[i]
+            elif params[i] in func.defaults:
+                pname = params[i]
+                default = defaults.get(pname)
+                if default is None:
+                    default = defaults[pname] = compile_expression(f'<default {pname}>', func.defaults[pname])
+                slots[slot] = self.execute(default, env)
+            else:
+                raise TypeError(f"Function {func.name} missing required argument: {params[i]}")
+        if body.args_slot is not None:
+            slots[body.args_slot] = list(args[len(params):])
+        frame = Frame(body.names, slots, env)
+        frame.skip = call_skip(None if body.scope.dynamic else body.names, env)
+        return body, frame
+
+    def make_lambda(self, code, env):
+        def _lambda(*args):
+            slots = [UNSET] * code.size
+            for slot, arg in zip(code.param_slots, args):
+                slots[slot] = arg
+            return self.execute(code, Frame(code.names, slots, env))
+        return _lambda
+
+    def run_module(self, module, env):
+        # Compiled once per parsed module; a reload produces new statements.
+        entry = self.modules.get(module.path)
+        if entry is None or entry[0] is not module.stmts:
+            entry = self.modules[module.path] = (module.stmts, compile_program(module.stmts))
+        self.execute(entry[1], env)
+
+    def execute(self, code, env):
+        instructions = code.instructions
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        handlers = []
+        pc = 0
+        # (instructions, pc, stack, handlers, env) of each suspended caller
+        frames = []
+        while True:
+            try:
+                while True:
+                    op, arg = instructions[pc]
+                    pc += 1
+                    if op == LOAD_FAST:
+                        value = env.slots[arg[0]]
+                        if value is UNSET:
+                            value = env[arg[1]]
+                        push(value)
+                    elif op == LOAD_NAME:
+                        push(env[arg])
+                    elif op == STORE_FAST:
+                        env.slots[arg] = pop()
+                    elif op == LOAD_CONST:
+                        push(arg)
+                    elif op == STORE_NAME:
+                        env[arg] = pop()
+                    elif op == BINARY:
+                        right = pop()
+                        stack[-1] = arg[0](stack[-1], right)
+                    elif op == BINARY_CONST:
+                        stack[-1] = arg[0](stack[-1], arg[2])
+                    elif op == LOAD_HOISTED_FAST:
+                        value = env.slots[arg[0]]
+                        if value is not UNSET:
+                            push(value)
+                            pc = arg[1]
+                    elif op == LOAD_HOISTED:
+                        value = env.get(arg[0], UNSET)
+                        if value is not UNSET:
+                            push(value)
+                            pc = arg[1]
+                    elif op == POP_JUMP_IF_FALSE:
+                        if not pop():
+                            pc = arg
+                    elif op == JUMP:
+                        pc = arg
+                    elif op == FOR_ITER_FAST:
+                        item = next(stack[-1], _DONE)
+                        if item is _DONE:
+                            pop()
+                            pc = arg[0]
+                        else:
+                            env.slots[arg[1]] = item
+                    elif op == FOR_ITER_STORE:
+                        item = next(stack[-1], _DONE)
+                        if item is _DONE:
+                            pop()
+                            pc = arg[0]
+                        else:
+                            env[arg[1]] = item
+                    elif op == FOR_ITER:
+                        item = next(stack[-1], _DONE)
+                        if item is _DONE:
+                            pop()
+                            pc = arg
+                        else:
+                            push(item)
+                    elif op == ASSIGN_FAST:
+                        val = pop()
+                        if hasattr(val, '__call__'):
+                            val.__name__ = arg[1]
+                        env.slots[arg[0]] = val
+                    elif op == LOAD_DEREF:
+                        depth, slot, name = arg
+                        frame = env
+                        for _ in range(depth):
+                            frame = frame.outer
+                        value = frame.slots[slot]
+                        if value is UNSET:
+                            value = env[name]
+                        push(value)
+                    elif op == ASSIGN_NAME:
+                        val = pop()
+                        if hasattr(val, '__call__'):
+                            val.__name__ = arg
+                        env[arg] = val
+                    elif op == LOAD_FUNC:
+                        callee, nargs, slow = arg
+                        func = find_function(env, callee)
+                        push(func)
+                        if nargs > len(func.params) and not func.variadic:
+                            pc = slow
+                    elif op == CALL_FUNCTION:
+                        if arg:
+                            args = stack[-arg:]
+                            del stack[-arg:]
+                        else:
+                            args = ()
+                        body, frame = self.enter(pop(), args, env)
+                        if len(frames) >= MAX_CALL_DEPTH:
+                            raise RecursionError('maximum Velion call depth exceeded')
+                        frames.append((instructions, pc, stack, handlers, env))
+                        instructions, pc, env = body.instructions, 0, frame
+                        stack, handlers = [], []
+                        push, pop = stack.append, stack.pop
+                    elif op == TAIL_CALL_FUNCTION:
+                        if arg:
+                            args = stack[-arg:]
+                            del stack[-arg:]
+                        else:
+                            args = ()
+                        body, frame = self.enter(pop(), args, env)
+                        if frames:
+                            # this frame ends here; the base frame's
+                            # environment belongs to whoever called execute()
+                            drop_caller(frame)
+                        instructions, pc, env = body.instructions, 0, frame
+                        stack, handlers = [], []
+                        push, pop = stack.append, stack.pop
+                    elif op == CALL_BUILTIN:
+                        func, nargs = arg
+                        if nargs:
+                            args = stack[-nargs:]
+                            del stack[-nargs:]
+                            push(func(*args))
+                        else:
+                            push(func())
+                    elif op == CALL_BUILTIN_ENV:
+                        func, nargs = arg
+                        args = stack[-nargs:] if nargs else []
+                        del stack[len(stack) - nargs:]
+                        push(func(env, *args))
+                    elif op == POP_TOP:
+                        pop()
+                    elif op == PRINT:
+                        count, has_sep = arg
+                        sep = pop() if has_sep else ' '
+                        vals = stack[-count:]
+                        del stack[-count:]
+                        say(sep.join(str(v) for v in vals))
+                    elif op == RETURN_VALUE:
+                        value = pop()
+                        if not frames:
+                            return value
+                        instructions, pc, stack, handlers, env = frames.pop()
+                        push, pop = stack.append, stack.pop
+                        push(value)
+                    elif op == BUILD_LIST:
+                        if arg:
+                            items = stack[-arg:]
+                            del stack[-arg:]
+                        else:
+                            items = []
+                        push(items)
+                    elif op == BUILD_DICT:
+                        items = stack[len(stack) - 2 * arg:]
+                        del stack[len(stack) - 2 * arg:]
+                        push({items[i]: items[i + 1] for i in range(0, len(items), 2)})
+                    elif op == INTERPOLATE:
+                        push(interpolate(arg, env))
+                    elif op == GET_ITER:
+                        iterable = pop()
+                        if not hasattr(iterable, '__iter__'):
+                            raise TypeError(f"Object {iterable} is not iterable")
+                        push(iter(iterable))
+                    elif op == GET_ITEMS:
+                        d = pop()
+                        if not isinstance(d, dict):
+                            raise TypeError('ForEachDict expects a dictionary')
+                        push(iter(d.items()))
+                    elif op == STORE_PAIR:
+                        k, v = pop()
+                        env[arg[0]] = k
+                        env[arg[1]] = v
+                    elif op == ARG_GUARD:
+                        index, nargs, target = arg
+                        func = stack[-1 - index]
+                        if index >= len(func.params):
+                            stack.extend([None] * (nargs - index))
+                            pc = target
+                    elif op == DEFINE_FUNC:
+                        self.function(arg)
+                        env[arg.name] = arg
+                    elif op == MAKE_LAMBDA:
+                        push(self.make_lambda(arg, env))
+                    elif op == INPUT:
+                        env['_last_input'] = output.read_line(str(pop()))
+                    elif op == IMPORT:
+                        import_module(pop(), env, self.run_module)
+                    elif op == SETUP_TRY:
+                        handlers.append((arg, len(stack)))
+                    elif op == POP_TRY:
+                        handlers.pop()
+                    elif op == STORE_HOISTED_FAST:
+                        env.slots[arg] = stack[-1]
+                    elif op == STORE_HOISTED:
+                        env[arg] = stack[-1]
+                    elif op == RAISE:
+                        raise arg[0](arg[1])
+                    else:
+                        raise RuntimeError(f'Unknown opcode {op}')
+            except Exception:
+                while not handlers:
+                    if not frames:
+                        raise
+                    instructions, pc, stack, handlers, env = frames.pop()
+                push, pop = stack.append, stack.pop
+                pc, depth = handlers.pop()
+                del stack[depth:]
+
+def run_program(stmts, env=None):
+    return VM().run(compile_program(stmts), env)
+
+def run_stream(stmts, env=None):
+    """Compile and run statements one at a time as the iterable yields them."""
+    vm = VM()
+    if env is None:
+        env = Environment()
+    for stmt in stmts:
+        result = vm.run(compile_program([stmt], _NO_RETURN), env)
+        if result is not _NO_RETURN:
+            return result